@@ -0,0 +1,35 @@
+from python_analysis_toolkit.conversion import datetimes
+from python_analysis_toolkit._benchmarks import generators
+from python_analysis_toolkit._benchmarks.suite import timeit
+
+
+def benchmark_datetimes(n = 10**6):
+    """times the scalar conversion functions (called in a python loop) against their array versions on n random timestamps"""
+    str_arr = generators.ymdhms_strings(n)
+    strs = str_arr.tolist()
+    epochs = generators.epochs(n)
+    dt64 = epochs.astype('datetime64[s]')
+    pydts = dt64.tolist()
+    results = {}
+    results["ymdhms_to_datetime"] = (timeit(lambda: [datetimes.ymdhms_to_datetime(s) for s in strs]),
+                                     timeit(datetimes.ymdhms_array_to_datetime64, str_arr))
+    results["ymdhms_to_datetime(truncate_time)"] = (timeit(lambda: [datetimes.ymdhms_to_datetime(s, True) for s in strs]),
+                                                    timeit(datetimes.ymdhms_array_to_datetime64, str_arr, True))
+    results["epoch_to_datetime"] = (timeit(lambda: [datetimes.epoch_to_datetime(e) for e in epochs.tolist()]),
+                                    timeit(datetimes.epoch_array_to_datetime64, epochs))
+    results["is_weekday"] = (timeit(lambda: [datetimes.is_weekday(d) for d in pydts]),
+                             timeit(datetimes.is_weekday_array, dt64))
+
+    #keep clear of the DST transitions (all at 1-3am in US/Eastern), the scalar function raises on those
+    hours = (epochs // 3600) % 24
+    safe = (hours > 3)
+    results["datetime_timezone_dst_to_utc_datetime"] = (timeit(lambda: [datetimes.datetime_timezone_dst_to_utc_datetime(d) for d in dt64[safe].tolist()]),
+                                                        timeit(datetimes.local_array_to_utc_epoch_ns, dt64[safe]))
+    return results
+
+
+if __name__ == "__main__":
+    n = 10**6
+    print("{0:<40}{1:>12}{2:>12}{3:>10}  (n = {4})".format("function", "scalar (s)", "array (s)", "speedup", n))
+    for name, (scalar, vectorized) in sorted(benchmark_datetimes(n).items()):
+        print("{0:<40}{1:>12.3f}{2:>12.3f}{3:>9.1f}x".format(name, scalar, vectorized, scalar/max(vectorized, 1e-9)))
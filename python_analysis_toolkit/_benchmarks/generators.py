@@ -0,0 +1,102 @@
+import os
+import numpy
+
+from python_analysis_toolkit.timeseries.containers import KeyedSeries
+
+"""
+Synthetic inputs for the benchmark suite, deterministic for a given seed. Everything is generated with whole-array operations
+(sorted times are a cumulative sum of random gaps, not a sort), so 10^8 events take seconds and about 2 GB, not minutes.
+"""
+
+_start_ns = numpy.datetime64('2015-01-01', 'ns').astype('int64')
+_day_ns = 86400*10**9
+
+"""
+Internal Helper Functions
+"""
+
+def _key_names(n_keys):
+    return ["key {0}".format(i) for i in range(n_keys)]
+
+def _sorted_times(rng, n, days):
+    """n epoch ns spread over days, ascending"""
+    mean_gap = max(days*_day_ns//max(n, 1), 1)
+    return _start_ns + numpy.cumsum(rng.randint(0, 2*mean_gap, size=n).astype('int64'))
+
+
+"""
+Public Functions
+"""
+
+def window_dates(n_windows = 12, days = 365):
+    """start_dates, end_dates (lists of DateTimes) splitting the generated time range into n_windows windows"""
+    edges = numpy.datetime64('2015-01-01', 's') + (numpy.arange(n_windows + 1)*(days*86400//n_windows)).astype('timedelta64[s]')
+    return edges[:-1].tolist(), edges[1:].tolist()
+
+def event_arrays(n_events, n_keys, days = 365, seed = 0):
+    """(key ids, epoch ns) of n_events events spread uniformly over n_keys keys and days, sorted by key and by time within each key"""
+    rng = numpy.random.RandomState(seed)
+    times = _sorted_times(rng, n_events, days)
+    key_ids = rng.randint(0, n_keys, size=n_events)
+    order = numpy.argsort(key_ids, kind='mergesort') #stable, so every key's times stay sorted
+    return key_ids[order], times[order]
+
+def state_values(n, n_states = 4, seed = 0):
+    """float states 0 .. n_states - 1"""
+    return numpy.random.RandomState(seed + 1).randint(0, n_states, size=n).astype('float64')
+
+def keyed_series(n_events, n_keys, states = False, days = 365, seed = 0):
+    """a containers.KeyedSeries of events (or, with states, of state points)"""
+    key_ids, times = event_arrays(n_events, n_keys, days, seed)
+    offsets = numpy.searchsorted(key_ids, numpy.arange(n_keys + 1))
+    return KeyedSeries(_key_names(n_keys), offsets, times, state_values(n_events, seed = seed) if states else None)
+
+def long_table(n_events, n_keys, states = False, days = 365, seed = 0):
+    """a long format table (dictionary of columns key, timestamp[, value]) for timeseries.longformat.LongFormat"""
+    key_ids, times = event_arrays(n_events, n_keys, days, seed)
+    shuffle = numpy.random.RandomState(seed + 2).permutation(n_events) #long tables come in any order
+    table = {"key" : key_ids[shuffle], "timestamp" : times[shuffle].view('datetime64[ns]')}
+    if states:
+        table["value"] = state_values(n_events, seed = seed)[shuffle]
+    return table
+
+def event_dict(n_events, n_keys, days = 365, seed = 0):
+    """the original plot_event_frequency input, {key : list of DateTimes}. python objects: keep n_events to a few million"""
+    series = keyed_series(n_events, n_keys, days = days, seed = seed)
+    return dict((k, series.times[series.offsets[i]:series.offsets[i+1]].view('datetime64[ns]').astype('datetime64[us]').tolist())
+                for i, k in enumerate(series.keys()))
+
+def state_dict(n_events, n_keys, days = 365, seed = 0):
+    """the original state_diagram input, {key : {"ts" : list of (DateTime, float)}}"""
+    series = keyed_series(n_events, n_keys, states = True, days = days, seed = seed)
+    state_dict = {}
+    for i, k in enumerate(series.keys()):
+        segment = slice(series.offsets[i], series.offsets[i+1])
+        state_dict[k] = {"ts" : list(zip(series.times[segment].view('datetime64[ns]').astype('datetime64[us]').tolist(), series.values[segment].tolist()))}
+    return state_dict
+
+def epochs(n, seed = 0):
+    """n epoch seconds between 2000 and 2030"""
+    return numpy.random.RandomState(seed).randint(946684800, 1893456000, size=n)
+
+def ymdhms_strings(n, seed = 0):
+    """n "YYYY-MM-DD HH:MM:SS" strings, as a numpy string array"""
+    return numpy.char.replace(epochs(n, seed).astype('datetime64[s]').astype('U19'), "T", " ")
+
+def zipf_items(n, n_distinct = 10**4, seed = 0):
+    """n items (ints) with a heavy tailed frequency, like the keys of a log"""
+    return numpy.random.RandomState(seed).zipf(1.3, size=n) % n_distinct
+
+def clustered_matrix(rows, cols = 10, k = 5, nan_fraction = 0.001, seed = 0):
+    """rows x cols float64 matrix of k gaussian blobs, with a sprinkling of nans (the pipelines nan_to_num them)"""
+    rng = numpy.random.RandomState(seed)
+    centers = rng.uniform(-10, 10, size=(k, cols))
+    matrix = centers[rng.randint(0, k, size=rows)] + rng.normal(size=(rows, cols))
+    matrix[rng.uniform(size=matrix.shape) < nan_fraction] = numpy.nan
+    return matrix
+
+def memmap_matrix(rows, directory, cols = 10, k = 5, nan_fraction = 0.001, seed = 0):
+    """clustered_matrix written to directory/matrix.f8 and mapped read only, like the matrices of the large_data mode. the caller removes the file"""
+    path = os.path.join(directory, "matrix.f8")
+    clustered_matrix(rows, cols, k, nan_fraction, seed).tofile(path)
+    return numpy.memmap(path, dtype='float64', mode='r', shape=(rows, cols))
@@ -0,0 +1,47 @@
+import numpy
+from math import sqrt
+
+from python_analysis_toolkit.stats import basic_functions
+from python_analysis_toolkit.stats.basic_functions import RunningStats
+from python_analysis_toolkit._benchmarks.suite import timeit
+
+
+def _numpy_mean_ci95(l):
+    """the previous implementation: two passes over the whole list"""
+    return numpy.mean(l), 1.96*numpy.std(l)/sqrt(len(l))
+
+def _chunked(data, chunk_size):
+    s = RunningStats()
+    for start in range(0, len(data), chunk_size):
+        s.add(data[start:start + chunk_size])
+    return s.mean, s.ci95()
+
+def _sharded(data, n_shards):
+    shards = [RunningStats().add(part) for part in numpy.array_split(data, n_shards)]
+    total = RunningStats()
+    for s in shards:
+        total.merge(s)
+    return total.mean, total.ci95()
+
+def _one_at_a_time(values):
+    s = RunningStats()
+    for x in values:
+        s.add(x)
+    return s.mean, s.ci95()
+
+def benchmark_running_stats(n = 10**7):
+    """values per second of mean + ci95: numpy on the whole array against RunningStats fed whole, in chunks, in shards and one value at a time"""
+    data = numpy.random.RandomState(0).normal(size=n)
+    as_list = data[:10**6].tolist()
+    seconds = {"numpy mean + std (whole array)": (n, timeit(_numpy_mean_ci95, data)),
+               "numpy mean + std (python list)": (len(as_list), timeit(_numpy_mean_ci95, as_list)),
+               "basic_functions mean + ci95 (whole array)": (n, timeit(lambda: (basic_functions.mean(data), basic_functions.ci95(data)))),
+               "RunningStats, chunks of 10^5": (n, timeit(_chunked, data, 10**5)),
+               "RunningStats, 64 merged shards": (n, timeit(_sharded, data, 64)),
+               "RunningStats, one value at a time": (len(as_list), timeit(_one_at_a_time, as_list))}
+    return dict((name, count/max(t, 1e-9)) for name, (count, t) in seconds.items())
+
+
+if __name__ == "__main__":
+    for name, rate in sorted(benchmark_running_stats().items()):
+        print("{0:<45}{1:>16,.0f} values/s".format(name, rate))
@@ -0,0 +1,464 @@
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+
+import numpy
+
+from python_analysis_toolkit._benchmarks import generators
+
+"""
+Benchmark suite: scaling curves of the conversion, stats, aggregation, rendering and clustering code on synthetic data,
+written as a json baseline that later runs are compared against.
+
+    python -m python_analysis_toolkit._benchmarks.suite run --tier small --out baseline.json
+    ... change code ...
+    python -m python_analysis_toolkit._benchmarks.suite compare baseline.json --threshold 0.25
+
+compare reruns the cases of the baseline (or compares two result files) and exits with status 1 if any case got slower than
+baseline * (1 + threshold), fails, or is no longer run.
+Baselines are only comparable on the same machine and library versions; the metadata records both.
+
+Tiers are cumulative: medium runs the small sizes too, so every case gives a curve from its smallest size up.
+    small:  10^3 - 10^5 events, up to 100 keys, 10^4 row matrices. a minute or two
+    medium: up to 10^7 events, 10^4 keys, 10^5 - 10^6 row matrices. several minutes, a few GB
+    large:  10^8 events, 10^4 keys, millions of rows. tens of minutes, ~10 GB
+"""
+
+_tiers = ["small", "medium", "large"]
+_cases = []
+_scratch_dir = None #temporary directory of the case being run, see _scratch_path
+
+"""
+Internal Helper Functions
+"""
+
+def _case(name, unit, sizes):
+    """
+        registers a benchmark. the decorated function takes one size and returns a function of no arguments that does the measured work;
+        everything before that return (generating data, warm up) is not timed.
+        sizes: {tier : list of sizes}. a size is an int (the number of units) or a tuple whose first element is the number of units
+    """
+    def register(setup):
+        _cases.append({"name" : name, "unit" : unit, "sizes" : sizes, "setup" : setup})
+        return setup
+    return register
+
+def _units(size):
+    return size[0] if isinstance(size, tuple) else size
+
+def _size_label(size):
+    return "x".join(str(s) for s in size) if isinstance(size, tuple) else str(size)
+
+def _measure(work, min_seconds = 0.2, max_runs = 5):
+    """best of a few runs: repeated while the runs are short, once for anything slower than min_seconds"""
+    best, runs, total = None, 0, 0.0
+    while runs < max_runs and (runs == 0 or total < min_seconds):
+        t = time.time()
+        work()
+        elapsed = time.time() - t
+        best = elapsed if best is None else min(best, elapsed)
+        runs += 1
+        total += elapsed
+    return best, runs
+
+def _scratch_path(name):
+    """a path for the files of the running case (memmaps, pdfs, caches). the directory is removed when the case is done"""
+    return os.path.join(_scratch_dir, name)
+
+def _run_case(setup, size):
+    """sets up and times one size of a case in a temporary directory of its own, removed afterwards even if the case raises"""
+    global _scratch_dir
+    _scratch_dir = tempfile.mkdtemp(prefix = "benchmark_")
+    try:
+        return _measure(setup(size))
+    finally:
+        shutil.rmtree(_scratch_dir, ignore_errors = True)
+        _scratch_dir = None
+
+def _metadata(tier):
+    versions = {"python" : platform.python_version(), "numpy" : numpy.__version__}
+    for module in ["pandas", "matplotlib", "sklearn"]:
+        try:
+            versions[module] = __import__(module).__version__
+        except ImportError:
+            versions[module] = None
+    return {"tier" : tier, "machine" : platform.node(), "platform" : platform.platform(), "processor" : platform.processor(),
+            "versions" : versions, "time" : time.strftime("%Y-%m-%d %H:%M:%S")}
+
+def _import_outside_timing(*modules):
+    """heavy libraries are imported on first use; a setup imports them so the first size of a case does not time the import"""
+    for module in modules:
+        __import__(module)
+
+def _result_key(result):
+    return "{0} @ {1}".format(result["case"], result["size"])
+
+def _scaling_exponents(results):
+    """per case, the slope of log(seconds) against log(size) between its smallest and largest size: 1 is linear"""
+    curves = {}
+    for r in results:
+        if r.get("seconds"):
+            curves.setdefault(r["case"], []).append((r["units"], r["seconds"]))
+    exponents = {}
+    for case, points in curves.items():
+        (n0, t0), (n1, t1) = min(points), max(points)
+        if n1 > n0 and t0 > 0:
+            exponents[case] = math.log(t1/t0)/math.log(float(n1)/n0)
+    return exponents
+
+
+class _Precomputed(object):
+    """an already aggregated input for the graphing functions, so a rendering case times the drawing alone"""
+    def __init__(self, counts = None, transitions = None, events = None):
+        self.counts, self.transitions, self.events = counts, transitions, events
+
+    def keys(self):
+        return list((self.counts or self.transitions).keys())
+
+    def event_frequency_counts(self, minor_granularity, start_dates, end_dates):
+        return self.counts
+
+    def state_transitions(self, minor_granularity, start_dates, end_dates):
+        return self.transitions
+
+    def annotation_events(self, start_dates, end_dates):
+        return self.events
+
+
+"""
+Cases
+"""
+
+#conversion.datetimes
+
+@_case("datetimes.ymdhms_to_datetime (scalar loop)", "strings", {"small" : [10**3, 10**4, 10**5], "medium" : [10**6]})
+def _ymdhms_scalar(n):
+    from python_analysis_toolkit.conversion import datetimes
+    strs = generators.ymdhms_strings(n).tolist()
+    return lambda: [datetimes.ymdhms_to_datetime(s) for s in strs]
+
+@_case("datetimes.ymdhms_array_to_datetime64", "strings", {"small" : [10**3, 10**4, 10**5], "medium" : [10**6, 10**7], "large" : [10**8]})
+def _ymdhms_array(n):
+    from python_analysis_toolkit.conversion import datetimes
+    strs = generators.ymdhms_strings(n)
+    return lambda: datetimes.ymdhms_array_to_datetime64(strs)
+
+@_case("datetimes.epoch_array_to_datetime64", "epochs", {"small" : [10**3, 10**5], "medium" : [10**7], "large" : [10**8]})
+def _epoch_array(n):
+    from python_analysis_toolkit.conversion import datetimes
+    epochs = generators.epochs(n)
+    return lambda: datetimes.epoch_array_to_datetime64(epochs)
+
+@_case("datetimes.is_weekday_array", "datetimes", {"small" : [10**3, 10**5], "medium" : [10**7], "large" : [10**8]})
+def _weekday_array(n):
+    from python_analysis_toolkit.conversion import datetimes
+    dts = generators.epochs(n).astype('datetime64[s]')
+    return lambda: datetimes.is_weekday_array(dts)
+
+@_case("datetimes.local_array_to_utc_epoch_ns", "datetimes", {"small" : [10**3, 10**5], "medium" : [10**7], "large" : [10**8]})
+def _local_to_utc(n):
+    from python_analysis_toolkit.conversion import datetimes
+    dts = generators.epochs(n).astype('datetime64[s]')
+    datetimes.local_array_to_utc_epoch_ns(dts[:10], ambiguous = "earlier", nonexistent = "later") #builds the cached transition table
+    return lambda: datetimes.local_array_to_utc_epoch_ns(dts, ambiguous = "earlier", nonexistent = "later")
+
+#stats.basic_functions
+
+@_case("basic_functions.mean + ci95", "values", {"small" : [10**3, 10**5], "medium" : [10**7], "large" : [10**8]})
+def _mean_ci95(n):
+    from python_analysis_toolkit.stats import basic_functions
+    values = numpy.random.RandomState(0).normal(size=n)
+    return lambda: (basic_functions.mean(values), basic_functions.ci95(values))
+
+@_case("basic_functions.RunningStats (chunks of 10^5)", "values", {"small" : [10**5], "medium" : [10**7], "large" : [10**8]})
+def _running_stats(n):
+    from python_analysis_toolkit.stats.basic_functions import RunningStats
+    values = numpy.random.RandomState(0).normal(size=n)
+    def work():
+        s = RunningStats()
+        for start in range(0, n, 10**5):
+            s.add(values[start:start + 10**5])
+        return s.ci95()
+    return work
+
+@_case("basic_functions.list_to_frequency_tuples", "items", {"small" : [10**3, 10**5], "medium" : [10**6, 10**7]})
+def _frequency_tuples(n):
+    from python_analysis_toolkit.stats import basic_functions
+    items = generators.zipf_items(n).tolist()
+    return lambda: basic_functions.list_to_frequency_tuples(items, top_k = 100)
+
+@_case("basic_functions.FrequentItems", "items", {"small" : [10**5], "medium" : [10**7], "large" : [10**8]})
+def _frequent_items(n):
+    from python_analysis_toolkit.stats.basic_functions import FrequentItems
+    items = generators.zipf_items(n)
+    return lambda: FrequentItems(capacity = 1000).add(items).frequency_tuples(100)
+
+#timeseries aggregation, without any drawing. sizes are (events, keys)
+
+_aggregation_sizes = {"small" : [(10**3, 1), (10**4, 10), (10**5, 100)],
+                      "medium" : [(10**6, 1), (10**6, 10**4), (10**7, 10**3)],
+                      "large" : [(10**8, 10**4)]}
+
+@_case("aggregation.event_frequency_counts (dict of DateTimes)", "events", {"small" : [(10**3, 1), (10**4, 10), (10**5, 100)], "medium" : [(10**6, 100)]})
+def _event_counts_dict(size):
+    from python_analysis_toolkit.timeseries import aggregation
+    ts_dict = generators.event_dict(*size)
+    start_dates, end_dates = generators.window_dates()
+    return lambda: aggregation.event_frequency_counts(ts_dict, "hours", start_dates, end_dates)
+
+@_case("aggregation.event_frequency_counts (KeyedSeries)", "events", _aggregation_sizes)
+def _event_counts_series(size):
+    from python_analysis_toolkit.timeseries import aggregation
+    series = generators.keyed_series(*size)
+    start_dates, end_dates = generators.window_dates()
+    return lambda: aggregation.event_frequency_counts(series, "hours", start_dates, end_dates)
+
+@_case("aggregation.event_frequency_counts (LongFormat)", "events", _aggregation_sizes)
+def _event_counts_long(size):
+    from python_analysis_toolkit.timeseries import aggregation
+    from python_analysis_toolkit.timeseries.longformat import LongFormat
+    table = LongFormat(generators.long_table(*size))
+    start_dates, end_dates = generators.window_dates()
+    return lambda: aggregation.event_frequency_counts(table, "hours", start_dates, end_dates)
+
+@_case("aggregation.state_transitions (dict of tuples)", "state points", {"small" : [(10**3, 1), (10**4, 10), (10**5, 100)], "medium" : [(10**6, 100)]})
+def _transitions_dict(size):
+    from python_analysis_toolkit.timeseries import aggregation
+    ts_dict = generators.state_dict(*size)
+    start_dates, end_dates = generators.window_dates()
+    return lambda: aggregation.state_transitions(ts_dict, "minutes", start_dates, end_dates)
+
+@_case("aggregation.state_transitions (KeyedSeries)", "state points", _aggregation_sizes)
+def _transitions_series(size):
+    from python_analysis_toolkit.timeseries import aggregation
+    series = generators.keyed_series(*size, states = True)
+    start_dates, end_dates = generators.window_dates()
+    return lambda: aggregation.state_transitions(series, "minutes", start_dates, end_dates)
+
+#timeseries rendering of already aggregated data. sizes are (events, keys)
+
+_rendering_sizes = {"small" : [(10**4, 10)], "medium" : [(10**6, 100)], "large" : [(10**7, 10**3)]}
+
+def _render_case(function, precomputed, **kwargs):
+    _import_outside_timing("matplotlib.figure", "matplotlib.gridspec", "matplotlib.backends.backend_agg", "matplotlib.backends.backend_pdf")
+    start_dates, end_dates = generators.window_dates(2, 60)
+    fname = _scratch_path("benchmark")
+    return lambda: function(precomputed, "days", "hours", start_dates, end_dates, save_instead_plot = True, fname = fname, **kwargs)
+
+def _precomputed_counts(size):
+    from python_analysis_toolkit.timeseries import aggregation
+    start_dates, end_dates = generators.window_dates(2, 60)
+    return _Precomputed(counts = aggregation.event_frequency_counts(generators.keyed_series(*size, days = 60), "hours", start_dates, end_dates))
+
+def _precomputed_states(size):
+    from python_analysis_toolkit.timeseries import aggregation
+    start_dates, end_dates = generators.window_dates(2, 60)
+    series = generators.keyed_series(*size, states = True, days = 60)
+    return _Precomputed(transitions = aggregation.state_transitions(series, "hours", start_dates, end_dates),
+                        events = aggregation.annotation_events(series, start_dates, end_dates))
+
+@_case("graphing.plot_event_frequency (rendering only)", "events", _rendering_sizes)
+def _render_counts(size):
+    from python_analysis_toolkit.timeseries import graphing
+    return _render_case(graphing.plot_event_frequency, _precomputed_counts(size))
+
+@_case("graphing.plot_event_frequency (rendering only, high_volume)", "events", _rendering_sizes)
+def _render_counts_high_volume(size):
+    from python_analysis_toolkit.timeseries import graphing
+    return _render_case(graphing.plot_event_frequency, _precomputed_counts(size), high_volume = True, rasterize = True)
+
+@_case("graphing.state_diagram (rendering only)", "state points", _rendering_sizes)
+def _render_states(size):
+    from python_analysis_toolkit.timeseries import graphing
+    return _render_case(graphing.state_diagram, _precomputed_states(size))
+
+@_case("graphing.state_diagram (rendering only, high_volume)", "state points", _rendering_sizes)
+def _render_states_high_volume(size):
+    from python_analysis_toolkit.timeseries import graphing
+    return _render_case(graphing.state_diagram, _precomputed_states(size), high_volume = True, rasterize = True)
+
+#machine_learning. sizes are matrix rows (10 features, 5 blobs)
+
+@_case("clustering.kmpp", "rows", {"small" : [10**3, 10**4], "medium" : [10**5], "large" : [10**6]})
+def _kmpp(rows):
+    from python_analysis_toolkit.machine_learning import clustering
+    _import_outside_timing("sklearn.cluster")
+    matrix = numpy.nan_to_num(generators.clustered_matrix(rows))
+    return lambda: clustering.kmpp(matrix, 5)
+
+@_case("clustering.minibatch_kmpp", "rows", {"small" : [10**4], "medium" : [10**6], "large" : [10**7]})
+def _minibatch_kmpp(rows):
+    from python_analysis_toolkit.machine_learning import clustering
+    _import_outside_timing("sklearn.cluster")
+    matrix = generators.clustered_matrix(rows)
+    return lambda: clustering.minibatch_kmpp(matrix, 5, random_state = 0)
+
+@_case("clustering.minibatch_kmpp (memmap, recomputed)", "rows", {"small" : [10**5], "medium" : [10**6], "large" : [10**7]})
+def _minibatch_kmpp_memmap(rows):
+    from python_analysis_toolkit.machine_learning import clustering
+    _import_outside_timing("sklearn.cluster")
+    matrix = generators.memmap_matrix(rows, _scratch_dir)
+    return lambda: clustering.minibatch_kmpp(matrix, 5, random_state = 0)
+
+@_case("clustering.minibatch_kmpp (memmap, cache hit)", "rows", {"small" : [10**5], "medium" : [10**6], "large" : [10**7]})
+def _minibatch_kmpp_cache_hit(rows):
+    from python_analysis_toolkit.machine_learning import clustering
+    from python_analysis_toolkit.machine_learning.cache import ResultCache
+    matrix = generators.memmap_matrix(rows, _scratch_dir)
+    cache = ResultCache(_scratch_path("cache"))
+    clustering.minibatch_kmpp(matrix, 5, random_state = 0, cache = cache) #the entry that every timed run hits
+    return lambda: clustering.minibatch_kmpp(matrix, 5, random_state = 0, cache = cache)
+
+@_case("dimensionality.pca_biplot_with_clustering", "rows", {"small" : [10**3, 10**4], "medium" : [10**5]})
+def _pca_biplot(rows):
+    from python_analysis_toolkit.machine_learning import dimensionality
+    _import_outside_timing("sklearn.cluster", "sklearn.decomposition", "matplotlib.figure", "matplotlib.backends.backend_agg")
+    matrix = generators.clustered_matrix(rows)
+    f_out = _scratch_path("benchmark")
+    return lambda: dimensionality.pca_biplot_with_clustering(matrix.copy(), ["f{0}".format(i) for i in range(10)], f_out = f_out)
+
+@_case("dimensionality.pca_biplot_with_clustering (large_data)", "rows", {"small" : [10**4], "medium" : [10**6], "large" : [10**7]})
+def _pca_biplot_large(rows):
+    from python_analysis_toolkit.machine_learning import dimensionality
+    _import_outside_timing("sklearn.cluster", "sklearn.decomposition", "matplotlib.figure", "matplotlib.backends.backend_agg")
+    matrix = generators.clustered_matrix(rows)
+    f_out = _scratch_path("benchmark")
+    return lambda: dimensionality.pca_biplot_with_clustering(matrix.copy(), ["f{0}".format(i) for i in range(10)], f_out = f_out, large_data = True,
+                                                             max_plot_points = 10**4, random_state = 0)
+
+
+"""
+Public Functions
+"""
+
+def run(tier = "small", only = None, verbose = True):
+    """
+        runs every case (whose name contains only, if given) at every size of tier and the tiers below it.
+        a case that raises is recorded with its error instead of a time, and the rest still run.
+        returns {"metadata" : ..., "results" : list of {"case", "size", "units", "unit", "seconds", "runs", "per_second"}, "scaling_exponents" : ...}
+    """
+    if tier not in _tiers:
+        raise Exception("Unknown tier {0}, use one of {1}".format(tier, _tiers))
+    tiers = _tiers[:_tiers.index(tier) + 1]
+    results = []
+    for case in _cases:
+        if only is not None and only not in case["name"]:
+            continue
+        for t in tiers:
+            for size in case["sizes"].get(t, []):
+                result = {"case" : case["name"], "size" : _size_label(size), "units" : _units(size), "unit" : case["unit"]}
+                try:
+                    result["seconds"], result["runs"] = _run_case(case["setup"], size)
+                    result["per_second"] = result["units"]/max(result["seconds"], 1e-9)
+                except Exception as e:
+                    result["error"] = "{0}: {1}".format(type(e).__name__, e)
+                results.append(result)
+                if verbose:
+                    if "error" in result:
+                        print("{0:<70}{1:>16}  failed: {2}".format(result["case"], result["size"], result["error"]))
+                    else:
+                        print("{0:<70}{1:>16}{2:>12.4f} s{3:>16,.0f} {4}/s".format(result["case"], result["size"], result["seconds"], result["per_second"], result["unit"]))
+                    sys.stdout.flush()
+    return {"metadata" : _metadata(tier), "results" : results, "scaling_exponents" : _scaling_exponents(results)}
+
+def timeit(f, *args, **kwargs):
+    """
+        seconds f(*args) takes, measured like the cases of run(): the best of up to max_runs (keyword, default 5) runs.
+        pass max_runs = 1 for work that changes state and cannot be repeated. used by the one off comparisons next to this file
+    """
+    return _measure(lambda: f(*args), max_runs = kwargs.get("max_runs", 5))[0]
+
+def save(report, path):
+    with open(path, "w") as f:
+        json.dump(report, f, indent = 1, sort_keys = True)
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+def compare(baseline, current, threshold = 0.25, min_seconds = 0.001):
+    """
+        compares two run() reports case by case.
+        returns a list of {"case", "size", "baseline_seconds", "seconds", "ratio", "status"} where status is "regression" (slower than
+        baseline * (1 + threshold)), "improvement" (faster than baseline / (1 + threshold)), "ok", "failed" (errors now, not in the baseline),
+        "missing" (in the baseline, but not in current: the case was renamed, removed or lost a size),
+        or "noise" (the baseline took less than min_seconds, too short to judge)
+    """
+    current_results = dict((_result_key(r), r) for r in current["results"])
+    rows = []
+    for b in baseline["results"]:
+        if "error" in b:
+            continue
+        c = current_results.get(_result_key(b))
+        row = {"case" : b["case"], "size" : b["size"], "baseline_seconds" : b["seconds"], "seconds" : None if c is None else c.get("seconds"), "ratio" : None}
+        if c is None:
+            row["status"] = "missing"
+        elif "error" in c:
+            row["status"] = "failed"
+        else:
+            row["ratio"] = c["seconds"]/max(b["seconds"], 1e-9)
+            if b["seconds"] < min_seconds:
+                row["status"] = "noise"
+            elif row["ratio"] > 1 + threshold:
+                row["status"] = "regression"
+            elif row["ratio"] < 1/(1 + threshold):
+                row["status"] = "improvement"
+            else:
+                row["status"] = "ok"
+        rows.append(row)
+    return rows
+
+def print_comparison(rows):
+    print("{0:<70}{1:>16}{2:>12}{3:>12}{4:>8}  {5}".format("case", "size", "baseline s", "now s", "ratio", "status"))
+    for r in rows:
+        print("{0:<70}{1:>16}{2:>12.4f}{3:>12}{4:>8}  {5}".format(r["case"], r["size"], r["baseline_seconds"],
+                                                                "-" if r["seconds"] is None else "{0:.4f}".format(r["seconds"]),
+                                                                "-" if r["ratio"] is None else "{0:.2f}".format(r["ratio"]), r["status"]))
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "python_analysis_toolkit benchmark suite")
+    commands = parser.add_subparsers(dest = "command")
+    run_parser = commands.add_parser("run", help = "run the suite and write the results as json")
+    run_parser.add_argument("--tier", default = "small", choices = _tiers)
+    run_parser.add_argument("--only", default = None, help = "only the cases whose name contains this")
+    run_parser.add_argument("--out", default = "benchmark_results.json")
+    compare_parser = commands.add_parser("compare", help = "compare against a baseline; exits with 1 on a regression, or a failed or missing case")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current", nargs = "?", default = None, help = "results to compare; by default the baseline's cases are run again")
+    compare_parser.add_argument("--threshold", type = float, default = 0.25, help = "allowed slowdown, as a fraction of the baseline time")
+    compare_parser.add_argument("--min-seconds", type = float, default = 0.001, help = "baseline times below this are too noisy to judge")
+    compare_parser.add_argument("--only", default = None, help = "only the cases whose name contains this, in the baseline and the new run")
+    compare_parser.add_argument("--out", default = None, help = "also write the new results here")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        report = run(args.tier, args.only)
+        save(report, args.out)
+        for case, exponent in sorted(report["scaling_exponents"].items()):
+            print("{0:<70} scales as n^{1:.2f}".format(case, exponent))
+    elif args.command == "compare":
+        baseline = load(args.baseline)
+        if args.only is not None: #the cases left out on purpose are not missing
+            baseline["results"] = [r for r in baseline["results"] if args.only in r["case"]]
+        current = load(args.current) if args.current is not None else run(baseline["metadata"]["tier"], args.only)
+        if args.out is not None:
+            save(current, args.out)
+        rows = compare(baseline, current, args.threshold, args.min_seconds)
+        print_comparison(rows)
+        regressions = [r for r in rows if r["status"] in ("regression", "failed", "missing")]
+        if regressions:
+            print("{0} regression(s) beyond {1:.0%}, failed or missing case(s)".format(len(regressions), args.threshold))
+            return 1
+    else:
+        parser.print_help()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
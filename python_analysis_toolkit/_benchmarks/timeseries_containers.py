@@ -0,0 +1,31 @@
+import sys
+
+from python_analysis_toolkit.timeseries import aggregation
+from python_analysis_toolkit.timeseries.containers import KeyedSeries
+from python_analysis_toolkit._benchmarks import generators
+from python_analysis_toolkit._benchmarks.suite import timeit
+
+
+def _dict_nbytes(ts_dict):
+    """memory held by a ts_dict of lists of DateTimes: the lists plus every DateTime object"""
+    return sum(sys.getsizeof(l) + sum(sys.getsizeof(d) for d in l) for l in ts_dict.values())
+
+def benchmark_containers(n_keys = 100, events_per_key = 10**4, n_windows = 12):
+    """memory and event_frequency_counts time of a ts_dict of DateTimes against the equivalent KeyedSeries"""
+    ts_dict = generators.event_dict(n_keys*events_per_key, n_keys, days = n_windows*30)
+    start_dates, end_dates = generators.window_dates(n_windows, n_windows*30)
+
+    convert = timeit(KeyedSeries.from_event_dict, ts_dict)
+    series = KeyedSeries.from_event_dict(ts_dict)
+
+    return {"events": n_keys*events_per_key,
+            "dict_bytes": _dict_nbytes(ts_dict),
+            "keyed_series_bytes": series.nbytes,
+            "convert_seconds": convert,
+            "dict_counts_seconds": timeit(aggregation.event_frequency_counts, ts_dict, "hours", start_dates, end_dates),
+            "keyed_series_counts_seconds": timeit(aggregation.event_frequency_counts, series, "hours", start_dates, end_dates)}
+
+
+if __name__ == "__main__":
+    for name, value in sorted(benchmark_containers().items()):
+        print("{0:<30}{1:>16}".format(name, value if isinstance(value, int) else "{0:.3f}".format(value)))
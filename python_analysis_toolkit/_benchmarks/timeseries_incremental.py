@@ -0,0 +1,43 @@
+import numpy
+
+from python_analysis_toolkit.timeseries import aggregation
+from python_analysis_toolkit.timeseries.containers import KeyedSeries
+from python_analysis_toolkit.timeseries.incremental import IncrementalCounts
+from python_analysis_toolkit._benchmarks import generators
+from python_analysis_toolkit._benchmarks.suite import timeit
+
+
+def _ts_dict(series, shift_ns = 0):
+    return dict((k, (series.times_for(k) + shift_ns).view('datetime64[ns]')) for k in series.keys())
+
+def benchmark_incremental(n_keys = 100, history_per_key = (10**3, 10**4, 10**5), new_per_key = 10, n_windows = 12):
+    """
+        seconds to refresh event_frequency_counts after new_per_key events arrive per key, against a growing history:
+        recounting the whole history (KeyedSeries) versus appending to an IncrementalCounts. the incremental refresh should stay flat
+    """
+    days = n_windows*30
+    start_dates, end_dates = generators.window_dates(n_windows, days)
+    results = []
+    for history in history_per_key:
+        old = _ts_dict(generators.keyed_series(n_keys*history, n_keys, days = days - 1)) #history up to the last day, new events in the last day
+        new = _ts_dict(generators.keyed_series(n_keys*new_per_key, n_keys, days = 1, seed = 1), (days - 1)*86400*10**9)
+        incremental = IncrementalCounts("hours", start_dates, end_dates)
+        incremental.append(old)
+
+        def full():
+            series = KeyedSeries.from_event_dict(dict((k, numpy.concatenate([old[k], new[k]])) for k in old))
+            return aggregation.event_frequency_counts(series, "hours", start_dates, end_dates)
+
+        def refresh():
+            incremental.append(new)
+            return aggregation.event_frequency_counts(incremental, "hours", start_dates, end_dates)
+
+        results.append({"history_events": n_keys*history, "new_events": n_keys*new_per_key,
+                        "full_seconds": timeit(full), "incremental_seconds": timeit(refresh, max_runs = 1)}) #a second append would count new twice
+    return results
+
+
+if __name__ == "__main__":
+    print("{0:>16}{1:>12}{2:>16}{3:>20}".format("history_events", "new_events", "full_seconds", "incremental_seconds"))
+    for r in benchmark_incremental():
+        print("{0:>16}{1:>12}{2:>16.3f}{3:>20.3f}".format(r["history_events"], r["new_events"], r["full_seconds"], r["incremental_seconds"]))
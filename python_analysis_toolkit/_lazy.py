@@ -0,0 +1,18 @@
+import importlib
+
+"""
+Lazy submodule loading for the package __init__s: "import python_analysis_toolkit" imports nothing else,
+and python_analysis_toolkit.timeseries.graphing (say) is imported the first time it is accessed.
+"""
+
+def lazy_submodules(package, submodules):
+    """returns the module level __getattr__ and __dir__ for package (PEP 562) that import the listed submodules on first access"""
+    def __getattr__(name):
+        if name in submodules:
+            return importlib.import_module("." + name, package) #also sets it as an attribute of the package, so this runs once per submodule
+        raise AttributeError("module {0!r} has no attribute {1!r}".format(package, name))
+
+    def __dir__():
+        return sorted(set(submodules) | set(vars(importlib.import_module(package))))
+
+    return __getattr__, __dir__
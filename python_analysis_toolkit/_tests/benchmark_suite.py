@@ -0,0 +1,54 @@
+import os
+
+from python_analysis_toolkit._benchmarks import suite, generators
+
+
+def _report(seconds):
+    return {"metadata" : {"tier" : "small"},
+            "results" : [{"case" : "case", "size" : str(n), "units" : n, "unit" : "events", "seconds" : s} for n, s in seconds]}
+
+
+def test_compare():
+    baseline = _report([(10**3, 0.0001), (10**4, 0.01), (10**5, 0.1), (10**6, 1.0)])
+    current = _report([(10**3, 0.001), (10**4, 0.011), (10**5, 0.2), (10**6, 0.5)])
+    statuses = [r["status"] for r in suite.compare(baseline, current, threshold = 0.25)]
+    assert statuses == ["noise", "ok", "regression", "improvement"]
+    current["results"][1] = {"case" : "case", "size" : "10000", "units" : 10**4, "unit" : "events", "error" : "Exception: broken"}
+    assert suite.compare(baseline, current)[1]["status"] == "failed"
+    del current["results"][2]
+    rows = suite.compare(baseline, current)
+    assert len(rows) == 4 and rows[2]["status"] == "missing" and rows[2]["seconds"] is None
+
+
+def test_scaling_exponents():
+    linear = _report([(10**3, 0.001), (10**5, 0.1)])["results"]
+    quadratic = [dict(r, case = "quadratic", seconds = r["seconds"]**2*1000) for r in linear]
+    exponents = suite._scaling_exponents(linear + quadratic)
+    assert abs(exponents["case"] - 1) < 1e-9 and abs(exponents["quadratic"] - 2) < 1e-9
+
+
+def test_run():
+    report = suite.run("small", only = "is_weekday_array", verbose = False)
+    assert [r["size"] for r in report["results"]] == ["1000", "100000"]
+    assert all(r["seconds"] > 0 for r in report["results"])
+
+    #cases that write files get a temporary directory each, removed after the case even if it raises
+    directories = []
+    def writes_files(n):
+        directories.append(suite._scratch_dir)
+        generators.memmap_matrix(n, suite._scratch_dir)
+        if n > 10:
+            raise Exception("broken")
+        return lambda: None
+    suite._cases.append({"name" : "writes files", "unit" : "rows", "sizes" : {"small" : [10, 100]}, "setup" : writes_files})
+    try:
+        results = suite.run("small", only = "writes files", verbose = False)["results"]
+    finally:
+        suite._cases.pop()
+    assert "seconds" in results[0] and results[1]["error"] == "Exception: broken"
+    assert len(set(directories)) == 2 and not any(os.path.exists(d) for d in directories) and suite._scratch_dir is None
+
+
+test_compare()
+test_scaling_exponents()
+test_run()
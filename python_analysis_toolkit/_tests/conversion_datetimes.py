@@ -0,0 +1,114 @@
+import numpy
+from datetime import datetime
+
+from python_analysis_toolkit.conversion import datetimes
+
+
+def _raises(f, *args):
+    try:
+        f(*args)
+    except Exception:
+        return True
+    return False
+
+def _ymdhms_strings(epochs):
+    return numpy.char.replace(numpy.asarray(epochs).astype('datetime64[s]').astype('U19'), "T", " ")
+
+def test_ymdhms_fast_path():
+    #1900 (not a leap year) to 2100 (not one either), with the leap days and the days around them
+    epochs = numpy.random.RandomState(0).randint(-2208988800, 4102444800, size=20000)
+    strs = numpy.concatenate([_ymdhms_strings(epochs), ["2000-02-29 23:59:59", "2016-02-29 00:00:00", "1900-02-28 12:00:00", "1900-03-01 00:00:00",
+                                                        "2100-03-01 00:00:00", "1970-01-01 00:00:00", "1969-12-31 23:59:59"]])
+    chars = datetimes._as_ymdhms_chars(strs)
+    assert chars is not None and chars.shape == (len(strs), 19)
+    fast = datetimes._parse_ymdhms_chars(chars)
+    assert (fast == numpy.array(strs, dtype='datetime64[ns]').view('int64')).all() #numpy's own parser, the fallback
+    assert (datetimes.ymdhms_array_to_epoch_ns(strs) == fast).all() and (datetimes.ymdhms_array_to_epoch_ns(strs.tolist()) == fast).all()
+    assert (datetimes.ymdhms_array_to_epoch(strs[:100]) == [(datetimes.ymdhms_to_datetime(s) - datetime(1970, 1, 1)).total_seconds() for s in strs[:100]]).all()
+
+    as_bytes = numpy.char.encode(strs, 'ascii')
+    assert as_bytes.dtype == numpy.dtype('S19') and datetimes._as_ymdhms_chars(as_bytes) is not None
+    assert (datetimes.ymdhms_array_to_epoch_ns(as_bytes) == fast).all() and (datetimes.ymdhms_array_to_epoch_ns(as_bytes.tolist()) == fast).all()
+    assert len(datetimes.ymdhms_array_to_epoch_ns([])) == 0
+
+def test_ymdhms_fallback():
+    valid = ["2015-09-01 10:00:00", "2016-02-29 12:34:56"]
+    expected = numpy.array(valid, dtype='datetime64[ns]').view('int64')
+    #other widths go to numpy's parser: shorter strings, fractional seconds
+    assert datetimes._as_ymdhms_chars(numpy.array(["2015-09-01 10:00"])) is None
+    assert datetimes.ymdhms_array_to_epoch_ns(["2015-09-01 10:00", valid[1]])[0] == expected[0]
+    assert datetimes.ymdhms_array_to_epoch_ns([valid[0] + ".5", valid[1]])[0] == expected[0] + 5*10**8
+    assert (datetimes.ymdhms_array_to_epoch_ns(numpy.char.encode(numpy.array(valid + ["2015-09-01"]), 'ascii'))[:2] == expected).all()
+
+    #19 characters, but not a valid timestamp: the fast path refuses them, and numpy's parser raises
+    for bad in ["2015-02-29 00:00:00", "1900-02-29 00:00:00", "2015-13-01 00:00:00", "2015-09-31 00:00:00", "2015-09-01 24:00:00",
+                "2015-09-01 10:60:00", "2015-09-01_10:00:00", "2015/09/01 10:00:00", "2015-09-0a 10:00:00"]:
+        strs = numpy.array([valid[0], bad])
+        assert datetimes._parse_ymdhms_chars(datetimes._as_ymdhms_chars(strs)) is None, bad
+        assert _raises(datetimes.ymdhms_array_to_epoch_ns, strs), bad
+    assert _raises(datetimes.ymdhms_array_to_epoch_ns, ["2015-9-1 10:00:00"]) and _raises(datetimes.ymdhms_array_to_epoch_ns, ["garbage"])
+
+def test_epoch_and_calendar_arrays():
+    epochs = numpy.array([0, 1441065600, 1456704000, -86400])
+    assert (datetimes.epoch_array_to_datetime64(epochs) == numpy.array([datetimes.epoch_to_datetime(e) for e in epochs.tolist()], dtype='datetime64[ns]')).all()
+    assert datetimes.epoch_array_to_datetime64([1.5])[0] == numpy.datetime64('1970-01-01T00:00:01.500', 'ns')
+    assert (datetimes.ymdhms_array_to_datetime64(["2016-02-29 12:34:56"], truncate_time = True) == numpy.datetime64('2016-02-29', 'ns')).all()
+    days = numpy.arange('2015-08-30', '2015-09-14', dtype='datetime64[D]')
+    assert list(datetimes.is_weekday_array(days)) == [datetimes.is_weekday(d) for d in days.tolist()]
+
+def _pytz_utc_ns(tz, d, is_dst):
+    return int(numpy.datetime64(tz.localize(d, is_dst=is_dst).astimezone(datetimes.pytz.utc).replace(tzinfo=None), 'ns').astype('int64'))
+
+def test_local_to_utc_policies():
+    for tz_name, days in [("US/Eastern", ["2015-03-08", "2015-11-01"]), ("Europe/London", ["2015-03-29", "2015-10-25"]),
+                          ("Australia/Sydney", ["2015-04-05", "2015-10-04"])]:
+        tz = datetimes.pytz.timezone(tz_name)
+        #every 10 minutes from the day before each transition to the day after
+        local = numpy.concatenate([numpy.datetime64(day, 'm') + numpy.arange(-24*60, 2*24*60, 10) for day in days]).astype('datetime64[ns]')
+        local_dts = local.astype('datetime64[us]').tolist()
+        expected, ambiguous, nonexistent = [], [], []
+        for d in local_dts:
+            try:
+                expected.append(_pytz_utc_ns(tz, d, None))
+                ambiguous.append(False)
+                nonexistent.append(False)
+            except datetimes.pytz.exceptions.AmbiguousTimeError:
+                expected.append((_pytz_utc_ns(tz, d, True), _pytz_utc_ns(tz, d, False)))
+                ambiguous.append(True)
+                nonexistent.append(False)
+            except datetimes.pytz.exceptions.NonExistentTimeError:
+                expected.append((_pytz_utc_ns(tz, d, True), _pytz_utc_ns(tz, d, False)))
+                ambiguous.append(False)
+                nonexistent.append(True)
+        ambiguous, nonexistent = numpy.array(ambiguous), numpy.array(nonexistent)
+        assert ambiguous.sum() == nonexistent.sum() == 6 #one hour each, at 10 minute steps
+
+        for policy in ["earlier", "later", "NaT"]:
+            pick = {"earlier" : min, "later" : max, "NaT" : lambda pair: datetimes._NAT}[policy]
+            want = numpy.array([e if isinstance(e, int) else pick(e) for e in expected], dtype='int64')
+            utc, got_ambiguous, got_nonexistent = datetimes.local_array_to_utc_epoch_ns(local, tz_name, policy, policy, return_masks = True)
+            assert (utc == want).all() and (got_ambiguous == ambiguous).all() and (got_nonexistent == nonexistent).all(), (tz_name, policy)
+            assert (datetimes.local_array_to_utc_datetime64(local_dts, tz_name, policy, policy).view('int64') == want).all()
+        mixed = datetimes.local_array_to_utc_epoch_ns(local, tz_name, ambiguous = "later", nonexistent = "earlier")
+        assert (mixed[ambiguous] == [max(e) for e, a in zip(expected, ambiguous) if a]).all()
+        assert (mixed[nonexistent] == [min(e) for e, n in zip(expected, nonexistent) if n]).all()
+
+        #"raise" (the default) raises pytz's own exceptions, like the scalar function, and only for the affected kind
+        assert (datetimes.local_array_to_utc_epoch_ns(local[~ambiguous & ~nonexistent], tz_name) == numpy.array(expected, dtype=object)[~ambiguous & ~nonexistent].astype('int64')).all()
+        for policies, error in [(("raise", "NaT"), datetimes.pytz.exceptions.AmbiguousTimeError), (("NaT", "raise"), datetimes.pytz.exceptions.NonExistentTimeError)]:
+            try:
+                datetimes.local_array_to_utc_epoch_ns(local, tz_name, *policies)
+                assert False, (tz_name, policies)
+            except error:
+                pass
+        assert not _raises(datetimes.local_array_to_utc_epoch_ns, local[~ambiguous], tz_name, "raise", "NaT")
+
+    epochs = datetimes.ymdhms_array_timezone_dst_to_epoch(["2015-03-08 02:30:00", "2015-07-01 12:00:00"], "US/Eastern", nonexistent = "NaT")
+    assert numpy.isnan(epochs[0]) and epochs[1] == datetimes.ymdhms_timezone_dst_to_epoch("2015-07-01 12:00:00")
+    assert _raises(datetimes.local_array_to_utc_epoch_ns, numpy.array(["2015-07-01T12:00"], dtype='datetime64[ns]'), "US/Eastern", "sometimes")
+
+
+test_ymdhms_fast_path()
+test_ymdhms_fallback()
+test_epoch_and_calendar_arrays()
+test_local_to_utc_policies()
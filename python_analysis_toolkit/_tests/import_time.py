@@ -0,0 +1,46 @@
+import os
+import sys
+import json
+import subprocess
+
+_package_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_heavy_modules = ["matplotlib", "pandas", "sklearn"]
+_import_budget_seconds = 1.0 #per module, in a fresh interpreter; numpy alone is ~0.1-0.2s
+
+
+def _import_in_fresh_interpreter(module):
+    """imports module in a new python process, returns (seconds the import took, the heavy modules it loaded)"""
+    code = ("import sys, time, json\n"
+            "t = time.time()\n"
+            "import {0}\n"
+            "print(json.dumps([time.time() - t, [m for m in {1} if m in sys.modules]]))").format(module, json.dumps(_heavy_modules))
+    env = dict(os.environ)
+    env["PYTHONPATH"] = _package_root + os.pathsep + env.get("PYTHONPATH", "")
+    out = subprocess.check_output([sys.executable, "-c", code], env = env)
+    seconds, loaded = json.loads(out.decode().strip().splitlines()[-1])
+    return seconds, loaded
+
+
+def test_light_imports():
+    for module in ["python_analysis_toolkit.conversion.datetimes",
+                   "python_analysis_toolkit.profiling",
+                   "python_analysis_toolkit.stats.basic_functions",
+                   "python_analysis_toolkit.timeseries.graphing", #the drawing functions import matplotlib when they are called
+                   "python_analysis_toolkit.machine_learning.dimensionality"]:
+        seconds, loaded = _import_in_fresh_interpreter(module)
+        print("{0}: {1:.3f}s".format(module, seconds))
+        assert loaded == [], "{0} imported {1}".format(module, loaded)
+        assert seconds < _import_budget_seconds, "{0} took {1:.3f}s to import".format(module, seconds)
+
+
+def test_lazy_package():
+    seconds, loaded = _import_in_fresh_interpreter("python_analysis_toolkit")
+    assert loaded == []
+
+    import python_analysis_toolkit
+    assert python_analysis_toolkit.stats.basic_functions.mean([1, 2, 3]) == 2
+    assert "graphing" in dir(python_analysis_toolkit.timeseries)
+
+
+test_light_imports()
+test_lazy_package()
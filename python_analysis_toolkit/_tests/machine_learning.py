@@ -0,0 +1,137 @@
+import os
+import tempfile
+import numpy
+
+from python_analysis_toolkit.machine_learning import clustering
+from python_analysis_toolkit.machine_learning import dimensionality
+from python_analysis_toolkit.machine_learning.cache import ResultCache, fingerprint
+from python_analysis_toolkit import profiling
+
+
+def _low_rank_matrix(rows, seed = 0):
+    """rows x 6 matrix of two latent factors plus a little noise, so the top 2 components are well separated"""
+    rng = numpy.random.RandomState(seed)
+    return numpy.dot(rng.normal(size=(rows, 2))*[10, 4], rng.normal(size=(2, 6))) + 0.1*rng.normal(size=(rows, 6))
+
+def test_large_data():
+    matrix = _low_rank_matrix(501)
+    matrix[3, 1] = matrix[250, 5] = numpy.nan
+    with_infs = matrix.copy()
+    with_infs[10, 4], with_infs[20, 0] = numpy.inf, -numpy.inf
+    assert (dimensionality._clean_in_place(with_infs.copy(), False) == numpy.nan_to_num(with_infs)).all()
+    normalized = numpy.nan_to_num(matrix)
+    assert numpy.allclose(dimensionality._clean_in_place(matrix.copy(), True), normalized - normalized.mean(axis=1)[:, numpy.newaxis])
+
+    #nan_to_num turns infs into +-1.8e308, which neither PCA survives, so the projections are compared on the matrix with nans only
+    from sklearn.decomposition import PCA
+    exact = numpy.dot(normalized, PCA(n_components=2).fit(normalized).components_.T)
+    read_only = matrix.copy()
+    read_only.flags.writeable = False
+    for data in [matrix.copy(), read_only]: #cleaned in place, and a batch copy at a time
+        r_loadings, transformed = dimensionality._incremental_pca(data, False, 2, 50) #the 1 row last batch is merged into the one before
+        assert transformed.shape == (501, 2)
+        for c in range(2):
+            assert numpy.allclose(transformed[:, c], exact[:, c], atol=1e-3*abs(exact[:, c]).max()) or \
+                   numpy.allclose(transformed[:, c], -exact[:, c], atol=1e-3*abs(exact[:, c]).max())
+
+    labels = clustering.minibatch_kmpp(matrix, 3, batch_size = 50, random_state = 0)[1]
+    assert len(labels) == 501 and set(labels.tolist()) <= set(range(3))
+    assert len(clustering.minibatch_kmpp(with_infs, 3, batch_size = 50, random_state = 0)[1]) == 501
+
+    points, point_labels = dimensionality._plotted_points(exact, labels, 100, 0)
+    assert len(points) == len(point_labels) == 100
+    shown = numpy.array([numpy.flatnonzero((exact == p).all(axis=1))[0] for p in points])
+    assert (labels[shown] == point_labels).all()
+
+
+def test_result_cache():
+    matrix = _low_rank_matrix(300)
+    cache = ResultCache(tempfile.mkdtemp())
+    centroids, labels = clustering.kmpp(matrix, 3, cache)
+    cached_centroids, cached_labels = clustering.kmpp(matrix, 3, cache)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert (cached_centroids == centroids).all() and (cached_labels == labels).all()
+    clustering.kmpp(matrix[:-1], 3, cache) #other data, other key
+    assert (cache.hits, cache.misses) == (1, 2) and cache.stats()["entries"] == 2
+    assert all("summary" not in entry for entry in cache.recent("kmpp")) #no column summary pass without warm_start
+
+    #least recently used entries go first, and a hit counts as a use
+    arrays = {"x" : numpy.zeros(100)}
+    lru = ResultCache(tempfile.mkdtemp())
+    lru.put("test", "a", arrays)
+    lru.max_bytes = int(2.5*os.path.getsize(lru._file("test", "a")))
+    lru.put("test", "b", arrays)
+    os.utime(lru._file("test", "a"), (1000, 1000))
+    os.utime(lru._file("test", "b"), (2000, 2000))
+    assert lru.get("test", "a") is not None
+    lru.put("test", "c", arrays)
+    assert lru.get("test", "b") is None and lru.get("test", "a") is not None and lru.get("test", "c") is not None
+
+    #a miss on a similar matrix starts from the centroids of a clustering cached with warm_start
+    warm = ResultCache(tempfile.mkdtemp())
+    clustering.kmpp(matrix, 3, warm, warm_start = True)
+    assert warm.warm_starts == 0
+    nudged = matrix + 1e-3*numpy.random.RandomState(1).normal(size=matrix.shape)
+    warm_centroids, warm_labels = clustering.kmpp(nudged, 3, warm, warm_start = True)
+    assert warm.warm_starts == 1 and warm.misses == 2 and len(warm_labels) == 300
+    clustering.kmpp(matrix*10, 3, warm, warm_start = True) #not similar
+    assert warm.warm_starts == 1
+
+
+def test_memmap_fingerprint():
+    path = os.path.join(tempfile.mkdtemp(), "matrix.f8")
+    _low_rank_matrix(5000).tofile(path)
+    matrix = numpy.memmap(path, dtype='float64', mode='r+', shape=(5000, 6))
+    before = fingerprint(matrix)
+    assert fingerprint(numpy.memmap(path, dtype='float64', mode='r', shape=(5000, 6))) == before #the same file mapped again
+    assert fingerprint(numpy.array(matrix)) == fingerprint(numpy.array(matrix)) != before #in memory, hashed whole
+    assert fingerprint(matrix[:2500]) != fingerprint(matrix[2500:]) and fingerprint(matrix[::2]) != fingerprint(matrix[:2500])
+    matrix[0, 0] += 1 #a sampled row, so it shows even if the modification time does not move
+    matrix.flush()
+    assert fingerprint(matrix) != before
+
+
+def test_k_sweep():
+    matrix = _low_rank_matrix(400)
+    serial = clustering.k_sweep(matrix, range(2, 6), n_init = 3, processes = 1, silhouette_sample_size = 200, random_state = 0)
+    pooled = clustering.k_sweep(matrix, range(2, 6), n_init = 3, processes = 2, silhouette_sample_size = 200, random_state = 0)
+    assert [r["k"] for r in serial] == [r["k"] for r in pooled] == [2, 3, 4, 5]
+    for s, p in zip(serial, pooled): #the same restarts, one thread per worker or not
+        assert numpy.isclose(s["inertia"], p["inertia"], rtol=1e-9) and numpy.isclose(s["silhouette"], p["silhouette"], rtol=1e-9)
+    assert serial[0]["inertia"] > serial[-1]["inertia"]
+
+    matrix[7, 2] = numpy.nan
+    results = dimensionality.pca_k_sweep(matrix, range(2, 4), n_init = 2, processes = 2, random_state = 0, f_out = os.path.join(tempfile.mkdtemp(), "sweep"))
+    assert [r["k"] for r in results] == [2, 3] and all(r["centroids"].shape == (r["k"], 2) for r in results) #clustered in the 2 component projection
+
+
+def test_biplot():
+    matrix = _low_rank_matrix(2000)
+    matrix[5, 3] = numpy.nan
+    f_out = os.path.join(tempfile.mkdtemp(), "biplot")
+    labels = ["feature {0}".format(i) for i in range(6)]
+    exact = dimensionality.pca_biplot_with_clustering(matrix, labels, K = 3, f_out = f_out, random_state = 0)
+    assert exact.shape == (6, 2) and os.path.exists(f_out + "3_kmpost.pdf")
+
+    path = os.path.join(tempfile.mkdtemp(), "matrix.f8")
+    matrix.tofile(path)
+    mapped = numpy.memmap(path, dtype='float64', mode='r', shape=matrix.shape) #read only, so it is cleaned a batch at a time
+    large = dimensionality.pca_biplot_with_clustering(mapped, labels, K = 3, f_out = f_out + "_large", large_data = True, batch_size = 300,
+                                                      max_plot_points = 500, random_state = 0)
+    assert os.path.exists(f_out + "_large3_kmpost.pdf")
+    assert all(numpy.allclose(large[:, c], exact[:, c], atol=1e-3) or numpy.allclose(large[:, c], -exact[:, c], atol=1e-3) for c in range(2))
+
+    cache = ResultCache(tempfile.mkdtemp())
+    with profiling.profile() as first:
+        cached = dimensionality.pca_biplot_with_clustering(matrix, labels, K = 3, f_out = f_out + "_cached", cache = cache, random_state = 0)
+    with profiling.profile() as second:
+        assert (dimensionality.pca_biplot_with_clustering(matrix, labels, K = 3, f_out = f_out + "_cached", cache = cache, random_state = 0) == cached).all()
+    assert cache.misses == 2 and cache.hits == 2 #the PCA fit and the clustering, computed once, then read back
+    assert [p["phase"] for p in second.phases] == [p["phase"] for p in first.phases] == ["clean", "pca", "kmeans", "draw", "save"]
+
+
+test_large_data()
+test_biplot()
+test_result_cache()
+test_k_sweep()
+test_memmap_fingerprint()
@@ -0,0 +1,52 @@
+import os
+import json
+import tempfile
+import tracemalloc
+
+from python_analysis_toolkit import profiling
+
+
+def test_null_profiler():
+    assert profiling.current() is profiling.null_profiler
+    with profiling.null_profiler.phase("anything"):
+        profiling.null_profiler.count("points", 10, key = "a")
+    assert not profiling.null_profiler.enabled
+
+
+def test_profile():
+    path = os.path.join(tempfile.mkdtemp(), "report.json")
+    records = []
+    with profiling.profile(path, callback = records.append) as prof:
+        assert profiling.current() is prof
+        assert profiling.current(profiling.null_profiler) is profiling.null_profiler #an explicit profiler wins
+        with prof.phase("outer"):
+            with prof.phase("inner"):
+                prof.count("points", 3, key = "a", window = 0)
+            with prof.phase("inner"):
+                pass
+    assert profiling.current() is profiling.null_profiler
+    assert [p["phase"] for p in prof.phases] == ["outer/inner", "outer/inner", "outer"]
+    assert prof.counts == [{"name" : "points", "points" : 3, "key" : "a", "window" : 0}]
+    assert [r["type"] for r in records] == ["count", "phase", "phase", "phase"]
+    report = json.load(open(path))
+    assert set(report["totals"]) == set(["outer/inner", "outer"])
+    assert report["totals"]["outer"] >= report["totals"]["outer/inner"]
+
+
+def test_trace_memory():
+    prof = profiling.Profiler(trace_memory = True)
+    with prof.phase("outer"):
+        with prof.phase("allocate"):
+            block = bytearray(10**7)
+            del block
+        with prof.phase("small"):
+            pass
+    peaks = dict((p["phase"], p["traced_peak_bytes"]) for p in prof.phases)
+    assert peaks["outer/allocate"] >= 10**7 and peaks["outer/small"] < 10**6
+    assert peaks["outer"] >= 10**7 #not hidden by the inner phases resetting the peak
+    assert not tracemalloc.is_tracing() #stopped again by the phase that started it
+
+
+test_null_profiler()
+test_profile()
+test_trace_memory()
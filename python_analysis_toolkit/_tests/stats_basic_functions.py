@@ -0,0 +1,92 @@
+import pickle
+import functools
+import operator
+import numpy
+from collections import Counter
+
+from python_analysis_toolkit.stats import basic_functions
+from python_analysis_toolkit.stats.basic_functions import RunningStats, FrequentItems
+
+
+def _close(a, b, rel = 1e-12):
+    return abs(a - b) <= rel*max(abs(a), abs(b), 1e-300)
+
+def test_running_stats_matches_numpy():
+    data = numpy.random.RandomState(0).lognormal(size=100003)
+    chunked = RunningStats()
+    for chunk in numpy.array_split(data, 37):
+        chunked.add(chunk)
+    one_at_a_time = RunningStats()
+    for x in data[:5000].tolist():
+        one_at_a_time.add(x)
+    for s, d in [(chunked, data), (one_at_a_time, data[:5000])]:
+        assert s.count == len(d)
+        assert _close(s.mean, numpy.mean(d)) and _close(s.variance(), numpy.var(d), 1e-10) and _close(s.variance(1), numpy.var(d, ddof=1), 1e-10)
+        assert s.min == numpy.min(d) and s.max == numpy.max(d)
+
+def test_running_stats_merge():
+    data = numpy.random.RandomState(1).normal(5, 3, size=(1000, 7))
+    shards = [RunningStats().add(row) for row in data] #uneven merges: many small shards
+    total = functools.reduce(operator.add, shards)
+    tree = shards[:]
+    while len(tree) > 1: #pairwise, like a parallel reduction
+        tree = [tree[i] + tree[i+1] if i + 1 < len(tree) else tree[i] for i in range(0, len(tree), 2)]
+    for s in (total, tree[0], RunningStats().merge(RunningStats()).merge(total)):
+        assert s.count == data.size and _close(s.mean, data.mean(), 1e-10) and _close(s.variance(), data.var(), 1e-10)
+    restored = pickle.loads(pickle.dumps(total))
+    assert restored.count == total.count and restored.variance() == total.variance()
+
+def test_running_stats_stability():
+    #mean huge compared to the spread: sum(x^2)/n - mean^2 is all cancellation error here (it gives -128)
+    offset = 1e9
+    data = offset + numpy.tile([4.0, 7.0, 13.0, 16.0], 25000)
+    welford = RunningStats()
+    for x in data[:4000].tolist():
+        welford.add(x)
+    chunked = RunningStats()
+    for chunk in numpy.array_split(data, 13):
+        chunked.add(chunk)
+    for s in (welford, chunked):
+        assert abs(s.variance() - 22.5) < 1e-6, s.variance()
+        assert abs(s.mean - (offset + 10)) < 1e-5 #a few ulps of 1e9
+
+def test_mean_ci95_unchanged():
+    for l in [[1, 2, 3, 4], list(numpy.random.RandomState(2).exponential(size=999)), [5.0], numpy.arange(12).reshape(3, 4)]:
+        assert _close(basic_functions.mean(l), numpy.mean(l))
+        assert _close(basic_functions.ci95(l), 1.96*numpy.std(l)/numpy.sqrt(numpy.size(l)), 1e-10) or numpy.std(l) == 0
+    empty = RunningStats()
+    assert empty.count == 0 and numpy.isnan(empty.mean) and numpy.isnan(empty.variance()) and numpy.isnan(empty.min)
+    assert numpy.isnan(RunningStats().add([1.0, numpy.nan]).mean)
+
+def test_frequency_tuples_top_k():
+    l = list(numpy.random.RandomState(3).zipf(1.5, size=20000) % 500)
+    full = basic_functions.list_to_frequency_tuples(l)
+    assert basic_functions.list_to_frequency_tuples(l, top_k=10) == full[:10]
+    assert basic_functions.list_to_frequency_tuples(iter(l)) == full
+    assert full[0][1] == Counter(l).most_common(1)[0][1] and abs(sum(t[2] for t in full) - 100) < 1e-9
+
+def test_frequent_items():
+    stream = (numpy.random.RandomState(4).zipf(1.3, size=200000) % 100000).tolist()
+    exact = Counter(stream)
+    capacity = 200
+    whole = FrequentItems(capacity, batch_size=10000).add(stream)
+    shards = [FrequentItems(capacity, batch_size=10000).add(stream[i:i + 30000]) for i in range(0, len(stream), 30000)]
+    merged = functools.reduce(operator.add, shards)
+    for sketch in (whole, merged):
+        assert sketch.total == len(stream) and len(sketch.counts()) <= capacity
+        assert sketch.error() <= len(stream)/(capacity + 1.0)
+        for item, count in sketch.counts().items():
+            assert exact[item] - sketch.error() <= count <= exact[item]
+        for item, count in exact.items(): #every heavy hitter is found
+            assert count <= sketch.error() or item in sketch.counts()
+    approx = basic_functions.list_to_frequency_tuples(stream, top_k=5, max_error=0.005)
+    assert [t[0] for t in approx] == [t[0] for t in basic_functions.list_to_frequency_tuples(stream, top_k=5)]
+    assert all(t[1] <= exact[t[0]] <= t[1] + t[3] for t in approx)
+
+
+test_running_stats_matches_numpy()
+test_running_stats_merge()
+test_running_stats_stability()
+test_mean_ci95_unchanged()
+test_frequency_tuples_top_k()
+test_frequent_items()
@@ -1,5 +1,62 @@
 from python_analysis_toolkit.timeseries import graphing
+from python_analysis_toolkit import profiling
 from python_analysis_toolkit.conversion import datetimes
+from python_analysis_toolkit.timeseries import aggregation
+from python_analysis_toolkit.timeseries import streaming
+from python_analysis_toolkit.timeseries import store
+from python_analysis_toolkit.timeseries import batch
+from python_analysis_toolkit.timeseries.containers import KeyedSeries
+from python_analysis_toolkit.timeseries.longformat import LongFormat
+from python_analysis_toolkit.timeseries.rollup import Rollup
+from python_analysis_toolkit.timeseries.incremental import IncrementalCounts
+import os
+import tempfile
+import datetime
+import numpy
+
+
+#two windows with a gap between them, the second running past the last point of _fixture
+_start_dates = [datetimes.ymdhms_to_datetime("2015-09-01 00:00:00"), datetimes.ymdhms_to_datetime("2015-09-14 12:00:00")]
+_end_dates = [datetimes.ymdhms_to_datetime("2015-09-14 00:00:00"), datetimes.ymdhms_to_datetime("2015-12-01 00:00:00")]
+
+
+def _fixture(n_keys = 2, n = 3000, days = 30, seed = 0, empty_key = False):
+    """
+        n random state points at minute resolution (so there are ties) over keys "process 1" .. "process <n_keys>" and days from 2015-09-01,
+        in every input format: "keys", "times" (sorted, ties by value, datetime64[ns]) and "values" arrays, "table" (the same rows as a structured array
+        of key, timestamp, value, shuffled), "events_dict" ({key : list of DateTimes}) and "states_dict" ({key : {"ts" : [(DateTime, float)]}},
+        with two event_ts annotations on process 1). empty_key adds a key with no points to both dicts
+    """
+    rng = numpy.random.RandomState(seed)
+    times = (numpy.datetime64('2015-09-01', 's') + rng.randint(0, days*86400, n)//60*60).astype('datetime64[ns]')
+    keys = numpy.array(["process {0}".format(i) for i in rng.randint(1, n_keys + 1, n)])
+    values = rng.randint(0, 3, n).astype(float)
+    order = numpy.lexsort((values, times)) #ties by value, the order sorted() gives the (DateTime, float) tuples
+    times, keys, values = times[order], keys[order], values[order]
+    shuffle = rng.permutation(n) #long tables come in any order
+    table = numpy.zeros(n, dtype=[("key", keys.dtype), ("timestamp", 'datetime64[ns]'), ("value", 'float64')])
+    table["key"], table["timestamp"], table["value"] = keys[shuffle], times[shuffle], values[shuffle]
+    events_dict, states_dict = {}, {}
+    for k in sorted(set(keys.tolist())):
+        mine = keys == k
+        events_dict[k] = times[mine].astype('datetime64[us]').tolist()
+        states_dict[k] = {"ts" : list(zip(events_dict[k], values[mine].tolist()))}
+    states_dict["process 1"]["event_ts"] = [(datetimes.ymdhms_to_datetime("2015-09-20 10:00:00"), "upgrade"), (datetimes.ymdhms_to_datetime("2015-09-03 10:00:00"), "restart")]
+    if empty_key:
+        events_dict["process {0}".format(n_keys + 1)] = []
+        states_dict["process {0}".format(n_keys + 1)] = {"ts" : []}
+    return {"keys" : keys, "times" : times, "values" : values, "table" : table, "events_dict" : events_dict, "states_dict" : states_dict}
+
+
+def _assert_same_windows(expected, got):
+    """two aggregation results (key : None, or one (times, values or labels) tuple per window) are the same, key for key and window for window"""
+    assert list(got.keys()) == list(expected.keys())
+    for k in expected:
+        assert (got[k] is None) == (expected[k] is None)
+        if expected[k] is not None:
+            assert len(got[k]) == len(expected[k])
+            for (x1, y1), (x2, y2) in zip(expected[k], got[k]):
+                assert len(x1) == len(x2) and (x1 == x2).all() and list(y1) == list(y2)
 
 
 def test_state_diagram():
@@ -31,8 +88,8 @@ def test_state_diagram():
     graphing.state_diagram(ts_dict, 
                              "days", 
                              "hours", 
-                             start_date = [datetimes.ymdhms_to_datetime("2015-09-01 00:00:00"),datetimes.ymdhms_to_datetime("2015-09-14 00:00:00")],
-                             end_date = [datetimes.ymdhms_to_datetime("2015-09-14 00:00:00"),datetimes.ymdhms_to_datetime("2015-09-28 00:00:00")],
+                             start_dates = [datetimes.ymdhms_to_datetime("2015-09-01 00:00:00"),datetimes.ymdhms_to_datetime("2015-09-14 00:00:00")],
+                             end_dates = [datetimes.ymdhms_to_datetime("2015-09-14 00:00:00"),datetimes.ymdhms_to_datetime("2015-09-28 00:00:00")],
                              save_instead_plot = True,
                              fname = "state_diagram_test")
 
@@ -52,12 +109,268 @@ def test_event_frequency_diagram():
     graphing.plot_event_frequency(ts_dict, 
                                    "days", 
                                    "hours", 
-                                   start_date = [datetimes.ymdhms_to_datetime("2015-09-01 00:00:00"),datetimes.ymdhms_to_datetime("2015-09-14 00:00:00")],
-                                   end_date = [datetimes.ymdhms_to_datetime("2015-09-14 00:00:00"),datetimes.ymdhms_to_datetime("2015-09-28 00:00:00")],
+                                   start_dates = [datetimes.ymdhms_to_datetime("2015-09-01 00:00:00"),datetimes.ymdhms_to_datetime("2015-09-14 00:00:00")],
+                                   end_dates = [datetimes.ymdhms_to_datetime("2015-09-14 00:00:00"),datetimes.ymdhms_to_datetime("2015-09-28 00:00:00")],
                                    save_instead_plot = True,
                                    fname = "event_frequency_test")
 
 
+def test_event_frequency_counts():
+    ts_dict = {}
+    ts_dict["process 1"] = []
+    ts_dict["process 2"] = []
+    
+    for j in range(1,30):
+         ts_dict["process 1"].append(datetimes.ymdhms_to_datetime("2015-09-{0} 00:00:00".format(j)))
+         ts_dict["process 1"].append(datetimes.ymdhms_to_datetime("2015-09-{0} 00:30:00".format(j)))
+         ts_dict["process 1"].append(datetimes.ymdhms_to_datetime("2015-09-{0} 06:00:00".format(j)))
+    
+    counts = aggregation.event_frequency_counts(ts_dict, 
+                                                "hours", 
+                                                start_dates = [datetimes.ymdhms_to_datetime("2015-09-01 00:00:00"),datetimes.ymdhms_to_datetime("2015-09-14 00:00:00")],
+                                                end_dates = [datetimes.ymdhms_to_datetime("2015-09-14 00:00:00"),datetimes.ymdhms_to_datetime("2015-09-28 00:00:00")])
+    
+    assert counts["process 2"] is None
+    bucket_starts, bucket_counts = counts["process 1"][0]
+    assert str(bucket_starts[0])[:19] == "2015-09-01T00:00:00" and str(bucket_starts[-1])[:19] == "2015-09-14T00:00:00"
+    assert len(bucket_starts) == 13*24 + 1 #empty hours are kept, like pandas resample
+    assert bucket_counts.sum() == 13*3 + 1 and bucket_counts[0] == 2 and bucket_counts[6] == 1 and bucket_counts[1] == 0 
+
+
+def test_state_transitions():
+    ts_dict = {}
+    ts_dict["process 1"] = {}
+    ts_dict["process 1"]["ts"] = []
+    
+    for j in range(1,30):
+         ts_dict["process 1"]["ts"].append((datetimes.ymdhms_to_datetime("2015-09-{0} 00:00:00".format(j)), 0))
+         ts_dict["process 1"]["ts"].append((datetimes.ymdhms_to_datetime("2015-09-{0} 00:00:10".format(j)), 1)) #same minute, the last value wins
+         ts_dict["process 1"]["ts"].append((datetimes.ymdhms_to_datetime("2015-09-{0} 12:00:00".format(j)), 1)) #not a change
+    
+    transitions = aggregation.state_transitions(ts_dict, 
+                                                "minutes", 
+                                                start_dates = [datetimes.ymdhms_to_datetime("2015-09-01 00:00:00")],
+                                                end_dates = [datetimes.ymdhms_to_datetime("2015-09-28 23:59:59")])
+    
+    change_times, values = transitions["process 1"][0]
+    assert len(change_times) == 2 #seconds granularity would have been ~2.4M points
+    assert list(values) == [1, 1] and str(change_times[-1])[:19] == "2015-09-28T12:00:00"
+
+
+def test_chunked_inputs():
+    data = _fixture(seed = 4, empty_key = True)
+    events_dict, states_dict = data["events_dict"], data["states_dict"]
+    for minor_granularity in ["minutes", "hours", "days"]:
+        #chunk_size 16 gives more than _compact_every partial results per window, so the merging is exercised too
+        events = streaming.ChunkedEvents(dict((k, iter(v)) for k, v in events_dict.items()), chunk_size = 16)
+        states = streaming.ChunkedStates(dict((k, iter(v["ts"])) for k, v in states_dict.items()),
+                                         event_sources = {"process 1" : iter(states_dict["process 1"]["event_ts"])}, chunk_size = 16)
+        _assert_same_windows(aggregation.event_frequency_counts(events_dict, minor_granularity, _start_dates, _end_dates),
+                             aggregation.event_frequency_counts(events, minor_granularity, _start_dates, _end_dates))
+        _assert_same_windows(aggregation.state_transitions(states_dict, minor_granularity, _start_dates, _end_dates),
+                             aggregation.state_transitions(states, minor_granularity, _start_dates, _end_dates))
+    _assert_same_windows(aggregation.annotation_events(states_dict, _start_dates, _end_dates), aggregation.annotation_events(states, _start_dates, _end_dates))
+    between_windows = [t for t in events_dict["process 1"] if _end_dates[0] < t < _start_dates[1]]
+    assert events.outside_window_counts["process 1"] == len(between_windows) > 0
+
+
+def test_keyed_series():
+    data = _fixture(seed = 5, empty_key = True)
+    #unsorted lists
+    events_dict = dict((k, list(reversed(v))) for k, v in data["events_dict"].items())
+    states_dict = dict((k, dict(v, ts = list(reversed(v["ts"])))) for k, v in data["states_dict"].items())
+    from_arrays = KeyedSeries.from_arrays(data["keys"], data["times"], data["values"], key_order = list(states_dict.keys()))
+    for minor_granularity in ["minutes", "hours", "days"]:
+        _assert_same_windows(aggregation.event_frequency_counts(events_dict, minor_granularity, _start_dates, _end_dates),
+                             aggregation.event_frequency_counts(KeyedSeries.from_event_dict(events_dict), minor_granularity, _start_dates, _end_dates))
+        expected = aggregation.state_transitions(states_dict, minor_granularity, _start_dates, _end_dates)
+        _assert_same_windows(expected, aggregation.state_transitions(KeyedSeries.from_state_dict(states_dict), minor_granularity, _start_dates, _end_dates))
+        _assert_same_windows(expected, aggregation.state_transitions(from_arrays, minor_granularity, _start_dates, _end_dates))
+    _assert_same_windows(aggregation.annotation_events(states_dict, _start_dates, _end_dates),
+                         aggregation.annotation_events(KeyedSeries.from_state_dict(states_dict), _start_dates, _end_dates))
+
+
+def test_event_store():
+    data = _fixture(seed = 6, empty_key = True)
+    events_dict = data["events_dict"]
+    pairs_dict = dict((k, v["ts"]) for k, v in data["states_dict"].items() if len(v["ts"]) > 0)
+    states_dict = dict((k, {"ts" : v}) for k, v in pairs_dict.items()) #the store keeps no annotations
+
+    events_path, states_path = os.path.join(tempfile.mkdtemp(), "events"), os.path.join(tempfile.mkdtemp(), "states")
+    #written in two halves that overlap in time, so a window is read from two segments and merged
+    store.write_store(events_path, dict((k, v[::2]) for k, v in events_dict.items()))
+    store.append_to_store(events_path, dict((k, v[1::2]) for k, v in events_dict.items()))
+    store.write_store(states_path, dict((k, v[::2]) for k, v in pairs_dict.items()))
+    store.append_to_store(states_path, dict((k, v[1::2]) for k, v in pairs_dict.items()))
+    for compacted in [False, True]:
+        if compacted:
+            store.compact_store(events_path)
+            store.compact_store(states_path)
+        for minor_granularity in ["minutes", "hours", "days"]:
+            _assert_same_windows(aggregation.event_frequency_counts(events_dict, minor_granularity, _start_dates, _end_dates),
+                                 aggregation.event_frequency_counts(store.EventStore(events_path), minor_granularity, _start_dates, _end_dates))
+            _assert_same_windows(aggregation.state_transitions(states_dict, minor_granularity, _start_dates, _end_dates),
+                                 aggregation.state_transitions(store.EventStore(states_path), minor_granularity, _start_dates, _end_dates))
+        assert aggregation.annotation_events(store.EventStore(states_path), _start_dates, _end_dates) == aggregation.annotation_events(states_dict, _start_dates, _end_dates)
+    assert sum(len(segments) for segments in store.EventStore(events_path)._segments.values()) == 2
+
+    #a rewrite that stops before its index is replaced leaves the old store readable, and its column files are removed by the next rewrite
+    before = aggregation.event_frequency_counts(store.EventStore(events_path), "hours", _start_dates, _end_dates)
+    store._append_columns(events_path, store._new_index(events_path, False), KeyedSeries.from_event_dict({"process 1" : events_dict["process 1"][:10]}))
+    _assert_same_windows(before, aggregation.event_frequency_counts(store.EventStore(events_path), "hours", _start_dates, _end_dates))
+    store.write_store(events_path, events_dict)
+    assert sorted(os.listdir(events_path)) == ["index.json", "times.{0}.i8".format(store._read_index(events_path)["generation"])]
+    _assert_same_windows(before, aggregation.event_frequency_counts(store.EventStore(events_path), "hours", _start_dates, _end_dates))
+
+
+def test_render_batch():
+    ts_dict = {"process 1" : [datetimes.ymdhms_to_datetime("2015-09-{0:02d} 00:00:00".format(j)) for j in range(1, 29)], "process 2" : []}
+    spec = {"function" : "plot_event_frequency", "ts_dict" : ts_dict, "major_granularity" : "days", "minor_granularity" : "hours",
+            "start_dates" : [datetimes.ymdhms_to_datetime("2015-09-01 00:00:00"), datetimes.ymdhms_to_datetime("2015-09-14 00:00:00")],
+            "end_dates" : [datetimes.ymdhms_to_datetime("2015-09-14 00:00:00"), datetimes.ymdhms_to_datetime("2015-09-28 00:00:00")]}
+    output_dir = tempfile.mkdtemp()
+    for processes in [1, 2]:
+        results = batch.render_batch([dict(spec, fname = "events {0}".format(processes)), dict(spec, minor_granularity = "weeks", fname = "broken")],
+                                     processes = processes, output_dir = output_dir)
+        assert results[0]["error"] is None and results[0]["path"] == os.path.join(output_dir, "events {0}.pdf".format(processes))
+        assert os.path.exists(results[0]["path"])
+        assert results[1]["path"] is None and "Unsupported Minor Frequency" in results[1]["error"] #reported, not raised
+    png = batch.render_batch([dict(spec, fname = "events", image_format = "png", dpi = 40)], processes = 1, output_dir = output_dir)[0]
+    assert png["error"] is None and png["path"] == os.path.join(output_dir, "events.png") and os.path.exists(png["path"])
+
+    cwd = os.getcwd()
+    os.chdir(tempfile.mkdtemp())
+    try:
+        result = batch.render_batch([spec], processes = 1)[0] #no fname
+        assert result["error"] is None and result["path"] == os.path.abspath("foo.pdf") and os.path.exists(result["path"])
+    finally:
+        os.chdir(cwd)
+
+
+def test_long_format():
+    data = _fixture(n_keys = 8, n = 5000)
+    table = data["table"]
+    for minor_granularity in ["minutes", "hours", "days"]:
+        _assert_same_windows(aggregation.event_frequency_counts(data["events_dict"], minor_granularity, _start_dates, _end_dates),
+                             aggregation.event_frequency_counts(LongFormat(table, value_column = None), minor_granularity, _start_dates, _end_dates))
+        _assert_same_windows(aggregation.state_transitions(data["states_dict"], minor_granularity, _start_dates, _end_dates),
+                             aggregation.state_transitions(LongFormat(table), minor_granularity, _start_dates, _end_dates))
+
+    ordered = LongFormat(table, key_order = ["process 3", "nobody"])
+    assert ordered.event_frequency_counts("hours", _start_dates, _end_dates)["nobody"] is None
+
+
+def test_raw_long_format_tables():
+    import pandas
+    records = _fixture(n_keys = 5, n = 2000, seed = 7)["table"].view(numpy.recarray)
+    frame = pandas.DataFrame(dict((name, records[name]) for name in records.dtype.names))
+
+    expected = aggregation.state_transitions(LongFormat(records), "hours", _start_dates, _end_dates)
+    for table in [frame, records]: #not wrapped in a LongFormat
+        _assert_same_windows(expected, aggregation.state_transitions(table, "hours", _start_dates, _end_dates))
+        fname = os.path.join(tempfile.mkdtemp(), "table")
+        graphing.plot_event_frequency(table, "days", "hours", _start_dates, _end_dates, save_instead_plot = True, fname = fname + "_events")
+        graphing.state_diagram(table, "days", "hours", _start_dates, _end_dates, save_instead_plot = True, fname = fname + "_states")
+        assert os.path.exists(fname + "_events.pdf") and os.path.exists(fname + "_states.pdf")
+
+
+def test_rollup():
+    data = _fixture(days = 90, seed = 1)
+    events_dict, ts_dict = data["events_dict"], data["states_dict"]
+    #windows on and off bucket boundaries, so both the precomputed buckets and the partial edge buckets are used
+    start_dates = [datetimes.ymdhms_to_datetime("2015-09-01 00:00:00"), datetimes.ymdhms_to_datetime("2015-09-14 13:27:05"), datetimes.ymdhms_to_datetime("2015-10-02 23:59:59")]
+    end_dates = [datetimes.ymdhms_to_datetime("2015-10-01 00:00:00"), datetimes.ymdhms_to_datetime("2015-11-20 08:00:01"), datetimes.ymdhms_to_datetime("2015-10-03 00:00:30")]
+
+    path = os.path.join(tempfile.mkdtemp(), "rollup.npz")
+    Rollup.from_state_dict(ts_dict).save(path)
+    states, events = Rollup.load(path), Rollup.from_event_dict(events_dict)
+    for minor_granularity in ["hours", "days", "months"]:
+        _assert_same_windows(aggregation.event_frequency_counts(events_dict, minor_granularity, start_dates, end_dates),
+                             aggregation.event_frequency_counts(events, minor_granularity, start_dates, end_dates))
+        _assert_same_windows(aggregation.state_transitions(ts_dict, minor_granularity, start_dates, end_dates),
+                             aggregation.state_transitions(states, minor_granularity, start_dates, end_dates))
+    annotations = aggregation.annotation_events(states, start_dates, end_dates)
+    _assert_same_windows(aggregation.annotation_events(ts_dict, start_dates, end_dates), annotations)
+    assert list(annotations["process 1"][0][1]) == ["restart", "upgrade"] and annotations["process 2"] is None
+
+    #numeric event_ts labels are kept as values, not category codes
+    numeric = {"process 1" : dict(ts_dict["process 1"], event_ts = [(datetimes.ymdhms_to_datetime("2015-09-03 10:00:00"), 7),
+                                                                    (datetimes.ymdhms_to_datetime("2015-10-02 23:59:59"), 8)])}
+    numeric_path = os.path.join(tempfile.mkdtemp(), "numeric.npz")
+    Rollup.from_state_dict(numeric).save(numeric_path)
+    expected = aggregation.annotation_events(numeric, start_dates, end_dates)
+    for source in [Rollup.from_state_dict(numeric), Rollup.load(numeric_path), KeyedSeries.from_state_dict(numeric)]:
+        _assert_same_windows(expected, aggregation.annotation_events(source, start_dates, end_dates))
+    assert [list(labels) for times, labels in expected["process 1"]] == [[7], [8], [8]]
+
+
+def test_incremental_counts():
+    events_dict = _fixture(seed = 2)["events_dict"]
+    incremental = IncrementalCounts("hours", _start_dates, _end_dates, key_order = ["process 1", "process 2", "nobody"])
+    for start in range(0, 3000, 150): #out of order within each append, in order across them
+        incremental.append(dict((k, list(reversed(v[start:start + 150]))) for k, v in events_dict.items()))
+    expected = aggregation.event_frequency_counts(dict(events_dict, nobody = []), "hours", _start_dates, _end_dates)
+    got = aggregation.event_frequency_counts(incremental, "hours", _start_dates, _end_dates)
+    _assert_same_windows(expected, got)
+    again = aggregation.event_frequency_counts(incremental, "hours", _start_dates, _end_dates)
+    assert numpy.shares_memory(again["process 1"][0][1], got["process 1"][0][1]) #views of the kept counts, not copies
+    incremental.append({"process 1" : [datetimes.ymdhms_to_datetime("2015-11-30 23:00:00")]}) #past the capacity of the second window
+    bucket_starts, bucket_counts = aggregation.event_frequency_counts(incremental, "hours", _start_dates, _end_dates)["process 1"][1]
+    assert bucket_starts[-1] == numpy.datetime64('2015-11-30T23:00', 'ns') and bucket_counts[-1] == 1
+    assert len(bucket_starts) == len(bucket_counts) and bucket_counts.sum() == expected["process 1"][1][1].sum() + 1
+
+    late = IncrementalCounts("hours", _start_dates, _end_dates, allowed_lateness = datetime.timedelta(hours=1))
+    late.append({"process 1" : [datetimes.ymdhms_to_datetime("2015-09-02 10:00:00")]})
+    assert late.append({"process 1" : [datetimes.ymdhms_to_datetime("2015-09-02 09:30:00"), datetimes.ymdhms_to_datetime("2015-09-02 08:00:00")]}) == 1
+    assert late.late_counts["process 1"] == 1
+
+
+def test_high_volume():
+    columns = numpy.array([0, 0, 0, 0, 1, 1, 3])
+    values = numpy.array([1., 5., -2., 0., 7., 7., 2.])
+    assert list(graphing._extreme_points(columns, values)) == [0, 1, 2, 3, 4, 5, 6]
+    assert list(graphing._extreme_points(numpy.zeros(6, dtype='int64'), numpy.array([3., 1., 2., 9., 2., 4.]))) == [0, 1, 3, 5] #first, lowest, highest, last
+    assert list(graphing._distinct_pixels(numpy.array([0, 0, 1, 1]), numpy.array([2, 2, 2, 3]), 10)) == [0, 2, 3]
+
+    rng = numpy.random.RandomState(3)
+    keys = numpy.array(["process {0}".format(i) for i in rng.randint(0, 50, 20000)])
+    times = (numpy.datetime64('2015-09-01', 's') + rng.randint(0, 30*86400, 20000)).astype('datetime64[ns]')
+    table = {"key" : keys, "timestamp" : times, "value" : rng.randint(0, 3, 20000).astype(float)}
+    annotations = {"key" : keys[:500], "timestamp" : times[:500], "label" : numpy.array(["restart"]*500)}
+    start_dates = [datetimes.ymdhms_to_datetime("2015-09-01 00:00:00"), datetimes.ymdhms_to_datetime("2015-09-14 12:00:00")]
+    end_dates = [datetimes.ymdhms_to_datetime("2015-09-14 00:00:00"), datetimes.ymdhms_to_datetime("2015-10-01 00:00:00")]
+    fname = os.path.join(tempfile.mkdtemp(), "high_volume")
+    graphing.state_diagram(LongFormat(table, events = LongFormat(annotations, value_column = "label")), "days", "minutes", start_dates, end_dates,
+                           save_instead_plot = True, fname = fname, high_volume = True, rasterize = True)
+    assert os.path.exists(fname + ".pdf")
+    graphing.plot_event_frequency(LongFormat(table, value_column = None), "days", "hours", start_dates, end_dates,
+                                  save_instead_plot = True, fname = fname, high_volume = True, image_format = "png", dpi = 80)
+    assert os.path.exists(fname + ".png")
+
+
+def test_profiled_graphs():
+    ts_dict = {"process 1" : [datetimes.ymdhms_to_datetime("2015-09-{0:02d} 00:00:00".format(j)) for j in range(1, 29)], "process 2" : []}
+    start_dates = [datetimes.ymdhms_to_datetime("2015-09-01 00:00:00"), datetimes.ymdhms_to_datetime("2015-09-14 00:00:00")]
+    end_dates = [datetimes.ymdhms_to_datetime("2015-09-14 00:00:00"), datetimes.ymdhms_to_datetime("2015-09-28 00:00:00")]
+    path = os.path.join(tempfile.mkdtemp(), "report.json")
+    with profiling.profile(path) as prof:
+        graphing.plot_event_frequency(ts_dict, "days", "hours", start_dates, end_dates, save_instead_plot = True, fname = os.path.join(tempfile.mkdtemp(), "profiled"))
+    assert [p["phase"] for p in prof.phases] == ["aggregate", "draw", "layout", "save"]
+    assert [(c["key"], c["window"], c["points"]) for c in prof.counts] == [("process 1", 0, 13*24 + 1), ("process 1", 1, 14*24 + 1)]
+    assert os.path.exists(path)
+
+
 test_state_diagram()
 test_event_frequency_diagram()
-
+test_event_frequency_counts()
+test_state_transitions()
+test_chunked_inputs()
+test_keyed_series()
+test_event_store()
+test_render_batch()
+test_long_format()
+test_raw_long_format_tables()
+test_rollup()
+test_incremental_counts()
+test_high_volume()
+test_profiled_graphs()
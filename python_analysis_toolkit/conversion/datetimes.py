@@ -2,6 +2,7 @@ from datetime import datetime
 import time
 import pytz
 from datetime import timedelta
+import numpy
 
 """
 To datetime
@@ -31,9 +32,214 @@ def ymdhms_to_epoch(input_str):
     return int(time.mktime(ymdhms_to_datetime(time.strptime(input_str, '%Y-%m-%d %H:%M:%S'))))
 
 def ymdhms_timezone_dst_to_epoch(input_str,  tz="US/Eastern"):
-    return datetime_in_utc_to_epoch(datetime_timezone_dst_to_utc_datetime(ymdhms_to_datetime(input_str), kill_utc_tz = False))
+    return datetime_in_utc_to_epoch(datetime_timezone_dst_to_utc_datetime(ymdhms_to_datetime(input_str), interpret_as_tz = tz, kill_utc_tz = False))
 
 """Other"""
 def is_weekday(dt):
     """returns whether the datetime is a weekday"""
-    return dt.isoweekday() in range(1, 6)
\ No newline at end of file
+    return dt.isoweekday() in range(1, 6)
+
+"""
+Vectorized (array in, array out) versions of the above.
+All of these treat naive timestamps as UTC, like epoch_to_datetime does.
+"""
+
+_YMDHMS_LEN = 19 #len("YYYY-mm-dd HH:MM:SS")
+_DIGIT_POSITIONS = [0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18]
+_SEPARATORS = {4: '-', 7: '-', 10: ' ', 13: ':', 16: ':'}
+_DAYS_BEFORE_MONTH = numpy.array([0, 0, 31, 59, 90, 120, 151, 181, 212, 243, 273, 304, 334], dtype='int64') #indexed by month, 1-12
+_DAYS_IN_MONTH = numpy.array([0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31], dtype='int64')
+_NS_PER_SECOND = 10**9
+_NS_PER_DAY = 86400 * _NS_PER_SECOND
+
+def _as_ymdhms_chars(input_strs):
+    """returns a (n, 19) integer view of the characters of the input strings, or None if they are not fixed width 19 character strings"""
+    arr = numpy.ascontiguousarray(input_strs).ravel()
+    if arr.dtype.kind == 'U' and arr.dtype.itemsize == 4*_YMDHMS_LEN:
+        return arr.view('uint32').reshape(-1, _YMDHMS_LEN) #ucs4 code points; no need to encode
+    if arr.dtype.kind == 'S' and arr.dtype.itemsize == _YMDHMS_LEN:
+        return arr.view('uint8').reshape(-1, _YMDHMS_LEN)
+    return None #shorter strings are zero padded, so they fail the digit and separator checks in _parse_ymdhms_chars
+
+def _parse_ymdhms_chars(b):
+    """integer arithmetic on the digit columns of a (n, 19) character array. returns int64 epoch ns or None if malformed"""
+    for pos, sep in _SEPARATORS.items():
+        if not (b[:, pos] == ord(sep)).all():
+            return None
+    digits = b[:, _DIGIT_POSITIONS].astype('int64') - ord('0')
+    if ((digits < 0) | (digits > 9)).any():
+        return None
+    year = digits[:, 0]*1000 + digits[:, 1]*100 + digits[:, 2]*10 + digits[:, 3]
+    month = digits[:, 4]*10 + digits[:, 5]
+    day = digits[:, 6]*10 + digits[:, 7]
+    hour = digits[:, 8]*10 + digits[:, 9]
+    minute = digits[:, 10]*10 + digits[:, 11]
+    second = digits[:, 12]*10 + digits[:, 13]
+    if ((month < 1) | (month > 12) | (day < 1) | (hour > 23) | (minute > 59) | (second > 59)).any():
+        return None
+
+    #days since epoch via the proleptic gregorian calendar
+    leap = ((year % 4 == 0) & (year % 100 != 0)) | (year % 400 == 0)
+    if (day > _DAYS_IN_MONTH[month] + ((month == 2) & leap)).any():
+        return None
+    y = year - 1
+    days = 365*(year - 1970) + (y//4 - y//100 + y//400) - (1969//4 - 1969//100 + 1969//400)
+    days += _DAYS_BEFORE_MONTH[month] + ((month > 2) & leap) + day - 1
+    return days*_NS_PER_DAY + (hour*3600 + minute*60 + second)*_NS_PER_SECOND
+
+def ymdhms_array_to_epoch_ns(input_strs):
+    """
+        Parses an array or iterable of '%Y-%m-%d %H:%M:%S' strings into int64 nanoseconds since the epoch
+
+        Well formed input takes a fixed width fast path that does integer arithmetic on the digit columns of the whole array at once.
+        Anything else (other widths, fractional seconds, bad values) falls back to numpy's datetime64 parser, which raises on garbage.
+
+        Args:
+           input_strs : numpy array (str or bytes dtype) or any iterable of strings
+
+        Returns:
+           numpy int64 array of epoch nanoseconds, same length as input_strs
+    """
+    arr = numpy.asarray(input_strs if isinstance(input_strs, numpy.ndarray) else list(input_strs))
+    if len(arr) == 0:
+        return numpy.zeros(0, dtype='int64')
+    chars = _as_ymdhms_chars(arr)
+    parsed = _parse_ymdhms_chars(chars) if chars is not None else None
+    if parsed is not None:
+        return parsed
+    if arr.dtype.kind == 'S':
+        arr = numpy.char.decode(arr, 'ascii')
+    return numpy.array(arr, dtype='datetime64[ns]').view('int64')
+
+def ymdhms_array_to_datetime64(input_strs, truncate_time = False):
+    """array version of ymdhms_to_datetime. returns a datetime64[ns] array"""
+    d = ymdhms_array_to_epoch_ns(input_strs).view('datetime64[ns]')
+    return truncate_datetime64(d) if truncate_time else d
+
+def ymdhms_array_to_epoch(input_strs):
+    """array version of ymdhms_to_epoch, but with the strings interpreted as UTC. returns int64 seconds since the epoch"""
+    return ymdhms_array_to_epoch_ns(input_strs) // _NS_PER_SECOND
+
+def epoch_array_to_datetime64(input_epochs, truncate_time = False):
+    """array version of epoch_to_datetime. input_epochs are seconds (ints or floats). returns a datetime64[ns] array"""
+    e = numpy.asarray(input_epochs)
+    if e.dtype.kind == 'f':
+        ns = numpy.round(e*_NS_PER_SECOND).astype('int64')
+    else:
+        ns = e.astype('int64')*_NS_PER_SECOND
+    d = ns.view('datetime64[ns]')
+    return truncate_datetime64(d) if truncate_time else d
+
+def truncate_datetime64(dts, unit = 'D'):
+    """
+        floors an array of datetime64s to the start of their unit (numpy unit codes: 'M' months, 'D' days, 'h' hours, 'm' minutes, 's' seconds)
+        the default matches the truncate_time flag of the scalar functions. returns a datetime64[ns] array
+    """
+    return numpy.asarray(dts, dtype='datetime64[ns]').astype('datetime64[{0}]'.format(unit)).astype('datetime64[ns]')
+
+def is_weekday_array(dts):
+    """array version of is_weekday. takes datetime64s (or anything numpy can convert to them) and returns a boolean mask"""
+    days = numpy.asarray(dts, dtype='datetime64[ns]').astype('datetime64[D]').view('int64')
+    return (days + 3) % 7 < 5 #1970-01-01 was a thursday, so (days + 3) % 7 is 0 on mondays
+
+"""
+Vectorized timezone/DST handling.
+A timezone is turned into a table of its UTC transition instants and the UTC offset that starts at each one (cached per timezone),
+and whole arrays of naive local times are converted against that table with binary search instead of one localize/normalize per element.
+"""
+
+_NAT = numpy.iinfo('int64').min
+_DST_POLICIES = ("raise", "earlier", "later", "NaT")
+_tz_tables = {}
+
+def _timedelta_ns(td):
+    return (td.days*86400 + td.seconds)*_NS_PER_SECOND + td.microseconds*1000
+
+def _tz_transition_table(interpret_as_tz):
+    """
+        returns (utc_transitions, offsets) for a pytz timezone name, both int64 ns arrays of the same length.
+        offsets[i] is the UTC offset in effect from utc_transitions[i] until utc_transitions[i+1]; utc_transitions[0] is -inf.
+    """
+    if interpret_as_tz not in _tz_tables:
+        tz = pytz.timezone(interpret_as_tz)
+        if hasattr(tz, "_utc_transition_times"):
+            utc_transitions = numpy.array([_NAT] + [numpy.datetime64(t, 'ns').astype('int64') for t in tz._utc_transition_times[1:]], dtype='int64')
+            offsets = numpy.array([_timedelta_ns(info[0]) for info in tz._transition_info], dtype='int64')
+        else: #StaticTzInfo, pytz.utc
+            utc_transitions = numpy.array([_NAT], dtype='int64')
+            offsets = numpy.array([_timedelta_ns(tz.utcoffset(datetime(1970, 1, 1)))], dtype='int64')
+        _tz_tables[interpret_as_tz] = (utc_transitions, offsets)
+    return _tz_tables[interpret_as_tz]
+
+def _apply_dst_policy(utc, bad, earlier, later, policy, local, error):
+    if not bad.any():
+        return
+    if policy == "raise":
+        first = numpy.datetime64(int(local[bad][0]), 'ns')
+        raise error("{0} ({1} of {2} values are affected)".format(first, int(bad.sum()), len(local)))
+    elif policy == "earlier":
+        utc[bad] = earlier[bad]
+    elif policy == "later":
+        utc[bad] = later[bad]
+    else:
+        utc[bad] = _NAT
+
+def local_array_to_utc_epoch_ns(local_times, interpret_as_tz = "US/Eastern", ambiguous = "raise", nonexistent = "raise", return_masks = False):
+    """
+        Array version of datetime_timezone_dst_to_utc_datetime: interprets naive local times as wall clock times in interpret_as_tz
+        and converts all of them to UTC in one vectorized pass.
+
+        Args:
+           local_times : datetime64s, epoch ns ints, or anything numpy can turn into datetime64[ns] (lists of datetimes, strings)
+           interpret_as_tz (str) : a pytz timezone name
+           ambiguous (str) : what to do with wall times that happen twice (when the clocks fall back):
+                             "raise" (pytz.exceptions.AmbiguousTimeError, like the scalar function), "earlier" or "later" (pick the earlier/later UTC instant), "NaT"
+           nonexistent (str) : same options for wall times that are skipped (when the clocks spring forward), raising pytz.exceptions.NonExistentTimeError.
+                               "earlier" is the earlier UTC instant, which reads the wall time with the offset from after the jump, and "later"
+                               reads it with the offset from before the jump: 2015-03-08 02:30 US/Eastern is 06:30 UTC (as EDT) with "earlier"
+                               and 07:30 UTC (as EST) with "later".
+                               for both, "earlier"/"later" are the smaller/larger of pytz's tz.localize(dt, is_dst=True) and is_dst=False
+           return_masks (boolean) : also return the boolean masks of which elements were ambiguous and nonexistent
+
+        Returns:
+           int64 array of UTC epoch ns (NaT where the policy says so), or (utc, ambiguous_mask, nonexistent_mask) if return_masks
+    """
+    if ambiguous not in _DST_POLICIES or nonexistent not in _DST_POLICIES:
+        raise Exception("Unsupported DST policy, must be one of {0}".format(_DST_POLICIES))
+    local = numpy.asarray(local_times)
+    local = local.astype('datetime64[ns]').view('int64') if local.dtype.kind in 'MUSO' else local.astype('int64')
+    utc_transitions, offsets = _tz_transition_table(interpret_as_tz)
+    n = len(offsets)
+
+    #local wall clock start of each period; the period before a transition can also contain local times past this point (fall back)
+    local_starts = utc_transitions + offsets
+    local_starts[0] = _NAT
+    idx = numpy.searchsorted(local_starts, local, side='right') - 1
+    prev_idx = numpy.maximum(idx - 1, 0)
+    next_idx = numpy.minimum(idx + 1, n - 1)
+    next_transition = numpy.where(idx + 1 < n, utc_transitions[next_idx], numpy.iinfo('int64').max)
+
+    utc = local - offsets[idx]
+    in_period = utc < next_transition #false: the wall time falls into the gap before the next transition
+    in_prev_period = (idx > 0) & (local - offsets[prev_idx] < utc_transitions[idx]) #true: the previous period also contains this wall time
+
+    ambiguous_mask = in_period & in_prev_period
+    nonexistent_mask = ~in_period
+    other = numpy.where(ambiguous_mask, local - offsets[prev_idx], local - offsets[next_idx])
+    earlier = numpy.minimum(utc, other)
+    later = numpy.maximum(utc, other)
+    _apply_dst_policy(utc, ambiguous_mask, earlier, later, ambiguous, local, pytz.exceptions.AmbiguousTimeError)
+    _apply_dst_policy(utc, nonexistent_mask, earlier, later, nonexistent, local, pytz.exceptions.NonExistentTimeError)
+    utc[local == _NAT] = _NAT
+    return (utc, ambiguous_mask, nonexistent_mask) if return_masks else utc
+
+def local_array_to_utc_datetime64(local_times, interpret_as_tz = "US/Eastern", ambiguous = "raise", nonexistent = "raise"):
+    """same as local_array_to_utc_epoch_ns, but returns a naive (UTC) datetime64[ns] array, i.e. datetime_timezone_dst_to_utc_datetime with kill_utc_tz"""
+    return local_array_to_utc_epoch_ns(local_times, interpret_as_tz, ambiguous, nonexistent).view('datetime64[ns]')
+
+def ymdhms_array_timezone_dst_to_epoch(input_strs, tz = "US/Eastern", ambiguous = "raise", nonexistent = "raise"):
+    """array version of ymdhms_timezone_dst_to_epoch. returns float64 seconds since the epoch, NaN where the DST policy gives NaT"""
+    utc = local_array_to_utc_epoch_ns(ymdhms_array_to_epoch_ns(input_strs), tz, ambiguous, nonexistent)
+    epochs = utc / float(_NS_PER_SECOND)
+    epochs[utc == _NAT] = numpy.nan
+    return epochs
@@ -0,0 +1,164 @@
+import os
+import glob
+import json
+import hashlib
+import numpy as np
+
+"""
+Content addressed, on disk cache for clustering and PCA results.
+
+An entry is a dictionary of numpy arrays saved as one .npz file, named after the computation and the sha1 of
+(the input data's fingerprint, the computation's parameters). Unchanged data therefore hits the cache across processes and days,
+and any change to the data or the parameters misses it. Once the directory holds more than max_bytes,
+the least recently used entries are deleted.
+"""
+
+_hash_chunk_bytes = 64*2**20 #arrays are hashed this many bytes at a time, so a memmap is never read into memory whole
+_sample_blocks = 16 #a memmap's fingerprint reads this many evenly spaced blocks of rows...
+_sample_block_rows = 64 #...of this many rows each, contiguous so each block is a few pages
+
+
+def _mapped_file(a):
+    """(path, byte position in the file) of an array that is (a view of) a numpy.memmap, None for anything else"""
+    root = a
+    while isinstance(root.base, np.ndarray):
+        root = root.base
+    if not isinstance(root, np.memmap) or getattr(root, "filename", None) is None:
+        return None
+    return root.filename, root.offset + a.__array_interface__["data"][0] - root.__array_interface__["data"][0]
+
+def _row_blocks(a):
+    """all of a, _hash_chunk_bytes at a time"""
+    rows = max(1, _hash_chunk_bytes // max(1, a[:1].nbytes))
+    return (a[start:start + rows] for start in range(0, len(a), rows))
+
+def _sampled_rows(a):
+    """evenly spaced blocks of rows of a, so a change to the file that keeps its size and modification time can still show"""
+    rows = len(a)
+    starts = np.unique(np.linspace(0, max(rows - _sample_block_rows, 0), _sample_blocks).astype('int64'))
+    return [a[s:s + _sample_block_rows] for s in starts]
+
+
+def fingerprint(data_matrix):
+    """
+        hex digest of the shape, dtype and contents of an array (or numpy.memmap).
+        An array in memory is hashed whole (sha1). A memmap is not read whole on every lookup: it is identified by its file
+        (path, size, modification time), its position and layout in the file, and a sample of its rows, so a cache hit costs a stat and a few pages.
+        Writing to a mapped file changes its modification time; a rewrite that keeps the size and, within the file system's timestamp resolution,
+        the modification time is only noticed if it touches the sampled rows.
+    """
+    a = np.asarray(data_matrix)
+    header = [list(a.shape), a.dtype.str]
+    if a.ndim == 0:
+        a = a.reshape(1)
+    mapped = _mapped_file(a)
+    if mapped is not None:
+        try:
+            stat = os.stat(mapped[0])
+            header += [list(a.strides), mapped[0], mapped[1], stat.st_size, getattr(stat, "st_mtime_ns", stat.st_mtime)]
+        except OSError: #the file is gone, the mapping is all there is
+            mapped = None
+    h = hashlib.sha1(json.dumps(header).encode())
+    for block in _row_blocks(a) if mapped is None else _sampled_rows(a):
+        h.update(np.ascontiguousarray(block).data)
+    return h.hexdigest()
+
+
+class ResultCache(object):
+    """
+        Pass one to kmpp, minibatch_kmpp (clustering) or pca_biplot_with_clustering (dimensionality) as cache.
+
+        Attributes:
+            path (string): the cache directory, created if needed
+            max_bytes (int): size bound of the directory, default 1 GB
+            hits, misses (int): lookups since this object was created
+            warm_starts (int): misses that k means seeded from the centroids of a similar cached matrix
+    """
+    def __init__(self, path, max_bytes = 2**30):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.warm_starts = 0
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    def key(self, name, data_fingerprint, params):
+        """the entry key of computation name on the data with this fingerprint, with params (a dictionary of JSON serializable values)"""
+        return hashlib.sha1(json.dumps([name, data_fingerprint, sorted(params.items())]).encode()).hexdigest()
+
+    def _file(self, name, key):
+        return os.path.join(self.path, "{0}-{1}.npz".format(name, key))
+
+    def _files(self, name = None):
+        """entry files (of one computation, or all), most recently used first"""
+        files = glob.glob(os.path.join(self.path, "{0}-*.npz".format(name if name is not None else "*")))
+        entries = []
+        for f in files:
+            try:
+                entries.append((os.path.getmtime(f), os.path.getsize(f), f))
+            except OSError: #deleted by another process meanwhile
+                continue
+        return sorted(entries, reverse=True)
+
+    def get(self, name, key):
+        """the cached dictionary of arrays, or None. a hit marks the entry as recently used"""
+        f = self._file(name, key)
+        try:
+            with np.load(f) as npz:
+                result = dict((k, npz[k]) for k in npz.files)
+            os.utime(f, None)
+        except (IOError, OSError, ValueError): #missing, evicted meanwhile, or unreadable
+            self.misses += 1
+            return None
+        self.hits += 1
+        return result
+
+    def put(self, name, key, arrays):
+        """stores a dictionary of arrays, then evicts least recently used entries until the cache fits in max_bytes"""
+        f = self._file(name, key)
+        tmp = "{0}.{1}.tmp".format(f, os.getpid())
+        with open(tmp, "wb") as out:
+            np.savez(out, **arrays)
+        os.replace(tmp, f) #readers never see a half written entry
+        self._evict()
+
+    def _evict(self):
+        entries = self._files()
+        total = sum(e[1] for e in entries)
+        for mtime, size, f in reversed(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(f)
+            except OSError:
+                pass
+            total -= size
+
+    def recent(self, name, limit = 20, arrays = None):
+        """
+            the most recently used entries of computation name, newest first, as dictionaries of arrays.
+            arrays: optional list of the arrays to read (e.g. leave out the labels); entries without some of them are returned without them
+        """
+        for mtime, size, f in self._files(name)[:limit]:
+            try:
+                with np.load(f) as npz: #closed before the entry is yielded, so a caller that stops early leaves no file open
+                    entry = dict((k, npz[k]) for k in npz.files if arrays is None or k in arrays)
+            except (IOError, OSError, ValueError):
+                continue
+            yield entry
+
+    def clear(self):
+        for mtime, size, f in self._files():
+            os.remove(f)
+
+    def stats(self):
+        """{"hits", "misses", "hit_rate", "warm_starts", "entries", "bytes"}"""
+        entries = self._files()
+        lookups = self.hits + self.misses
+        return {"hits" : self.hits,
+                "misses" : self.misses,
+                "hit_rate" : float(self.hits)/lookups if lookups else 0.0,
+                "warm_starts" : self.warm_starts,
+                "entries" : len(entries),
+                "bytes" : sum(e[1] for e in entries)}
@@ -1,12 +1,194 @@
-from sklearn.cluster import KMeans
+import contextlib
+import numpy as np
 
-def kmpp(data_matrix, k):
+from python_analysis_toolkit.machine_learning.cache import fingerprint
+
+_warm_start_tolerance = 0.1 #a cached matrix is "similar" if every column mean and std is within this many (new) column stds of the new one
+
+"""
+Internal Helper Functions
+"""
+
+def _column_summary(data_matrix, batch_size = 10000):
+    """2 x f array of the column means and standard deviations (after nan_to_num), computed a batch of rows at a time"""
+    rows = len(data_matrix)
+    sums, squares = 0.0, 0.0
+    for start in range(0, rows, batch_size):
+        block = np.nan_to_num(np.asarray(data_matrix[start:start + batch_size], dtype='float64'))
+        sums = sums + block.sum(axis=0)
+        squares = squares + (block**2).sum(axis=0)
+    means = sums/rows
+    return np.vstack([means, np.sqrt(np.maximum(squares/rows - means**2, 0))])
+
+def _warm_start_centroids(cache, name, k, summary):
+    """centroids of the most recently used cached clustering (same k and features) of a matrix whose column summary is close to summary"""
+    scale = np.maximum(summary[1], 1e-12)
+    for entry in cache.recent(name, arrays = ["summary", "centroids"]):
+        if "summary" not in entry: #computed without warm_start
+            continue
+        cached = entry["summary"]
+        if cached.shape == summary.shape and entry["centroids"].shape[0] == k and np.all(np.abs(cached - summary) <= _warm_start_tolerance*scale):
+            return entry["centroids"]
+    return None
+
+def _cached_clustering(name, fit, data_matrix, k, params, cache, warm_start):
+    """fit(init) -> (centroids, labels), where init is None or starting centroids. looks the result up in cache first, and stores it after"""
+    if cache is None:
+        return fit(None)
+    params = dict(params, k = k)
+    key = cache.key(name, fingerprint(data_matrix), params)
+    hit = cache.get(name, key)
+    if hit is not None:
+        return hit["centroids"], hit["labels"]
+    entry = {}
+    init = None
+    if warm_start: #the summary is another pass over the matrix, so only warm starting calls pay for it (and can seed later ones)
+        entry["summary"] = _column_summary(data_matrix)
+        init = _warm_start_centroids(cache, name, k, entry["summary"])
+    if init is not None:
+        cache.warm_starts += 1
+    entry["centroids"], entry["labels"] = fit(init)
+    cache.put(name, key, entry)
+    return entry["centroids"], entry["labels"]
+
+_sweep_data = {} #the matrix and silhouette sample of a k_sweep worker, set once per process instead of pickled with every task
+
+def _init_sweep_worker(data_matrix, sample):
+    _sweep_data.update(data = data_matrix, sample = sample, one_thread = True)
+
+@contextlib.contextmanager
+def _unlimited():
+    yield
+
+def _worker_threads():
+    """
+        limits BLAS and OpenMP to one thread in a k_sweep worker, which already has a core to itself; a no-op outside the pool.
+        the limit is set on the loaded libraries with threadpoolctl: by the time a forked worker runs, numpy has read OMP_NUM_THREADS long ago
+    """
+    if not _sweep_data.get("one_thread"):
+        return _unlimited()
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError: #ships with scikit-learn 0.21+. older KMeans is single threaded apart from BLAS
+        return _unlimited()
+    return threadpool_limits(1)
+
+def _fit_restart(task):
+    """one k-means++ initialization of one K. returns (k, inertia, centroids)"""
+    from sklearn.cluster import KMeans
+    k, seed = task
+    with _worker_threads():
+        kmeans = KMeans(init='k-means++', n_clusters=k, n_init=1, random_state=seed).fit(_sweep_data["data"])
+    return k, kmeans.inertia_, kmeans.cluster_centers_
+
+def _best_restarts(restarts):
+    """{k : (inertia, centroids)} of the lowest inertia restart of each k"""
+    best = {}
+    for k, inertia, centroids in restarts:
+        if k not in best or inertia < best[k][0]:
+            best[k] = (inertia, centroids)
+    return best
+
+def _nearest_centroid(points, centroids):
+    distances = (points**2).sum(axis=1)[:, np.newaxis] - 2*np.dot(points, centroids.T) + (centroids**2).sum(axis=1)
+    return np.argmin(distances, axis=1)
+
+def _sample_silhouette(task):
+    """silhouette of the sample, labelled by the nearest of the given centroids. returns (k, score)"""
+    from sklearn.metrics import silhouette_score
+    k, centroids = task
+    sample = _sweep_data["sample"]
+    with _worker_threads():
+        labels = _nearest_centroid(sample, centroids)
+        if len(np.unique(labels)) < 2:
+            return k, float('nan')
+        return k, silhouette_score(sample, labels)
+
+
+"""
+Public Functions
+"""
+
+def kmpp(data_matrix, k, cache = None, warm_start = False):
     """Clusters a data matrix
        kmeans uses eudlidean distances by default http://scikit-learn.org/stable/modules/clustering.html#k-means
        http://scikit-learn.org/stable/modules/generated/sklearn.cluster.KMeans.html#sklearn.cluster.KMeans
+
+       cache: optional cache.ResultCache. the result for an unchanged data_matrix and k is read from it instead of recomputed
+       warm_start: on a cache miss, seed KMeans (one run instead of 10 k-means++ restarts) with the centroids of the most recently used
+                   cached clustering of a similar matrix (same features and k, column means and stds within 10% of a std), if there is one.
+                   only clusterings cached with warm_start are candidates, since only those record the column means and stds
+    """
+    def fit(init):
+        from sklearn.cluster import KMeans #deferred, sklearn is slow to import
+        if init is None:
+            kmeans = KMeans(init='k-means++', n_clusters=k, n_init=10)
+        else:
+            kmeans = KMeans(init=init, n_clusters=k, n_init=1)
+        c = kmeans.fit(data_matrix)
+        return c.cluster_centers_, c.labels_
+    return _cached_clustering("kmpp", fit, data_matrix, k, {}, cache, warm_start)
+
+def minibatch_kmpp(data_matrix, k, batch_size = 10000, random_state = None, cache = None, warm_start = False):
+    """Clusters a data matrix too large to cluster in one go (e.g. a numpy.memmap): MiniBatchKMeans, fed batch_size rows at a time.
+       nans and infs in the matrix are cleaned a batch at a time, the matrix itself is not modified.
+       http://scikit-learn.org/stable/modules/generated/sklearn.cluster.MiniBatchKMeans.html
+
+       cache, warm_start: as for kmpp
+    """
+    def fit(init):
+        from sklearn.cluster import MiniBatchKMeans
+        rows = len(data_matrix)
+        kmeans = MiniBatchKMeans(init='k-means++' if init is None else init, n_clusters=k, batch_size=batch_size, random_state=random_state)
+        for start in range(0, rows, batch_size):
+            kmeans.partial_fit(np.nan_to_num(data_matrix[start:start + batch_size]))
+        labels = np.concatenate([kmeans.predict(np.nan_to_num(data_matrix[start:start + batch_size])) for start in range(0, rows, batch_size)])
+        return kmeans.cluster_centers_, labels
+    return _cached_clustering("minibatch_kmpp", fit, data_matrix, k, {"batch_size" : batch_size, "random_state" : random_state}, cache, warm_start)
+
+def k_sweep(data_matrix, k_values = range(2, 31), n_init = 10, processes = None, silhouette_sample_size = 5000, random_state = None):
     """
-    kmeans = KMeans(init='k-means++', n_clusters=k, n_init=10)
-    c = kmeans.fit(data_matrix)
-    centroids = c.cluster_centers_
-    labels = c.labels_
-    return centroids, labels
\ No newline at end of file
+        Purpose: evaluate k means for many K at once, to choose K.
+        Every (K, restart) pair is a separate single-init KMeans fit, spread over a process pool, so the n_init restarts of every K run in parallel too;
+        each K keeps its lowest inertia restart. Silhouettes are computed on a uniform sample of the rows, in the same pool.
+
+        Args:
+            data_matrix: n x f array without nans or infs (e.g. the PCA projection, see dimensionality.pca_k_sweep)
+            k_values: the Ks to try
+            n_init: k-means++ restarts per K
+            processes (int): worker processes, defaults to the number of cores; each runs BLAS and OpenMP on one thread. 1 runs everything in this process
+            silhouette_sample_size (int): rows the silhouette is computed on (the silhouette is quadratic in its rows)
+            random_state: seed for the restarts and the sample
+
+        Returns:
+            list of dictionaries in the order of k_values: {"k", "inertia" (of the best restart), "silhouette" (nan if every sampled row is in one cluster),
+                                                            "centroids"}
+    """
+    data_matrix = np.asarray(data_matrix)
+    k_values = list(k_values)
+    rows = len(data_matrix)
+    rng = np.random.RandomState(random_state)
+    sample = data_matrix
+    if rows > silhouette_sample_size:
+        sample = data_matrix[np.sort(rng.choice(rows, silhouette_sample_size, replace=False))]
+    seeds = rng.randint(0, 2**31 - 1, size=n_init)
+    tasks = [(k, int(seed)) for k in sorted(k_values, reverse=True) for seed in seeds] #largest (slowest) Ks first, for load balance
+
+    if processes == 1:
+        _sweep_data.update(data = data_matrix, sample = sample)
+        try:
+            restarts = [_fit_restart(t) for t in tasks]
+            best = _best_restarts(restarts)
+            silhouettes = dict(_sample_silhouette((k, best[k][1])) for k in k_values)
+        finally:
+            _sweep_data.clear()
+    else:
+        import multiprocessing
+        pool = multiprocessing.Pool(processes, initializer = _init_sweep_worker, initargs = (data_matrix, sample))
+        try:
+            best = _best_restarts(pool.imap_unordered(_fit_restart, tasks))
+            silhouettes = dict(pool.imap_unordered(_sample_silhouette, [(k, best[k][1]) for k in k_values]))
+        finally:
+            pool.close()
+            pool.join()
+    return [{"k" : k, "inertia" : best[k][0], "silhouette" : silhouettes[k], "centroids" : best[k][1]} for k in k_values]
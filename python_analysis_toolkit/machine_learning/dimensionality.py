@@ -1,16 +1,127 @@
 import numpy as np
-import matplotlib.pyplot as plt
-import hashlib
-
-from sklearn.decomposition import PCA
-from sklearn.preprocessing import normalize
-from sklearn.utils.extmath import fast_dot
 
+from python_analysis_toolkit import profiling
 from python_analysis_toolkit.machine_learning import clustering
+from python_analysis_toolkit.machine_learning.cache import fingerprint
+
+#sklearn and matplotlib are imported inside the functions that use them, so importing this module is cheap
 
 _colors = ['r', 'b', 'g', 'k', 'm', 'c', 'y']  
+_default_batch_size = 10000
+
+"""
+Internal Helper Functions
+"""
+
+def _row_batches(rows, batch_size, min_rows):
+    """slices of batch_size rows. a short last batch (fewer than min_rows; IncrementalPCA needs at least n_components rows) is merged into the one before"""
+    starts = list(range(0, rows, batch_size))
+    if len(starts) > 1 and rows - starts[-1] < min_rows:
+        starts.pop()
+    return [slice(s, e) for s, e in zip(starts, starts[1:] + [rows])]
+
+def _writable(data_matrix):
+    return isinstance(data_matrix, np.ndarray) and data_matrix.flags.writeable and data_matrix.dtype.kind == 'f'
+
+def _clean_in_place(block, mean_normalize):
+    """nan_to_num and (optionally) row mean normalization of block, vectorized and written into block"""
+    bad = ~np.isfinite(block)
+    if bad.any():
+        block[bad] = np.nan_to_num(block[bad])
+    if mean_normalize:
+        block -= np.mean(block, axis=1)[:, np.newaxis]
+    return block
 
-def pca_biplot_with_clustering(data_matrix, feature_labels, mean_normalize = False, k_means_post = True, K = 5, n_components=2, f_out = "foo"):
+def _incremental_pca(data_matrix, mean_normalize, n_components, batch_size):
+    """
+    IncrementalPCA fed batch_size rows at a time, so data_matrix can be a numpy.memmap larger than memory.
+    A writable float matrix is cleaned in place as it is read; anything else (read only memmaps, int matrices) is cleaned a batch copy at a time.
+    returns (r_loadings, transformed_matrix)
+    """
+    from sklearn.decomposition import IncrementalPCA
+    in_place = _writable(data_matrix)
+    batches = _row_batches(len(data_matrix), batch_size, n_components)
+
+    def cleaned(rows):
+        block = data_matrix[rows] if in_place else np.array(data_matrix[rows], dtype='float64')
+        return _clean_in_place(block, mean_normalize)
+
+    pca = IncrementalPCA(n_components=n_components)
+    for rows in batches:
+        pca.partial_fit(cleaned(rows))
+    r_loadings = np.transpose(pca.components_)
+    #second pass: in place the matrix is already clean
+    transformed_matrix = np.concatenate([np.dot(data_matrix[rows] if in_place else cleaned(rows), r_loadings) for rows in batches])
+    return r_loadings, transformed_matrix
+
+def _plotted_points(transformed_matrix, labels, max_plot_points, random_state):
+    """the points (and their cluster labels) to draw: all of them, or a uniform sample of max_plot_points"""
+    rows = len(transformed_matrix)
+    if max_plot_points is None or rows <= max_plot_points:
+        return np.asarray(transformed_matrix), np.asarray(labels)
+    shown = np.sort(np.random.RandomState(random_state).choice(rows, max_plot_points, replace=False))
+    return np.asarray(transformed_matrix)[shown], np.asarray(labels)[shown]
+
+def _fit_pca(data_matrix, mean_normalize, n_components, large_data, batch_size, cache):
+    """
+    PCA of data_matrix (already nan_to_num'ed, unless large_data). returns (r_loadings, transformed_matrix), from cache when it has them.
+    mean_normalize normalizes data_matrix in place
+    """
+    if cache is not None: #fingerprint before anything cleans the matrix in place
+        key = cache.key("pca", fingerprint(data_matrix), {"mean_normalize" : mean_normalize, "n_components" : n_components,
+                                                           "large_data" : large_data, "batch_size" : batch_size if large_data else None})
+        fitted = cache.get("pca", key)
+        if fitted is not None:
+            return fitted["r_loadings"], fitted["transformed_matrix"]
+
+    if large_data:
+        r_loadings, transformed_matrix = _incremental_pca(data_matrix, mean_normalize, n_components, batch_size)
+    else:
+        from sklearn.decomposition import PCA
+        if mean_normalize:   
+            data_matrix[:] = data_matrix - np.mean(data_matrix, axis=1)[:, np.newaxis]
+
+        pca = PCA(n_components=n_components)
+        pca.fit(data_matrix)
+
+        r_loadings = np.matrix.transpose(pca.components_) #components is n_components x f; transpase to get rows as features, like R does it 
+
+        transformed_matrix = np.dot(data_matrix, r_loadings)
+
+    if cache is not None:
+        cache.put("pca", key, {"r_loadings" : r_loadings, "transformed_matrix" : transformed_matrix})
+    return r_loadings, transformed_matrix
+
+def _kmeans(data_matrix, K, large_data, batch_size, random_state, cache, warm_start):
+    if large_data:
+        return clustering.minibatch_kmpp(data_matrix, K, batch_size, random_state, cache, warm_start)
+    return clustering.kmpp(data_matrix, K, cache, warm_start)
+
+def _elbow_chart(results, f_out):
+    """inertia (left axis) and silhouette (right axis) against K, written to f_out + _elbow.pdf"""
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
+    ks = [r["k"] for r in results]
+    ax.plot(ks, [r["inertia"] for r in results], "b-o")
+    ax.set_xlabel("K")
+    ax.set_ylabel("inertia", color="b")
+    ax2 = ax.twinx()
+    ax2.plot(ks, [r["silhouette"] for r in results], "r-s")
+    ax2.set_ylabel("silhouette (sampled)", color="r")
+    fig.savefig(f_out + "_elbow.pdf", format="pdf")
+    fig.clf()
+
+
+"""
+Public Functions
+"""
+
+def pca_biplot_with_clustering(data_matrix, feature_labels, mean_normalize = False, k_means_post = True, K = 5, n_components=2, f_out = "foo",
+                               large_data = False, batch_size = None, max_plot_points = None, random_state = None,
+                               cache = None, warm_start = False, profiler = None):
     """
     Inputs:
         data_matrix: numpy array of shape n x f where n is the number of samples and f is the number of features (variables)
@@ -20,6 +131,18 @@ def pca_biplot_with_clustering(data_matrix, feature_labels, mean_normalize = Fal
                       if False, it is run before the PCA, and before the mean_normalization, and then the clusters are projected into the space. 
         n_components: the number of PCA vectors you want. 
         f_out: the path to write the graph (as PDF) to
+        large_data: for matrices with millions of rows. PCA is an IncrementalPCA over batches of rows and k means is MiniBatchKMeans,
+                    so data_matrix can be a numpy.memmap. A writable float data_matrix is cleaned (nan_to_num, mean_normalize) IN PLACE instead of copied;
+                    pass a read only memmap (mode='r') or a copy to keep it as it is.
+        batch_size: rows per batch in large_data mode, default 10000
+        max_plot_points: optional; draw a uniform sample of this many points instead of all of them. clustering and PCA still use every row
+        random_state: seed for the point sample and MiniBatchKMeans
+        cache: optional cache.ResultCache. the PCA fit (loadings and projected matrix) and the clusterings of an unchanged data_matrix
+               are read from it instead of recomputed, so re-plotting costs one hash of the matrix.
+               NOTE: in large_data mode a miss cleans a writable matrix in place, so the next call fingerprints the cleaned matrix
+        warm_start: passed to kmpp / minibatch_kmpp, see clustering.kmpp
+        profiler: optional profiling.Profiler; records the time of the clean, kmeans, pca, draw and save phases and the rows and plotted points.
+                  defaults to the profiler of the enclosing profiling.profile() block, if any
         
         TODO: the graph currently only supports n=2. 
     
@@ -36,22 +159,23 @@ def pca_biplot_with_clustering(data_matrix, feature_labels, mean_normalize = Fal
         http://stackoverflow.com/questions/14716965/r-principle-component-analysis-label-of-component
         http://nxn.se/post/36838219245/loadings-with-scikit-learn-pca
     """    
-    data_matrix = np.nan_to_num(data_matrix) #clustering does not allow infs, nans
-    
-    if not k_means_post: 
-        centroids, labels = clustering.kmpp(data_matrix, K)
-        
-    if mean_normalize:   
-        for iindex, i in enumerate(data_matrix):
-            data_matrix[iindex] = i - np.mean(i)
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
 
+    profiler = profiling.current(profiler)
+    batch_size = batch_size or _default_batch_size
     rows, variables = np.shape(data_matrix)
-    pca = PCA(n_components=n_components)
-    pca.fit(data_matrix)
-    
-    r_loadings = np.matrix.transpose(pca.components_) #components is n_components x f; transpase to get rows as features, like R does it 
-    
-    transformed_matrix = fast_dot(data_matrix, r_loadings)
+    profiler.count("rows", rows)
+    if not large_data:
+        with profiler.phase("clean"):
+            data_matrix = np.nan_to_num(data_matrix) #clustering does not allow infs, nans
+
+    if not k_means_post: 
+        with profiler.phase("kmeans"):
+            centroids, labels = _kmeans(data_matrix, K, large_data, batch_size, random_state, cache, warm_start)
+
+    with profiler.phase("pca"):
+        r_loadings, transformed_matrix = _fit_pca(data_matrix, mean_normalize, n_components, large_data, batch_size, cache)
     
     loading_vectors = []
     loading_labels = []
@@ -61,37 +185,79 @@ def pca_biplot_with_clustering(data_matrix, feature_labels, mean_normalize = Fal
         loading_labels.append(str(feature_labels[i]))
     
     if k_means_post: 
-        centroids, labels = clustering.kmpp(transformed_matrix, K)
+        with profiler.phase("kmeans"):
+            centroids, labels = _kmeans(transformed_matrix, K, large_data, batch_size, random_state, cache, warm_start)
     
-    #do the plot
-    fig, ax = plt.subplots()
-
-    for l in range(0, K):
-        transformed_matrix_i = [transformed_matrix[i] for i in range(0, rows) if labels[i] == l]                     
-        ax.scatter([x[0] for x in transformed_matrix_i], 
-                   [x[1] for x in transformed_matrix_i], 
-                   color = _colors[l % len(_colors)],
-                   label = "cluster" + str(l))
-
-    pxs = [i[0] for i in loading_vectors]
-    pys =  [i[1] for i in loading_vectors]    
-    for xindex, x in enumerate(pxs):     
-        ax.arrow(0, 0, pxs[xindex], pys[xindex], linewidth=3, width=0.0005, head_width=0.0025, color="r", label = "loading")
-        ax.arrow(0, 0, pxs[xindex]*5, pys[xindex]*5, alpha = .5, linewidth = 1, linestyle="dashed", width=0.0005, head_width=0.0025, color="r")
-        ax.text(pxs[xindex]*5, pys[xindex]*5, loading_labels[xindex], color="r")
+    with profiler.phase("draw"):
+        #do the plot. a plain Figure on an Agg canvas: no GUI backend, nothing left in pyplot's global state
+        fig = Figure()
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot(111)
+
+        points, point_labels = _plotted_points(transformed_matrix, labels, max_plot_points, random_state)
+        profiler.count("plotted points", len(points))
+        for l in range(0, K):
+            in_cluster = point_labels == l
+            ax.scatter(points[in_cluster, 0], 
+                       points[in_cluster, 1], 
+                       color = _colors[l % len(_colors)],
+                       label = "cluster" + str(l))
+
+        pxs = [i[0] for i in loading_vectors]
+        pys =  [i[1] for i in loading_vectors]    
+        for xindex, x in enumerate(pxs):     
+            ax.arrow(0, 0, pxs[xindex], pys[xindex], linewidth=3, width=0.0005, head_width=0.0025, color="r", label = "loading")
+            ax.arrow(0, 0, pxs[xindex]*5, pys[xindex]*5, alpha = .5, linewidth = 1, linestyle="dashed", width=0.0005, head_width=0.0025, color="r")
+            ax.text(pxs[xindex]*5, pys[xindex]*5, loading_labels[xindex], color="r")
     
-    ax.legend(loc='best')
-    x0,x1 = ax.get_xlim()
-    y0,y1 = ax.get_ylim()
-    ax.set_xlim(min(x0, y0), max(x1,y1)) #make it square
-    ax.set_ylim(min(x0, y0), max(x1,y1))      
-    ax.set_xlabel("PCA[0]")
-    ax.set_ylabel("PCA[1]") 
-    ax.set_title("", fontsize = 20)
-    ax.grid(b=True, which='major', color='k', linestyle='--')
-
-    fig.savefig(f_out + "{0}{1}{2}".format(K, "_meannormalized" if mean_normalize else "", "_kmpost" if k_means_post else "_kmfirst") + ".pdf", format="pdf")    
-    plt.close() #THIS IS CRUCIAL SEE:  http://stackoverflow.com/questions/26132693/matplotlib-saving-state-between-different-uses-of-io-bytesio
+        ax.legend(loc='best')
+        x0,x1 = ax.get_xlim()
+        y0,y1 = ax.get_ylim()
+        ax.set_xlim(min(x0, y0), max(x1,y1)) #make it square
+        ax.set_ylim(min(x0, y0), max(x1,y1))      
+        ax.set_xlabel("PCA[0]")
+        ax.set_ylabel("PCA[1]") 
+        ax.set_title("", fontsize = 20)
+        ax.grid(True, which='major', color='k', linestyle='--')
+
+    with profiler.phase("save"):
+        fig.savefig(f_out + "{0}{1}{2}".format(K, "_meannormalized" if mean_normalize else "", "_kmpost" if k_means_post else "_kmfirst") + ".pdf", format="pdf")    
+    fig.clf() #pyplot is not involved, but drop the artists now. SEE:  http://stackoverflow.com/questions/26132693/matplotlib-saving-state-between-different-uses-of-io-bytesio
     return r_loadings
 
 
+def pca_k_sweep(data_matrix, k_values = range(2, 31), mean_normalize = False, k_means_post = True, n_components = 2, n_init = 10,
+                processes = None, silhouette_sample_size = 5000, random_state = None, f_out = None, large_data = False, batch_size = None, cache = None,
+                profiler = None):
+    """
+    Purpose: choose K for pca_biplot_with_clustering. The matrix is cleaned and projected once, then every K in k_values is evaluated
+             in parallel with clustering.k_sweep.
+
+    Inputs:
+        data_matrix, mean_normalize, k_means_post, n_components, large_data, batch_size, cache: as for pca_biplot_with_clustering.
+            if k_means_post is False the sweep clusters the whole (nan_to_num'ed) matrix, like pca_biplot_with_clustering does, instead of the projection
+        k_values, n_init, processes, silhouette_sample_size, random_state: see clustering.k_sweep
+        f_out: optional; if given, an elbow chart (inertia and silhouette against K) is written to f_out + "_elbow.pdf"
+        profiler: optional profiling.Profiler; records the time of the clean, pca, k_sweep and chart phases.
+                  defaults to the profiler of the enclosing profiling.profile() block, if any
+
+    Outputs:
+        list of {"k", "inertia", "silhouette", "centroids"}, one per K, see clustering.k_sweep
+    """
+    profiler = profiling.current(profiler)
+    batch_size = batch_size or _default_batch_size
+    if k_means_post:
+        if not large_data:
+            with profiler.phase("clean"):
+                data_matrix = np.nan_to_num(data_matrix)
+        with profiler.phase("pca"):
+            r_loadings, data_matrix = _fit_pca(data_matrix, mean_normalize, n_components, large_data, batch_size, cache)
+    else:
+        with profiler.phase("clean"):
+            data_matrix = np.nan_to_num(data_matrix)
+    with profiler.phase("k_sweep"):
+        results = clustering.k_sweep(data_matrix, k_values, n_init, processes, silhouette_sample_size, random_state)
+    if f_out is not None:
+        with profiler.phase("chart"):
+            _elbow_chart(results, f_out)
+    return results
@@ -0,0 +1,194 @@
+import sys
+import json
+import time
+import threading
+
+"""
+Phase level profiling of the plotting pipelines (timeseries.graphing, machine_learning.dimensionality).
+
+    with profiling.profile("state_diagram_report.json") as prof:
+        graphing.state_diagram(ts_dict, ...)
+    print(prof.totals())
+
+The instrumented functions record, per phase (aggregate, draw, layout, save, pca, kmeans, ...), the wall time and the memory high water mark,
+and the number of points of every key and window. Outside of a profile() block (and without a profiler argument) they get the null profiler,
+whose phases and counts do nothing, so the instrumentation costs a few attribute lookups per phase.
+Only the standard library is imported here.
+"""
+
+"""
+Internal Helper Functions
+"""
+
+_active = threading.local() #the stack of profilers opened with profile(), per thread
+
+def _max_rss_bytes():
+    """the process's peak resident set size so far, in bytes. None where the resource module is missing (windows)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak*1024 #kilobytes on linux, bytes on mac
+
+
+class _NullPhase(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_null_phase = _NullPhase()
+
+
+class _Phase(object):
+    """context manager timing one phase of a Profiler"""
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        p = self.profiler
+        p._open.append(self)
+        self.path = "/".join(phase.name for phase in p._open)
+        self.rss_before = _max_rss_bytes()
+        self.started_tracing = False
+        self.inner_peak = 0
+        if p.trace_memory:
+            import tracemalloc
+            if not tracemalloc.is_tracing(): #and stopped again by this phase: tracing slows everything down
+                tracemalloc.start()
+                self.started_tracing = True
+            self.traced_before = tracemalloc.get_traced_memory()[0]
+            if hasattr(tracemalloc, "reset_peak"): #python 3.9+, otherwise the peak is the peak since tracing started
+                tracemalloc.reset_peak()
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.time() - self.start
+        p = self.profiler
+        record = {"phase" : self.path, "seconds" : seconds}
+        rss_after = _max_rss_bytes()
+        if rss_after is not None:
+            record["max_rss_bytes"] = rss_after
+            record["max_rss_growth_bytes"] = rss_after - self.rss_before #how far this phase raised the process's high water mark
+        if p.trace_memory:
+            import tracemalloc
+            peak = max(tracemalloc.get_traced_memory()[1], self.inner_peak) #nested phases reset the peak, so they pass theirs up
+            record["traced_peak_bytes"] = peak - self.traced_before #above what was allocated when the phase started
+            if len(p._open) > 1:
+                p._open[-2].inner_peak = max(p._open[-2].inner_peak, peak)
+            if self.started_tracing:
+                tracemalloc.stop()
+        p._open.pop()
+        p._record("phase", record)
+        return False
+
+
+"""
+Public Functions
+"""
+
+class NullProfiler(object):
+    """the profiler of uninstrumented runs: phases are a shared no-op context manager and counts are dropped"""
+    enabled = False
+
+    def phase(self, name):
+        return _null_phase
+
+    def count(self, name, points, **labels):
+        pass
+
+null_profiler = NullProfiler()
+
+
+class Profiler(object):
+    """
+        Records the phases and point counts reported by the instrumented functions.
+
+        Args:
+            callback (function): optional; called with every record as it is made ({"type": "phase" or "count", ...}),
+                                 e.g. to forward them to a metrics system
+            trace_memory (boolean): also measure the peak of the memory allocated within each phase with tracemalloc (traced for the duration of
+                                    the outermost phase if it is not already tracing). allocation tracing slows pure python code down, so it is off by default;
+                                    the process's max RSS is recorded either way
+
+        Attributes:
+            phases (list): {"phase" ("outer/inner" for nested phases), "seconds", "max_rss_bytes", "max_rss_growth_bytes", ["traced_peak_bytes"]}
+            counts (list): {"name", "points", and the labels passed to count, e.g. "key" and "window"}
+    """
+    enabled = True
+
+    def __init__(self, callback = None, trace_memory = False):
+        self.callback = callback
+        self.trace_memory = trace_memory
+        self.phases = []
+        self.counts = []
+        self._open = []
+
+    def _record(self, kind, record):
+        (self.phases if kind == "phase" else self.counts).append(record)
+        if self.callback is not None:
+            self.callback(dict(record, type = kind))
+
+    def phase(self, name):
+        """context manager timing the code in its block as phase name"""
+        return _Phase(self, name)
+
+    def count(self, name, points, **labels):
+        """records a number of points, e.g. count("state points", 1200, key = k, window = 0)"""
+        record = {"name" : name, "points" : int(points)}
+        record.update(labels)
+        self._record("count", record)
+
+    def totals(self):
+        """{phase : total seconds}, summed over repeated phases"""
+        totals = {}
+        for p in self.phases:
+            totals[p["phase"]] = totals.get(p["phase"], 0.0) + p["seconds"]
+        return totals
+
+    def report(self):
+        """everything recorded, as one json serializable dictionary"""
+        return {"phases" : self.phases, "counts" : self.counts, "totals" : self.totals()}
+
+    def write_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent = 1, default = str) #keys can be any object; str() them
+
+
+class profile(object):
+    """
+        Context manager that makes a Profiler the one used by the instrumented functions called within its block (in this thread),
+        and optionally writes its report to a json file at the end.
+
+        Args:
+            path (string): optional; where to write the json report when the block exits
+            profiler (Profiler): optional; the profiler to use. by default a new Profiler(callback, trace_memory)
+            callback, trace_memory: see Profiler
+    """
+    def __init__(self, path = None, profiler = None, callback = None, trace_memory = False):
+        self.path = path
+        self.profiler = profiler if profiler is not None else Profiler(callback, trace_memory)
+
+    def __enter__(self):
+        if not hasattr(_active, "stack"):
+            _active.stack = []
+        _active.stack.append(self.profiler)
+        return self.profiler
+
+    def __exit__(self, *exc_info):
+        _active.stack.pop()
+        if self.path is not None:
+            self.profiler.write_json(self.path)
+        return False
+
+
+def current(profiler = None):
+    """the profiler an instrumented function should report to: the one it was passed, else the innermost profile() block's, else null_profiler"""
+    if profiler is not None:
+        return profiler
+    stack = getattr(_active, "stack", None)
+    return stack[-1] if stack else null_profiler
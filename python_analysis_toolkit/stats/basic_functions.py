@@ -1,31 +1,213 @@
+import heapq
 import operator
+import itertools
 from collections import Counter
 import numpy
-from math import sqrt   
+from math import sqrt, ceil
 
-def list_to_frequency_tuples(l):
+def list_to_frequency_tuples(l, top_k = None, max_error = None):
     """
         Takes a list of items and constructs a frequency dictionary of the counts
         
         Args:
-           l : list of items (strings, ints, etc)
+           l : list of items (strings, ints, etc), or any iterable of them
+           top_k : optional; only the top_k most frequent items are returned, selected with a heap instead of sorting every distinct item
+           max_error : optional fraction of len(l), e.g. 0.001. If given, the counts are approximated in fixed memory with a FrequentItems sketch
+                       of ceil(1/max_error) counters instead of counting every distinct item: every item more frequent than max_error*len(l) is found,
+                       and every count is low by at most max_error*len(l)
            
         Returns:
            list of tuples, where each tuple is the form (x,y,z) where x=the item, y= the count of the item in l, and z=the percentage of items in l that are x
+           with max_error, the tuples are (x,y,z,e): y is a lower bound of the count, the true count is between y and y+e
     """
+    if max_error is not None:
+        return FrequentItems(int(ceil(1.0/max_error))).add(l).frequency_tuples(top_k)
     return_tups = []
     c = Counter(l)
-    N = len(l)      
-    for key, value in sorted(c.items(), key=operator.itemgetter(1), reverse=True):
+    N = sum(c.values())
+    for key, value in c.most_common(top_k): #most_common(None) is the full sort, most_common(k) a heap selection; ties stay in first seen order either way
         return_tups.append((key, value, 100*value/N))
     return return_tups
 
 def mean(l):
-    return numpy.mean(l)
+    return RunningStats().add(l).mean
 
 def ci95(l):
     """
         Returns the 95% Gaussian confidence interval (caller should use the + and - of this value) of an array of vals
         http://en.wikipedia.org/wiki/Confidence_interval
     """
-    return 1.96*numpy.std(l)/sqrt(len(l)) 
\ No newline at end of file
+    return RunningStats().add(l).ci95()
+
+
+class RunningStats(object):
+    """
+        One pass, mergeable count / mean / variance / min / max, for data that arrives in pieces or never sits in one place.
+        Single values are added with Welford's update; NumPy chunks are summarized with (pairwise summed) numpy passes over the chunk
+        and combined with Chan et al.'s pairwise formula, which is also how two RunningStats are merged.
+        Neither ever subtracts large sums of squares, so the variance stays accurate when the mean is large compared to the spread.
+
+        s = RunningStats()
+        for chunk in chunks:
+            s.add(chunk)
+        total = functools.reduce(operator.add, [per_shard_stats, ...]) #or s.merge(other)
+
+        Attributes:
+            count (int): number of values
+            mean (float): nan when empty
+            min, max (float): nan when empty
+        http://en.wikipedia.org/wiki/Algorithms_for_calculating_variance
+    """
+    __slots__ = ("count", "_mean", "_m2", "_min", "_max")
+
+    def __init__(self):
+        self.count = 0
+        self._mean = 0.0
+        self._m2 = 0.0 #sum of squared differences from the mean
+        self._min = numpy.inf
+        self._max = -numpy.inf
+
+    def __getstate__(self):
+        return (self.count, self._mean, self._m2, self._min, self._max)
+
+    def __setstate__(self, state):
+        self.count, self._mean, self._m2, self._min, self._max = state
+
+    def add(self, x):
+        """adds a scalar, or every value of a list / numpy array (of any shape). returns self"""
+        if isinstance(x, (int, float)): #plain python numbers skip numpy, for value at a time callers
+            self._add_one(float(x))
+            return self
+        values = numpy.asarray(x, dtype='float64')
+        if values.size == 1:
+            self._add_one(float(values.reshape(())))
+        elif values.size > 1:
+            values = values.ravel()
+            chunk_mean = numpy.mean(values)
+            self._combine(values.size, chunk_mean, numpy.sum((values - chunk_mean)**2), numpy.min(values), numpy.max(values))
+        return self
+
+    def _add_one(self, value):
+        self.count += 1
+        delta = value - self._mean
+        self._mean += delta/self.count
+        self._m2 += delta*(value - self._mean)
+        if value < self._min or value != value: #a nan sticks, like in numpy.min
+            self._min = value
+        if value > self._max or value != value:
+            self._max = value
+
+    def merge(self, other):
+        """folds another RunningStats (e.g. of another shard) into this one. returns self"""
+        self._combine(other.count, other._mean, other._m2, other._min, other._max)
+        return self
+
+    def __add__(self, other):
+        """a new RunningStats of both"""
+        return RunningStats().merge(self).merge(other)
+
+    def _combine(self, count, mean, m2, minimum, maximum):
+        if count == 0:
+            return
+        total = self.count + count
+        delta = mean - self._mean
+        self._mean += delta*count/total
+        self._m2 += m2 + delta*delta*self.count*count/total
+        self.count = total
+        self._min = numpy.minimum(self._min, minimum)
+        self._max = numpy.maximum(self._max, maximum)
+
+    @property
+    def mean(self):
+        return numpy.float64(self._mean) if self.count else numpy.float64(numpy.nan)
+
+    @property
+    def min(self):
+        return numpy.float64(self._min) if self.count else numpy.float64(numpy.nan)
+
+    @property
+    def max(self):
+        return numpy.float64(self._max) if self.count else numpy.float64(numpy.nan)
+
+    def variance(self, ddof = 0):
+        """population variance by default (ddof=0, like numpy.var); ddof=1 for the sample variance. nan if count <= ddof"""
+        if self.count <= ddof:
+            return numpy.float64(numpy.nan)
+        return numpy.float64(self._m2/(self.count - ddof))
+
+    def std(self, ddof = 0):
+        return numpy.sqrt(self.variance(ddof))
+
+    def ci95(self):
+        """same as ci95 on all the values added: 1.96 * population std / sqrt(count)"""
+        return 1.96*self.std()/sqrt(self.count)
+
+    def __repr__(self):
+        return "RunningStats(count={0}, mean={1}, std={2}, min={3}, max={4})".format(self.count, self.mean, self.std(), self.min, self.max)
+
+
+class FrequentItems(object):
+    """
+        Approximate counts of the most frequent items of a stream in fixed memory: the Misra-Gries summary, in its mergeable form
+        (Agarwal et al., Mergeable Summaries, 2012), so shards can be summarized separately and merged.
+
+        At most capacity counters are kept. Every count is an underestimate by at most error(), and error() <= total/(capacity + 1)
+        however the stream was split and merged, so every item occurring more than total/(capacity + 1) times is in the summary.
+        Items are counted exactly (with a Counter) batch_size at a time, then folded into the summary, so memory stays bounded by
+        capacity + batch_size distinct items.
+
+        http://en.wikipedia.org/wiki/Misra%E2%80%93Gries_summary
+
+        Attributes:
+            capacity (int): number of counters
+            total (int): number of items added
+    """
+    def __init__(self, capacity = 1000, batch_size = 100000):
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.total = 0
+        self._counts = {}
+        self._error = 0 #what has been subtracted from every counter so far
+
+    def add(self, items):
+        """counts every item of an iterable (a list, a generator, a numpy array...). returns self"""
+        items = iter(items)
+        while True:
+            batch = Counter(itertools.islice(items, self.batch_size))
+            if not batch:
+                return self
+            self.total += sum(batch.values())
+            self._fold(batch, 0)
+
+    def merge(self, other):
+        """folds another FrequentItems (e.g. of another shard) into this one. returns self"""
+        self.total += other.total
+        self._fold(other._counts, other._error)
+        return self
+
+    def __add__(self, other):
+        return FrequentItems(self.capacity, self.batch_size).merge(self).merge(other)
+
+    def _fold(self, counts, error):
+        merged = Counter(self._counts)
+        merged.update(counts)
+        self._error += error
+        if len(merged) > self.capacity:
+            kth = heapq.nlargest(self.capacity + 1, merged.values())[-1]
+            merged = dict((item, count - kth) for item, count in merged.items() if count > kth)
+            self._error += kth
+        self._counts = dict(merged)
+
+    def error(self):
+        """the most any count is below the true count"""
+        return self._error
+
+    def counts(self):
+        """{item : lower bound of its count} of the items in the summary"""
+        return dict(self._counts)
+
+    def frequency_tuples(self, top_k = None):
+        """(item, count, percent, error) tuples, most frequent first, like list_to_frequency_tuples(l, max_error=...)"""
+        ordered = sorted(self._counts.items(), key=operator.itemgetter(1), reverse=True) if top_k is None \
+                  else heapq.nlargest(top_k, self._counts.items(), key=operator.itemgetter(1))
+        return [(key, value, 100*value/self.total, self._error) for key, value in ordered]
@@ -0,0 +1,3 @@
+from python_analysis_toolkit._lazy import lazy_submodules
+
+__getattr__, __dir__ = lazy_submodules(__name__, ('aggregation', 'batch', 'containers', 'graphing', 'incremental', 'longformat', 'rollup', 'store', 'streaming'))
@@ -0,0 +1,235 @@
+import numpy
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+"""
+Plot-free aggregation behind the timeseries graphing functions.
+Timestamps are handled as sorted int64 arrays of nanoseconds since the epoch; buckets are numpy datetime64 units.
+"""
+
+"""
+Internal Helper Functions
+"""
+
+_numpy_units = {"months": "M", "days": "D", "hours": "h", "minutes": "m", "seconds": "s"}
+_epoch = datetime(1970, 1, 1)
+_microsecond = timedelta(microseconds=1)
+
+def _granularity_unit(minor_granularity):
+    """converts a minor_granularity label (months, days, hours, minutes, seconds) into a numpy datetime64 unit code"""
+    if minor_granularity not in _numpy_units:
+        raise Exception("Unsupported Minor Frequency")
+    return _numpy_units[minor_granularity]
+
+def _to_epoch_ns(timestamps):
+    """converts datetimes, datetime64s, or ints (taken as epoch ns) into an int64 array of epoch ns"""
+    if isinstance(timestamps, list) and len(timestamps) > 0 and isinstance(timestamps[0], datetime):
+        try: #timedelta arithmetic is several times faster than numpy's per object datetime conversion
+            return numpy.array([(d - _epoch)//_microsecond for d in timestamps], dtype='int64')*1000
+        except TypeError: #timezone aware
+            pass
+    arr = numpy.asarray(timestamps)
+    if arr.dtype.kind in 'iu':
+        return arr.astype('int64')
+    return arr.astype('datetime64[ns]').view('int64')
+
+def _date_to_ns(d):
+    return int(numpy.datetime64(d, 'ns').astype('int64'))
+
+def _windows_ns(start_dates, end_dates):
+    return [(_date_to_ns(s), _date_to_ns(e)) for s, e in zip(start_dates, end_dates)]
+
+def _floor_to_unit(ns, unit):
+    """floors epoch ns to the start of their bucket. returns the bucket numbers, i.e. int64 counts of unit since the epoch"""
+    return ns.view('datetime64[ns]').astype('datetime64[{0}]'.format(unit)).view('int64')
+
+def _unit_to_datetime64(buckets, unit):
+    """inverse of _floor_to_unit: bucket numbers to datetime64[ns] bucket starts"""
+    return buckets.view('datetime64[{0}]'.format(unit)).astype('datetime64[ns]')
+
+def _window_slice(sorted_ns, start_ns, end_ns):
+    """returns the slice of sorted_ns within [start_ns, end_ns] (both inclusive) via binary search"""
+    lo = numpy.searchsorted(sorted_ns, start_ns, side='left')
+    hi = numpy.searchsorted(sorted_ns, end_ns, side='right')
+    return slice(lo, hi)
+
+def _bucket_counts(window_ns, unit):
+    """
+        counts sorted epoch ns into consecutive buckets of one unit, from the bucket of the first event to the bucket of the last,
+        including empty buckets in between (the same buckets pandas resample(...).count() produced)
+    """
+    if len(window_ns) == 0:
+        return numpy.zeros(0, dtype='datetime64[ns]'), numpy.zeros(0, dtype='int64')
+    buckets = _floor_to_unit(window_ns, unit)
+    first = buckets[0]
+    counts = numpy.bincount(buckets - first)
+    return _unit_to_datetime64(numpy.arange(first, first + len(counts), dtype='int64'), unit), counts.astype('int64')
+
+def _sort_pairs(pairs):
+    """sorts a list of (DateTime, value) tuples by time (ties by value, like sorted() on the tuples). returns (epoch ns int64 array, values array)"""
+    ns = _to_epoch_ns([p[0] for p in pairs])
+    labels = [p[1] for p in pairs]
+    try:
+        values = numpy.asarray(labels)
+    except ValueError: #ragged sequences
+        values = None
+    if values is None or values.ndim != 1 or (values.dtype.kind in 'US' and not all(isinstance(l, (str, bytes)) for l in labels)):
+        values = numpy.empty(len(pairs), dtype=object) #labels that are sequences, or mixed types that numpy would turn into strings
+        values[:] = labels
+    order = numpy.lexsort((values, ns)) if values.dtype.kind in 'biufUS' else numpy.argsort(ns, kind='mergesort')
+    return ns[order], values[order]
+
+def _state_steps(window_ns, values, unit):
+    """
+        run-length encodes a sorted state series at the given unit: times are floored to their bucket, the last value in each bucket wins,
+        and only the points where the value changes are kept (plus the final point, so the last state is drawn up to the last observation).
+        a change inside a bucket is therefore drawn at the start of its bucket, one bucket before a forward fill sampled at the bucket
+        boundaries would show it. every source (longformat, streaming, rollup) buckets states the same way
+        returns (change_times datetime64[ns] array, values float64 array)
+    """
+    if len(window_ns) == 0:
+        return numpy.zeros(0, dtype='datetime64[ns]'), numpy.zeros(0, dtype='float64')
+    buckets = _floor_to_unit(window_ns, unit)
+    last_in_bucket = numpy.append(buckets[1:] != buckets[:-1], True)
+    buckets = buckets[last_in_bucket]
+    values = values[last_in_bucket].astype('float64')
+    keep = numpy.append(True, values[1:] != values[:-1])
+    keep[-1] = True
+    return _unit_to_datetime64(buckets[keep], unit), values[keep]
+
+def _wrap_table(ts_dict):
+    """a long format table (pandas DataFrame or numpy structured array) passed in place of ts_dict, wrapped in a LongFormat with the default column names"""
+    if hasattr(ts_dict, "columns") or getattr(getattr(ts_dict, "dtype", None), "names", None) is not None:
+        from python_analysis_toolkit.timeseries.longformat import LongFormat #longformat imports this module
+        return LongFormat(ts_dict)
+    return ts_dict
+
+"""
+Aggregation for array backed inputs (containers.KeyedSeries, store.EventStore).
+These provide keys(), _has_data(key), _window_arrays(key, start_ns, end_ns) -> (sorted epoch ns, float64 values or None),
+and _window_labels(key, start_ns, end_ns) -> (sorted epoch ns, labels) or None if the key has no annotations.
+"""
+
+def _array_event_frequency_counts(source, minor_granularity, start_dates, end_dates):
+    unit = _granularity_unit(minor_granularity)
+    windows = _windows_ns(start_dates, end_dates)
+    counts = OrderedDict()
+    for k in source.keys():
+        counts[k] = [_bucket_counts(source._window_arrays(k, s, e)[0], unit) for s, e in windows] if source._has_data(k) else None
+    return counts
+
+def _array_state_transitions(source, minor_granularity, start_dates, end_dates):
+    unit = _granularity_unit(minor_granularity)
+    windows = _windows_ns(start_dates, end_dates)
+    transitions = OrderedDict()
+    for k in source.keys():
+        if not source._has_data(k):
+            transitions[k] = None
+            continue
+        transitions[k] = []
+        for s, e in windows:
+            times, values = source._window_arrays(k, s, e)
+            if values is None:
+                raise Exception("Key {0} has no values, so there are no states to plot".format(k))
+            transitions[k].append(_state_steps(times, values, unit))
+    return transitions
+
+def _array_annotation_events(source, start_dates, end_dates):
+    windows = _windows_ns(start_dates, end_dates)
+    events = OrderedDict()
+    for k in source.keys():
+        windowed = [source._window_labels(k, s, e) for s, e in windows]
+        events[k] = None if any(w is None for w in windowed) else [(times.view('datetime64[ns]'), labels) for times, labels in windowed]
+    return events
+
+"""
+Public Functions
+"""
+
+def event_frequency_counts(ts_dict, minor_granularity, start_dates, end_dates):
+    """
+        Purpose: the aggregation step of plot_event_frequency without any plotting: the number of events per minor_granularity bucket,
+                 for every key and every [start_dates[i], end_dates[i]] window.
+                 Each key's events are sorted once; each window is then cut out with a binary search and bucketed with a bincount.
+
+        Args:
+             ts_dict: dictionary where the keys are the keys to count for and the values are lists of DateTimes (or datetime64s) at which the events occured,
+                      or any other plot_event_frequency input (e.g. a long format DataFrame or structured array with key and timestamp columns)
+             minor_granularity (string): can be months, days, hours, minutes, seconds
+             start_dates (list of Datetime Objects): start of each window (inclusive)
+             end_dates (list of Datetime Objects):   end of each window (inclusive)
+
+        Returns:
+             OrderedDict in ts_dict.keys() order. The value is None for a key with no events at all, otherwise a list with one tuple per window:
+             (bucket_starts, counts) where bucket_starts is a datetime64[ns] array and counts is an int64 array of the same length.
+             Buckets run from the bucket of the first event in the window to the bucket of the last one; windows with no events give empty arrays.
+    """
+    ts_dict = _wrap_table(ts_dict)
+    if hasattr(ts_dict, "event_frequency_counts"): #inputs other than a dict (e.g. streaming.ChunkedEvents) aggregate themselves
+        return ts_dict.event_frequency_counts(minor_granularity, start_dates, end_dates)
+    unit = _granularity_unit(minor_granularity)
+    windows = _windows_ns(start_dates, end_dates)
+    counts = OrderedDict()
+    for k in ts_dict.keys():
+        if not len(ts_dict[k]) > 0:
+            counts[k] = None
+            continue
+        sorted_ns = numpy.sort(_to_epoch_ns(ts_dict[k]))
+        counts[k] = [_bucket_counts(sorted_ns[_window_slice(sorted_ns, s, e)], unit) for s, e in windows]
+    return counts
+
+def state_transitions(ts_dict, minor_granularity, start_dates, end_dates):
+    """
+        Purpose: the aggregation step of state_diagram without any plotting: each key's state series, per window, as a step function.
+                 Instead of one point per minor_granularity tick, only the change points are kept, so the size of the result
+                 scales with the number of transitions and not with the window length.
+
+        Args:
+             ts_dict: dictionary in the state_diagram format, {key : {"ts" : list of tuples (X,Y) where X is a DateTime and Y is a float, ...}},
+                      or any other state_diagram input (e.g. a long format DataFrame or structured array with key, timestamp and value columns)
+             minor_granularity (string): can be months, days, hours, minutes, seconds. change points are truncated to it
+             start_dates (list of Datetime Objects): start of each window (inclusive)
+             end_dates (list of Datetime Objects):   end of each window (inclusive)
+
+        Returns:
+             OrderedDict in ts_dict.keys() order. The value is None for a key with an empty "ts", otherwise a list with one tuple per window:
+             (change_times, values) where change_times is a datetime64[ns] array and values a float64 array;
+             values[i] holds from change_times[i] until change_times[i+1] (draw it with a post step). The last point is the last observation in the window.
+    """
+    ts_dict = _wrap_table(ts_dict)
+    if hasattr(ts_dict, "state_transitions"): #inputs other than a dict (e.g. streaming.ChunkedStates) aggregate themselves
+        return ts_dict.state_transitions(minor_granularity, start_dates, end_dates)
+    unit = _granularity_unit(minor_granularity)
+    windows = _windows_ns(start_dates, end_dates)
+    transitions = OrderedDict()
+    for k in ts_dict.keys():
+        if not len(ts_dict[k]["ts"]) > 0:
+            transitions[k] = None
+            continue
+        sorted_ns, values = _sort_pairs(ts_dict[k]["ts"])
+        transitions[k] = []
+        for s, e in windows:
+            w = _window_slice(sorted_ns, s, e)
+            transitions[k].append(_state_steps(sorted_ns[w], values[w], unit))
+    return transitions
+
+def annotation_events(ts_dict, start_dates, end_dates):
+    """
+        the "event_ts" annotations of a state_diagram ts_dict, per key and window.
+        returns an OrderedDict with None for keys without "event_ts", otherwise a list with one (times datetime64[ns] array, labels array) tuple per window
+    """
+    ts_dict = _wrap_table(ts_dict)
+    if hasattr(ts_dict, "annotation_events"):
+        return ts_dict.annotation_events(start_dates, end_dates)
+    windows = _windows_ns(start_dates, end_dates)
+    events = OrderedDict()
+    for k in ts_dict.keys():
+        if "event_ts" not in ts_dict[k]:
+            events[k] = None
+            continue
+        sorted_ns, labels = _sort_pairs(ts_dict[k]["event_ts"]) if len(ts_dict[k]["event_ts"]) > 0 else (numpy.zeros(0, dtype='int64'), numpy.zeros(0, dtype=object))
+        events[k] = []
+        for s, e in windows:
+            w = _window_slice(sorted_ns, s, e)
+            events[k].append((sorted_ns[w].view('datetime64[ns]'), labels[w]))
+    return events
@@ -0,0 +1,79 @@
+import os
+import time
+import traceback
+import multiprocessing
+
+"""
+Renders many plot_event_frequency / state_diagram figures across a process pool.
+Every worker uses the headless Agg backend and the graphing functions' object oriented Figure path (which closes each figure once it is saved),
+so memory stays flat no matter how many figures a worker renders, and pyplot's global state never stops the work from using all cores.
+"""
+
+"""
+Internal Helper Functions
+"""
+
+_functions = ("plot_event_frequency", "state_diagram")
+
+
+def _init_worker():
+    import matplotlib
+    matplotlib.use("Agg") #no display on a server; must happen before pyplot is imported
+
+def _render_one(spec):
+    """renders one spec. never raises, errors are returned so one bad spec does not take down the batch"""
+    from python_analysis_toolkit.timeseries import graphing
+
+    kwargs = dict(spec)
+    function = kwargs.pop("function")
+    kwargs["save_instead_plot"] = True
+    kwargs["fname"] = kwargs.get("fname", "foo") #the same default for both functions, so the path below is the file that was written
+    result = {"function" : function, "fname" : kwargs["fname"], "path" : None, "seconds" : None, "error" : None}
+    t = time.time()
+    try:
+        getattr(graphing, function)(**kwargs)
+        result["path"] = os.path.abspath(kwargs["fname"] + "." + kwargs.get("image_format", "pdf")) #the name _finalize_helper saved to
+    except Exception:
+        result["error"] = traceback.format_exc()
+    result["seconds"] = time.time() - t
+    return result
+
+
+"""
+Public Functions
+"""
+
+def render_batch(specs, processes = None, output_dir = None, max_figures_per_worker = None):
+    """
+        Purpose: render many figures in parallel and report on each one.
+
+        Args:
+            specs: list of dictionaries, one per figure. "function" is "plot_event_frequency" or "state_diagram"; every other entry is a keyword
+                   argument of that function (ts_dict, major_granularity, minor_granularity, start_dates, end_dates, fname, title, ...).
+                   save_instead_plot is always True and fname defaults to "foo". Specs are pickled to the workers, so ts_dict must be picklable:
+                   a dict, a containers.KeyedSeries, or a store.EventStore (which is sent as its path, so each worker maps the files itself)
+            processes (int): number of worker processes, defaults to the number of cores. 1 renders in this process (still on Agg, still closed)
+            output_dir (string): optional directory prepended to every fname
+            max_figures_per_worker (int): optional; recycle a worker process after this many figures
+
+        Returns:
+            list of dictionaries in the order of specs: {"function", "fname", "path" (absolute path of the saved <fname>.<image_format>, None on error),
+                                                         "seconds" (wall time of the render), "error" (None, or the traceback)}
+    """
+    specs = [dict(s) for s in specs]
+    for s in specs:
+        if s.get("function") not in _functions:
+            raise Exception("Unsupported function {0}, must be one of {1}".format(s.get("function"), _functions))
+        if output_dir is not None:
+            s["fname"] = os.path.join(output_dir, s.get("fname", "foo"))
+    if output_dir is not None and not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    if processes == 1:
+        return [_render_one(s) for s in specs]
+    pool = multiprocessing.Pool(processes, initializer = _init_worker, maxtasksperchild = max_figures_per_worker)
+    try:
+        return pool.map(_render_one, specs, chunksize = 1)
+    finally:
+        pool.close()
+        pool.join()
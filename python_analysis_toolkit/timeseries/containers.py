@@ -0,0 +1,210 @@
+import numpy
+from collections import OrderedDict
+
+from python_analysis_toolkit.timeseries import aggregation
+
+"""
+Compact, array backed alternative to the ts_dict of lists taken by the graphing functions.
+"""
+
+
+class KeyedSeries(object):
+    """
+        One timeseries per key, stored as contiguous arrays instead of lists of (DateTime, value) tuples:
+        every key's points are a segment of the same int64 epoch ns array (and of the float64 values or category codes array),
+        sorted by time within the segment, with offsets[i]:offsets[i+1] the segment of keys[i].
+        Window slicing is a binary search on the segment and returns views, so nothing is copied.
+
+        plot_event_frequency and state_diagram accept a KeyedSeries in place of their ts_dict.
+        Build one with from_event_dict / from_state_dict from the existing dict formats, or from_arrays from flat columns.
+
+        Attributes:
+            offsets (int64 array): segment boundaries, len(keys) + 1
+            times (int64 array): epoch ns
+            values (float64 array or None): the state values, None for pure event series
+            codes (int32 array or None): category codes for non numeric labels (e.g. event_ts annotations), indexes into categories
+            categories (list): the distinct labels
+            events (KeyedSeries or None): the event_ts annotations, for state_diagram
+    """
+    __slots__ = ("_keys", "_index", "offsets", "times", "values", "codes", "categories", "events")
+
+    def __init__(self, keys, offsets, times, values = None, codes = None, categories = None, events = None):
+        """takes the arrays as they are (no copies); every segment must already be sorted by time. prefer the from_* constructors"""
+        self._keys = list(keys)
+        self._index = dict((k, i) for i, k in enumerate(self._keys))
+        self.offsets = numpy.asarray(offsets, dtype='int64')
+        self.times = numpy.asarray(times, dtype='int64')
+        self.values = None if values is None else numpy.asarray(values, dtype='float64')
+        self.codes = None if codes is None else numpy.asarray(codes, dtype='int32')
+        self.categories = categories
+        self.events = events
+
+    #construction
+
+    @classmethod
+    def from_arrays(cls, keys, times, values = None, labels = None, key_order = None):
+        """
+            Builds a KeyedSeries from flat, parallel columns (e.g. a long format table). One sort of the whole thing, no per key python work.
+
+            Args:
+                keys: array of the key of every point
+                times: array of DateTimes, datetime64s, or epoch ns ints
+                values: optional array of floats
+                labels: optional array of arbitrary labels, stored as category codes
+                key_order: optional list of keys to fix the key order (and so the colors); keys not in it are dropped. defaults to sorted keys
+        """
+        keys = numpy.asarray(keys)
+        times = aggregation._to_epoch_ns(times)
+        unique_keys, key_ids = numpy.unique(keys, return_inverse=True)
+        key_ids = key_ids.ravel()
+        if key_order is not None:
+            position = dict((k, i) for i, k in enumerate(key_order))
+            remap = numpy.array([position.get(k, -1) for k in unique_keys.tolist()], dtype='int64')
+            key_ids = remap[key_ids]
+            keep = key_ids >= 0
+            key_ids, times = key_ids[keep], times[keep]
+            values = None if values is None else numpy.asarray(values)[keep]
+            labels = None if labels is None else numpy.asarray(labels)[keep]
+            unique_keys = list(key_order)
+        else:
+            unique_keys = unique_keys.tolist()
+
+        sort_by = [times, key_ids]
+        if values is not None:
+            values = numpy.asarray(values, dtype='float64')
+            sort_by.insert(0, values) #ties in time are ordered by value, like sorted() on (DateTime, value) tuples
+        order = numpy.lexsort(sort_by)
+        offsets = numpy.zeros(len(unique_keys) + 1, dtype='int64')
+        offsets[1:] = numpy.cumsum(numpy.bincount(key_ids, minlength=len(unique_keys)))
+        codes, categories = None, None
+        if labels is not None:
+            categories, codes = numpy.unique(numpy.asarray(labels)[order], return_inverse=True)
+            categories = categories.tolist()
+        return cls(unique_keys, offsets, times[order], None if values is None else values[order], codes, categories)
+
+    @classmethod
+    def from_event_dict(cls, ts_dict):
+        """converts the plot_event_frequency ts_dict format, {key : list of DateTimes}"""
+        keys = list(ts_dict.keys())
+        times = [aggregation._to_epoch_ns(ts_dict[k]) if len(ts_dict[k]) > 0 else numpy.zeros(0, dtype='int64') for k in keys]
+        return cls._from_segments(keys, times)
+
+    @classmethod
+    def from_pairs_dict(cls, pairs_dict):
+        """converts {key : list of (DateTime, value) tuples}. float-able values are stored as values, anything else as category codes"""
+        keys = list(pairs_dict.keys())
+        segments = [aggregation._sort_pairs(pairs_dict[k]) if len(pairs_dict[k]) > 0 else (numpy.zeros(0, dtype='int64'), numpy.zeros(0)) for k in keys]
+        times = [s[0] for s in segments]
+        labels = [s[1] for s in segments]
+        numeric = all(l.dtype.kind in 'biuf' for l in labels if len(l) > 0)
+        if numeric:
+            return cls._from_segments(keys, times, values = labels, presorted = True)
+        return cls._from_segments(keys, times, labels = labels, presorted = True)
+
+    @classmethod
+    def from_state_dict(cls, ts_dict):
+        """converts the state_diagram ts_dict format, {key : {"ts" : [(DateTime, float)], "event_ts" (optional) : [(DateTime, label)]}}"""
+        states = cls.from_pairs_dict(OrderedDict((k, ts_dict[k]["ts"]) for k in ts_dict.keys()))
+        event_keys = [k for k in ts_dict.keys() if "event_ts" in ts_dict[k]]
+        if event_keys:
+            states.events = cls.from_pairs_dict(OrderedDict((k, ts_dict[k]["event_ts"]) for k in event_keys))
+        return states
+
+    @classmethod
+    def _from_segments(cls, keys, times, values = None, labels = None, presorted = False):
+        offsets = numpy.zeros(len(keys) + 1, dtype='int64')
+        offsets[1:] = numpy.cumsum([len(t) for t in times])
+        if not presorted:
+            orders = [numpy.argsort(t, kind='mergesort') for t in times]
+            times = [t[o] for t, o in zip(times, orders)]
+        all_times = numpy.concatenate(times) if times else numpy.zeros(0, dtype='int64')
+        all_values = numpy.concatenate([v.astype('float64') for v in values]) if values is not None and keys else None
+        codes, categories = None, None
+        if labels is not None:
+            all_labels = numpy.empty(len(all_times), dtype=object)
+            all_labels[:] = [l for segment in labels for l in segment]
+            categories = sorted(set(all_labels.tolist()), key=repr) #labels need not be mutually orderable
+            position = dict((c, i) for i, c in enumerate(categories))
+            codes = numpy.array([position[l] for l in all_labels.tolist()], dtype='int32')
+        return cls(keys, offsets, all_times, all_values, codes, categories)
+
+    #access
+
+    def keys(self):
+        return list(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def _segment(self, key):
+        i = self._index[key]
+        return slice(self.offsets[i], self.offsets[i+1])
+
+    def times_for(self, key):
+        """epoch ns of key, as a view"""
+        return self.times[self._segment(key)]
+
+    def values_for(self, key):
+        """float64 values of key, as a view (None for event series)"""
+        return None if self.values is None else self.values[self._segment(key)]
+
+    def labels_for(self, key):
+        """the labels of key, decoded from the category codes (None if there are no labels)"""
+        if self.codes is None:
+            return None
+        return self._category_array()[self.codes[self._segment(key)]]
+
+    def _category_array(self):
+        categories = numpy.empty(len(self.categories), dtype=object)
+        categories[:] = self.categories
+        return categories
+
+    def window(self, key, start, end):
+        """
+            the points of key within [start, end] (both inclusive, DateTimes, datetime64s or epoch ns).
+            returns (times, values, codes) views of the underlying arrays; values/codes are None if not stored
+        """
+        seg = self._segment(key)
+        times = self.times[seg]
+        w = aggregation._window_slice(times, aggregation._date_to_ns(start), aggregation._date_to_ns(end))
+        values = None if self.values is None else self.values[seg][w]
+        codes = None if self.codes is None else self.codes[seg][w]
+        return times[w], values, codes
+
+    @property
+    def nbytes(self):
+        n = self.offsets.nbytes + self.times.nbytes
+        n += 0 if self.values is None else self.values.nbytes
+        n += 0 if self.codes is None else self.codes.nbytes
+        return n + (0 if self.events is None else self.events.nbytes)
+
+    #aggregation, called by plot_event_frequency and state_diagram through the aggregation module
+
+    def _has_data(self, key):
+        i = self._index[key]
+        return self.offsets[i+1] > self.offsets[i]
+
+    def _window_arrays(self, key, start_ns, end_ns):
+        times, values, codes = self.window(key, start_ns, end_ns)
+        return times, values
+
+    def _window_labels(self, key, start_ns, end_ns):
+        if self.events is None or key not in self.events:
+            return None
+        times, values, codes = self.events.window(key, start_ns, end_ns)
+        return times, values if codes is None else self.events._category_array()[codes]
+
+    def event_frequency_counts(self, minor_granularity, start_dates, end_dates):
+        """same result as aggregation.event_frequency_counts"""
+        return aggregation._array_event_frequency_counts(self, minor_granularity, start_dates, end_dates)
+
+    def state_transitions(self, minor_granularity, start_dates, end_dates):
+        """same result as aggregation.state_transitions"""
+        return aggregation._array_state_transitions(self, minor_granularity, start_dates, end_dates)
+
+    def annotation_events(self, start_dates, end_dates):
+        """same result as aggregation.annotation_events, from the events KeyedSeries"""
+        return aggregation._array_annotation_events(self, start_dates, end_dates)
@@ -1,11 +1,13 @@
-import matplotlib.pyplot as plt
-from matplotlib.dates import YearLocator, MonthLocator, DayLocator, HourLocator, MinuteLocator, SecondLocator, DateFormatter
-import pandas
-import operator
-import matplotlib.gridspec as gridspec
+import numpy
+from collections import OrderedDict
 
-from python_analysis_toolkit.conversion import datetimes
-from pandas.tseries.offsets import *
+from python_analysis_toolkit import profiling
+from python_analysis_toolkit.timeseries import aggregation
+
+"""
+matplotlib is imported by the functions that draw, not at module load: importing this module stays cheap for workers that only aggregate, 
+and pyplot (which picks a GUI backend) is only imported to show a plot on screen.
+"""
 
 """
 Internal Helper Functions
@@ -15,7 +17,7 @@ _colors = ['r', 'b', 'g', 'k', 'm']
 
 
 def _timeseries_frequency_helper(major_granularity, minor_granularity):
-    """Internal helper function to convert human readable labels into matplotlib and pandas parameters
+    """Internal helper function to convert human readable labels into matplotlib parameters
         
        Args:
            major_granularity (str) : years, months, days, hours, or minutes
@@ -25,9 +27,9 @@ def _timeseries_frequency_helper(major_granularity, minor_granularity):
            matplotlib.MajorLocator,
            matplotlib.MajorFormatter
            matplotlib.MajorLocator,
-           matplotlib.MajorFormatter           
-           pandas.frequency
+           matplotlib.MajorFormatter
     """
+    from matplotlib.dates import YearLocator, MonthLocator, DayLocator, HourLocator, MinuteLocator, SecondLocator, DateFormatter
     
     #set the locatiors
     if major_granularity == "years":
@@ -47,27 +49,21 @@ def _timeseries_frequency_helper(major_granularity, minor_granularity):
         major_loc = MinuteLocator()
     else: #no seconds for major
         raise Exception("Unsupported Major Frequency: {0}".format(major_granularity))        
-    #see http://pandas.pydata.org/pandas-docs/stable/timeseries.html under "Offset Aliases"
     if minor_granularity == "months":
         minor_loc = MonthLocator()
         minor_fmt = DateFormatter('%m')
-        pandas_freq = 'M'
     elif minor_granularity == "days":
         minor_loc = DayLocator() 
         minor_fmt = DateFormatter('%d')
-        pandas_freq = 'D'             
     elif minor_granularity == "hours":
         minor_loc = HourLocator()
         minor_fmt = DateFormatter('%H')
-        pandas_freq = 'H'
     elif minor_granularity == "minutes":
         minor_loc = MinuteLocator()
         minor_fmt = DateFormatter('%M')
-        pandas_freq = 'T' #.. yes
     elif minor_granularity == "seconds":
         minor_loc = SecondLocator()
         minor_fmt = DateFormatter('%S')
-        pandas_freq = 'S'   
     else: #no years for minor
         raise Exception("Unsupported Minor Frequency")      
     
@@ -75,18 +71,150 @@ def _timeseries_frequency_helper(major_granularity, minor_granularity):
     #major_loc.MAXTICKS = 1000
     #minor_loc.MAXTICKS = 10000
 
-    return major_loc, major_fmt, minor_loc, minor_fmt, pandas_freq  
+    return major_loc, major_fmt, minor_loc, minor_fmt
+
+
+def _to_datetimes(dt64s):
+    """datetime64 array to a list of DateTimes, for ax.plot on a date axis and for printing"""
+    return dt64s.astype('datetime64[us]').tolist()
+
+
+def _report_outside_windows(ts_dict, what):
+    """chunked inputs count what they skipped; say so instead of dropping it silently"""
+    for k, n in getattr(ts_dict, "outside_window_counts", {}).items():
+        if n > 0:
+            print("{0} {1} for key {2} fell outside every window".format(n, what, k))
 
 
-def _finalize_helper(gs, save_instead_plot, fname, fig):
+def _count_points(profiler, name, per_key):
+    """the points of every key and window of an aggregation result, for the profiler"""
+    if profiler.enabled:
+        for k, windows in per_key.items():
+            for dindex, window in enumerate(windows or []):
+                profiler.count(name, len(window[0]), key = k, window = dindex)
+
+
+def _new_figure(save_instead_plot):
+    """figures that are only saved are plain Figures on an Agg canvas: no pyplot global state, nothing registered that could leak"""
+    if save_instead_plot:
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        fig = Figure()
+        FigureCanvasAgg(fig)
+        return fig
+    import matplotlib.pyplot as plt
+    return plt.figure()
+
+
+def _finalize_helper(gs, save_instead_plot, fname, fig, image_format = "pdf", dpi = None, profiler = profiling.null_profiler):
     #produce final fiture    
-    gs.tight_layout(fig) 
+    with profiler.phase("layout"):
+        gs.tight_layout(fig) 
     if  save_instead_plot:
-        plt.savefig(fname + ".pdf", format = "pdf")
+        with profiler.phase("save"):
+            fig.savefig(fname + "." + image_format, format = image_format, dpi = dpi)
+        fig.clf() #drop the artists now rather than whenever the figure is collected
     else:
+        import matplotlib.pyplot as plt
         plt.show() 
+        plt.close(fig)
+
+"""
+High volume rendering: every key of a window goes into one collection, thinned to what the output resolution can show
+"""
 
-def _format(ax, major_loc, major_fmt, major_gran,  minor_loc, minor_fmt, minor_gran, gs_index, title, ylab, ymin = None, ymax = None):
+def _data_pixels(fig, total_plots, dpi):
+    """(width, height) in pixels of one subplot, at most: the figure width, and its height shared by the subplots"""
+    dpi = dpi or fig.dpi
+    return int(fig.get_figwidth()*dpi), max(int(fig.get_figheight()*dpi/total_plots), 1)
+
+def _pixel_columns(ns, window_ns, width_px):
+    start_ns, end_ns = window_ns
+    return numpy.floor((ns - start_ns)*(width_px/float(max(end_ns - start_ns, 1)))).astype('int64')
+
+def _extreme_points(columns, values):
+    """indices of the first, last, lowest and highest point of every pixel column (columns ascending), in time order.
+       a line through just these is drawn the same as through all the points"""
+    if len(columns) == 0:
+        return numpy.zeros(0, dtype='int64')
+    starts = numpy.flatnonzero(numpy.append(True, columns[1:] != columns[:-1]))
+    ends = numpy.append(starts[1:], len(columns)) - 1
+    by_value = numpy.lexsort((values, columns))
+    return numpy.unique(numpy.concatenate([starts, ends, by_value[starts], by_value[ends]]))
+
+def _distinct_pixels(columns, rows, height_px):
+    """indices of the first point to land on every (column, row) pixel, in time order"""
+    return numpy.sort(numpy.unique(columns*(height_px + 1) + rows, return_index=True)[1])
+
+def _date_numbers(dt64s):
+    """datetime64 array to matplotlib date numbers, for collections (which, unlike ax.plot, take no DateTimes)"""
+    import datetime
+    from matplotlib.dates import date2num
+    epoch = date2num(datetime.datetime(1970, 1, 1)) #matplotlib's own epoch depends on its version
+    return epoch + dt64s.astype('datetime64[ns]').view('int64')/(86400*10.0**9)
+
+def _by_color(series):
+    """(color, arrays...) items to one (color, concatenated arrays...) per color: keys of the same color drawn on the same pixel look the same"""
+    grouped = OrderedDict()
+    for item in series:
+        grouped.setdefault(item[0], []).append(item[1:])
+    return [(color,) + tuple(numpy.concatenate(arrays) for arrays in zip(*items)) for color, items in grouped.items()]
+
+def _draw_points(ax, series, window_ns, pixels, rasterize):
+    """the 'o' markers of plot_event_frequency, every key in one PathCollection with at most one marker of a color per pixel.
+       series is a list of (color, key, bucket_starts, counts)"""
+    width_px, height_px = pixels
+    top = max([c.max() for color, k, b, c in series if len(c) > 0] or [1])
+    times, counts, colors = [], [], []
+    for color, bucket_starts, bucket_counts in _by_color([(color, b, c) for color, k, b, c in series]):
+        rows = numpy.floor(bucket_counts*(height_px/float(max(top, 1)))).astype('int64')
+        keep = _distinct_pixels(_pixel_columns(bucket_starts.view('int64'), window_ns, width_px), rows, height_px)
+        times.append(bucket_starts[keep])
+        counts.append(bucket_counts[keep])
+        colors += [color]*len(keep)
+    for color, k, b, c in series:
+        ax.plot([], [], 'o', label=k, color=color) #legend entry only
+    if colors:
+        ax.scatter(_date_numbers(numpy.concatenate(times)), numpy.concatenate(counts), c=colors, s=36, rasterized=rasterize)
+
+def _draw_steps(ax, series, window_ns, pixels, rasterize):
+    """the post step lines of state_diagram, every key one segment of a LineCollection, through the extreme points of every pixel column.
+       series is a list of (color, key, change_times, values)"""
+    from matplotlib.collections import LineCollection
+    segments, colors = [], []
+    for color, k, change_times, values in series:
+        keep = _extreme_points(_pixel_columns(change_times.view('int64'), window_ns, pixels[0]), values)
+        x, y = _date_numbers(change_times[keep]), values[keep]
+        if len(x) > 0:
+            segments.append(numpy.column_stack([numpy.repeat(x, 2)[1:], numpy.repeat(y, 2)[:-1]])) #(x0,y0) (x1,y0) (x1,y1) (x2,y1) ...
+            colors.append(color)
+        ax.plot([], [], '-', label=k, color=color, linewidth=2) #legend entry only
+    if segments:
+        ax.add_collection(LineCollection(segments, colors=colors, linewidths=2, rasterized=rasterize))
+
+def _draw_events(ax, series, window_ns, pixels, rasterize):
+    """the '|' annotation markers of state_diagram as one LineCollection of full height bars, at most one of a color per pixel column.
+       series is a list of (color, event_times)"""
+    from matplotlib.collections import LineCollection
+    from matplotlib.transforms import blended_transform_factory
+    positions, colors = [], []
+    for color, event_times in _by_color(series):
+        columns = _pixel_columns(event_times.view('int64'), window_ns, pixels[0])
+        keep = _distinct_pixels(columns, numpy.zeros(len(columns), dtype='int64'), 0)
+        positions.append(event_times[keep])
+        colors += [color]*len(keep)
+    if not colors:
+        return
+    x = _date_numbers(numpy.concatenate(positions))
+    bars = numpy.zeros((len(x), 2, 2))
+    bars[:, :, 0] = x[:, numpy.newaxis]
+    bars[:, 1, 1] = 1 #from the bottom to the top of the axes
+    ax.add_collection(LineCollection(bars, colors=colors, linewidths=2, alpha=.3, transform=blended_transform_factory(ax.transData, ax.transAxes),
+                                     rasterized=rasterize), autolim=False)
+    ax.update_datalim(numpy.column_stack([x, numpy.zeros(len(x))])) #the markers used to sit at y = 0
+
+
+def _format(ax, major_loc, major_fmt, major_gran,  minor_loc, minor_fmt, minor_gran, gs_index, title, ylab, ymin = None, ymax = None, legend_loc = 'best'):
     ax.xaxis.set_major_formatter(major_fmt)
     #ax.xaxis.set_minor_formatter(minor_fmt)
     ax.xaxis.set_major_locator(major_loc)
@@ -96,9 +224,9 @@ def _format(ax, major_loc, major_fmt, major_gran,  minor_loc, minor_fmt, minor_g
     ax.set_xlabel("Dates at granularity: {0}, {1}".format(major_gran, minor_gran))  
         
     ax.grid(True) #vlines at major locator
-    plt.legend(fontsize=6, loc='best')        
+    ax.legend(fontsize=6, loc=legend_loc) #'best' tests every data point against every position        
     if gs_index == 0: #put the title and legend on first plot only
-        plt.title(title)
+        ax.set_title(title)
     ax.set_ylabel(ylab)
     
     if ymin is not None and ymax is not None:
@@ -116,7 +244,12 @@ def plot_event_frequency(ts_dict,
                          title = "Placeholder Title",
                          save_instead_plot = False, 
                          fname = "foo.png",
-                         event_name = "Events"):
+                         event_name = "Events",
+                         high_volume = False,
+                         rasterize = False,
+                         image_format = "pdf",
+                         dpi = None,
+                         profiler = None):
     """
         Purpose: plot the number of events for a number of keys occuring in some time window, e.g., per day, over some time range. 
                  can be used to plot a timeseries of multiple keys on the same graph, e.g., events per household (key = household id)
@@ -124,6 +257,14 @@ def plot_event_frequency(ts_dict,
         Mandatory Args:
              ts_dict: dictionary where the keys are the keys (String) to plot a timeseries for and 
                       the value for each key is (a list of DateTimes) at which the events occured
+                      
+                      Also accepts a containers.KeyedSeries (see KeyedSeries.from_event_dict), which is far smaller and faster to slice,
+                      or a long format DataFrame or structured array with key and timestamp columns, aggregated for all keys at once
+                      (wrap it in a longformat.LongFormat for other column names). 
+                      For histories that do not fit in memory, pass a streaming.ChunkedEvents instead; the number of events that fell 
+                      outside every window is then printed per key.
+                      Charts refreshed as events arrive can keep their counts in an incremental.IncrementalCounts, so a refresh
+                      only counts the new events.
              major_granularity (string): can be years, months, days, hours, or minutes
              minor_granularity (string): can be months, days, hours, minutes, seconds
                                
@@ -140,34 +281,56 @@ def plot_event_frequency(ts_dict,
              save_instead_plot (boolean): save the plot to a file instead of calling plot.show(). Defaults to False
              fname (string): filename to save the plot to via save_instead_plot. Defaults to "foo.png". Does nothing if not save_instead_plot
              event_name (string): text tht gos on y-label
+             high_volume (boolean): for hundreds of keys or long windows. all keys of a subplot are drawn as one collection,
+                                    with at most one marker per color per output pixel (keys sharing a color look the same there,
+                                    so one of them is kept). Defaults to False
+             rasterize (boolean): the data layers are embedded in the file as an image (at dpi), axes and text stay vector. 
+                                  keeps PDFs of dense plots small and quick to open. Defaults to False
+             image_format (string): format (and extension) of the saved file, e.g. "pdf" or "png". Defaults to "pdf"
+             dpi (int): resolution of png output and of rasterized layers; high_volume thins to it. Defaults to the figure dpi
+             profiler (profiling.Profiler): optional; records the time of the aggregate, draw, layout and save phases and the points per key and window.
+                                            defaults to the profiler of the enclosing profiling.profile() block, if any
         Returns:
              None, but writes to disk if save_instead_plot is True
              
     """             
-    fig = plt.figure()#setup the main graph
+    import matplotlib.gridspec as gridspec
+    profiler = profiling.current(profiler)
+    fig = _new_figure(save_instead_plot)#setup the main graph
     total_plots = len(start_dates)
     gs =  gridspec.GridSpec(total_plots, 1)
     gs.update(wspace=0, hspace=0.05) # set the spacing between axes. 
     
+    with profiler.phase("aggregate"):
+        ts_dict = aggregation._wrap_table(ts_dict)
+        counts = aggregation.event_frequency_counts(ts_dict, minor_granularity, start_dates, end_dates)
+    _report_outside_windows(ts_dict, "events")
+    _count_points(profiler, "buckets", counts)
+    windows = aggregation._windows_ns(start_dates, end_dates)
+    pixels = _data_pixels(fig, total_plots, dpi)
  
-    for dindex, date in enumerate(start_dates): #make sure to sort or else the different lines will be different colors on different plots!! 
-        major_loc, major_fmt, minor_loc, minor_fmt, pandas_freq  = _timeseries_frequency_helper(major_granularity, minor_granularity)
+    with profiler.phase("draw"):
+        for dindex, date in enumerate(start_dates): #make sure to sort or else the different lines will be different colors on different plots!! 
+            major_loc, major_fmt, minor_loc, minor_fmt = _timeseries_frequency_helper(major_granularity, minor_granularity)
          
-        ax = plt.subplot(gs[dindex, 0])
+            ax = fig.add_subplot(gs[dindex, 0])
         
-        plot_dict = {}
-        
-        for kindex, k in enumerate(ts_dict.keys()):
-            if not len(ts_dict[k]) > 0:
-                print("No data for key {0}".format(k))
-            else:
-                this_ts = sorted([i for i in ts_dict[k] if i >= start_dates[dindex] and i <= end_dates[dindex]])
-                ts = pandas.Series([1 for i in this_ts], index=this_ts).resample(pandas_freq, how='count')
-                ax.plot_date([d.to_datetime() for d,s in ts.iteritems()], [s for s in ts],  'o', label=k, color=_colors[kindex % 5])
-
-        _format(ax, major_loc, major_fmt, major_granularity, minor_loc, minor_fmt, minor_granularity,  dindex, title, "Number of {0}".format(event_name)) # format the ticks and the plotc        
+            series = []
+            for kindex, k in enumerate(counts.keys()):
+                if counts[k] is None:
+                    print("No data for key {0}".format(k))
+                elif high_volume:
+                    series.append((_colors[kindex % 5], k) + counts[k][dindex])
+                else:
+                    bucket_starts, bucket_counts = counts[k][dindex]
+                    ax.plot(_to_datetimes(bucket_starts), bucket_counts,  'o', label=k, color=_colors[kindex % 5], rasterized=rasterize)
+            if high_volume:
+                _draw_points(ax, series, windows[dindex], pixels, rasterize)
+            ax.xaxis_date() #a date axis even when no key has data in this window
+
+            _format(ax, major_loc, major_fmt, major_granularity, minor_loc, minor_fmt, minor_granularity,  dindex, title, "Number of {0}".format(event_name), legend_loc = 'upper right' if high_volume else 'best') # format the ticks and the plotc        
             
-    _finalize_helper(gs, save_instead_plot, fname, fig)  
+    _finalize_helper(gs, save_instead_plot, fname, fig, image_format, dpi, profiler)  
         
 
 
@@ -180,13 +343,21 @@ def state_diagram(         ts_dict,
                            save_instead_plot = False,
                            print_annotated_records_in_range = False, 
                            fname = "foo",
-                           ylab = "Placeholder y label"):
+                           ylab = "Placeholder y label",
+                           high_volume = False,
+                           rasterize = False,
+                           image_format = "pdf",
+                           dpi = None,
+                           profiler = None):
     """plots the state transition diagram for K processes (process identifier keys given by
        ts_dict.keys()) for N different time ranges where N is:
            1 given by len(start_dates) == len(end_date) if these are supplied
            2 the timespan of the process that has the largest timespan
            
        the state transition timestamps are truncated to "minor_granularity", the most fine of which is currently seconds. 
+       each bucket is drawn with the last state observed in it, from the start of the bucket: a transition that happens inside
+       a bucket is drawn at the start of that bucket. (the pandas asfreq(...).ffill() this replaced sampled the state at bucket
+       boundaries, which drew the same transition one bucket later.)
         
         Mandatory Args:
              ts_dict: dictionary where the keys are the keys (String) to plot a timeseries for and the values are dictionaries following:
@@ -200,6 +371,11 @@ def state_diagram(         ts_dict,
                        You can also choose to print the events that fall within the plotting window 
                        by enambling print_annotated_records_in_range.
                        
+                       Also accepts a containers.KeyedSeries (see KeyedSeries.from_state_dict), which is far smaller and faster to slice,
+                       or a long format DataFrame or structured array with key, timestamp and value columns
+                       (wrap it in a longformat.LongFormat for other column names, or to add event_ts annotations). 
+                       For histories that do not fit in memory, pass a streaming.ChunkedStates instead.
+                       
              major_granularity (str): can be years, months, days, hours, or minutes
              minor_granularity (str): can be months, days, hours, minutes, seconds
                                
@@ -217,46 +393,83 @@ def state_diagram(         ts_dict,
                                                           "event_ts", values in the plotting time range are printed. these coorespond to the  veritcal bars
              fname (string): filename to save the plot to via save_instead_plot. Defaults to "foo.png". Does nothing if not save_instead_plot
              ylab (string): text tht gos on y-label
+             high_volume (boolean): for hundreds of keys or dense annotations. the state lines of a subplot are drawn as one LineCollection
+                                    through the first, last, lowest and highest point of every output pixel column, and the 
+                                    annotations as one collection of full height bars, at most one of a color per pixel column. Defaults to False
+             rasterize (boolean): the data layers are embedded in the file as an image (at dpi), axes and text stay vector. 
+                                  keeps PDFs of dense plots small and quick to open. Defaults to False
+             image_format (string): format (and extension) of the saved file, e.g. "pdf" or "png". Defaults to "pdf"
+             dpi (int): resolution of png output and of rasterized layers; high_volume thins to it. Defaults to the figure dpi
+             profiler (profiling.Profiler): optional; records the time of the aggregate, draw, layout and save phases and the points per key and window.
+                                            defaults to the profiler of the enclosing profiling.profile() block, if any
              
         Returns:
              None, but writes to disk if save_instead_plot is True
     """
-    fig = plt.figure()#setup the main graph
+    import matplotlib.gridspec as gridspec
+    profiler = profiling.current(profiler)
+    fig = _new_figure(save_instead_plot)#setup the main graph
     total_plots = len(start_dates)
     gs =  gridspec.GridSpec(total_plots, 1)
     gs.update(wspace=0, hspace=0.05) # set the spacing between axes. 
     
+    with profiler.phase("aggregate"):
+        ts_dict = aggregation._wrap_table(ts_dict) #sorted once for both the states and the annotations
+        transitions = aggregation.state_transitions(ts_dict, minor_granularity, start_dates, end_dates)
+        events = aggregation.annotation_events(ts_dict, start_dates, end_dates)
+    _report_outside_windows(ts_dict, "state points")
+    _count_points(profiler, "state changes", transitions)
+    _count_points(profiler, "annotations", events)
+    windows = aggregation._windows_ns(start_dates, end_dates)
+    pixels = _data_pixels(fig, total_plots, dpi)
  
-    for dindex, date in enumerate(start_dates): #make sure to sort or else the different lines will be different colors on different plots!! 
-        major_loc, major_fmt, minor_loc, minor_fmt, pandas_freq  = _timeseries_frequency_helper(major_granularity, minor_granularity)
+    with profiler.phase("draw"):
+        for dindex, date in enumerate(start_dates): #make sure to sort or else the different lines will be different colors on different plots!! 
+            major_loc, major_fmt, minor_loc, minor_fmt = _timeseries_frequency_helper(major_granularity, minor_granularity)
          
-        ax = plt.subplot(gs[dindex, 0])
-        
-        plot_dict = {}
+            ax = fig.add_subplot(gs[dindex, 0])
         
-        min_all_values = None
-        max_all_values = None
+            min_all_values = None
+            max_all_values = None
+            series = []
+            event_series = []
         
-        for kindex, k in enumerate(ts_dict.keys()):
-            if not len(ts_dict[k]["ts"]) > 0:
-                print("No data for key {0}".format(k))
-            else:
-                this_ts = sorted([i for i in ts_dict[k]["ts"] if i[0] >= start_dates[dindex] and i[0] <= end_dates[dindex]])
-                all_values = [i[1] for i in this_ts]
-                min_all_values = min(min_all_values, min(all_values)) if min_all_values else min(all_values)
-                max_all_values = max(max_all_values, max(all_values)) if max_all_values else max(all_values)
-                ts = pandas.Series(all_values, index=[i[0] for i in this_ts]).asfreq(pandas_freq,method = 'ffill')
-                ax.plot_date([d.to_datetime() for d,s in ts.iteritems()], [s for s in ts],  '-', label=k, color=_colors[kindex % 5], mew=2, linewidth=2)
-                if "event_ts" in ts_dict[k]:
-                    this_ts2 = sorted([i for i in ts_dict[k]["event_ts"] if i[0] >= start_dates[dindex] and i[0] <= end_dates[dindex]])
-                    ts = pandas.Series([0 for i in [i[0] for i in this_ts2]], index=[i[0] for i in this_ts2])
-                    ax.plot_date([d.to_datetime() for d,s in ts.iteritems()], [s for s in ts], '|', alpha=.3, color=_colors[kindex % 5], mew=2, linewidth = 2, markersize=400)
-                    if print_annotated_records_in_range:
-                        print("Records in range for key {0}:".format(k))
-                        for i in sorted(this_ts + this_ts2):
-                            print(i)
-
-        _format(ax, major_loc, major_fmt, major_granularity, minor_loc, minor_fmt, minor_granularity, dindex, title, ylab, min_all_values, max_all_values) # format the ticks and the plotc        
+            for kindex, k in enumerate(transitions.keys()):
+                if transitions[k] is None:
+                    print("No data for key {0}".format(k))
+                else:
+                    change_times, values = transitions[k][dindex]
+                    if len(values) > 0:
+                        min_all_values = min(min_all_values, values.min()) if min_all_values is not None else values.min()
+                        max_all_values = max(max_all_values, values.max()) if max_all_values is not None else values.max()
+                    #one point per state change, drawn as a step; the line holds each value until the next change
+                    if high_volume:
+                        series.append((_colors[kindex % 5], k, change_times, values))
+                    else:
+                        ax.plot(_to_datetimes(change_times), values,  '-', label=k, color=_colors[kindex % 5], mew=2, linewidth=2, drawstyle='steps-post', rasterized=rasterize)
+                    if events[k] is not None:
+                        event_times, event_labels = events[k][dindex]
+                        if high_volume:
+                            event_series.append((_colors[kindex % 5], event_times))
+                        else:
+                            ax.plot(_to_datetimes(event_times), [0]*len(event_times), '|', alpha=.3, color=_colors[kindex % 5], mew=2, linewidth = 2, markersize=400, rasterized=rasterize)
+                        if print_annotated_records_in_range:
+                            print("Records in range for key {0}:".format(k))
+                            if isinstance(ts_dict, dict):
+                                this_ts = [i for i in ts_dict[k]["ts"] if i[0] >= start_dates[dindex] and i[0] <= end_dates[dindex]]
+                                this_ts2 = [i for i in ts_dict[k]["event_ts"] if i[0] >= start_dates[dindex] and i[0] <= end_dates[dindex]]
+                            else: #the raw state points of a stream are gone by now, only the events are left
+                                this_ts = []
+                                this_ts2 = list(zip(_to_datetimes(event_times), event_labels))
+                            for i in sorted(this_ts + this_ts2):
+                                print(i)
+            if high_volume:
+                _draw_events(ax, event_series, windows[dindex], pixels, rasterize) #under the lines, where most of them ended up before
+                _draw_steps(ax, series, windows[dindex], pixels, rasterize)
+                ax.autoscale_view()
+            ax.xaxis_date()
+
+            _format(ax, major_loc, major_fmt, major_granularity, minor_loc, minor_fmt, minor_granularity, dindex, title, ylab, min_all_values, max_all_values, 'upper right' if high_volume else 'best') # format the ticks and the plotc        
             
-    _finalize_helper(gs, save_instead_plot, fname, fig)        
+    _finalize_helper(gs, save_instead_plot, fname, fig, image_format, dpi, profiler)        
                 
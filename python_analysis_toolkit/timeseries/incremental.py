@@ -0,0 +1,152 @@
+import numpy
+from collections import OrderedDict
+
+from python_analysis_toolkit.timeseries import aggregation
+
+"""
+Incrementally maintained plot_event_frequency aggregates, for charts that are regenerated as new events arrive.
+The bucket counts of every key and window are kept between refreshes; appending events only touches the buckets they fall in,
+so an append costs time proportional to the new events, not to the whole history, and reading the counts back returns views
+(one per key and window) without copying them.
+"""
+
+"""
+Internal Helper Functions
+"""
+
+class _WindowCounts(object):
+    """
+        dense counts of one key in one window, from the bucket of the first event to the bucket of the last, grown as events arrive.
+        starts holds the bucket start of every slot of counts; it is rebuilt only when counts is reallocated
+    """
+    __slots__ = ("first", "last", "counts", "starts")
+
+    def __init__(self):
+        self.first = None
+        self.last = None
+        self.counts = numpy.zeros(0, dtype='int64')
+        self.starts = None
+
+    def add(self, buckets):
+        lo, hi = int(buckets.min()), int(buckets.max())
+        if self.first is None:
+            self.first, self.last = lo, hi
+            self.counts = numpy.zeros(hi - lo + 1, dtype='int64')
+        if lo < self.first: #late events before everything so far
+            grown = numpy.zeros(self.first - lo + len(self.counts), dtype='int64')
+            grown[self.first - lo:] = self.counts
+            self.counts, self.first, self.starts = grown, lo, None
+        if hi - self.first >= len(self.counts): #capacity doubles, so appending in time order is amortized O(1) per bucket
+            grown = numpy.zeros(max(hi - self.first + 1, 2*len(self.counts)), dtype='int64')
+            grown[:len(self.counts)] = self.counts
+            self.counts, self.starts = grown, None
+        self.last = max(self.last, hi)
+        new = numpy.bincount(buckets - lo) #only the span of the new events
+        self.counts[lo - self.first:lo - self.first + len(new)] += new
+
+    def result(self, unit):
+        """(bucket_starts, counts) views, valid until the next add"""
+        if self.first is None:
+            return numpy.zeros(0, dtype='datetime64[ns]'), numpy.zeros(0, dtype='int64')
+        if self.starts is None:
+            self.starts = aggregation._unit_to_datetime64(numpy.arange(self.first, self.first + len(self.counts), dtype='int64'), unit)
+        n = self.last - self.first + 1
+        return self.starts[:n], self.counts[:n]
+
+
+"""
+Public Functions
+"""
+
+class IncrementalCounts(object):
+    """
+        The per key, per window bucket counts of plot_event_frequency, updated in place as events are appended.
+        Pass it to plot_event_frequency in place of ts_dict, with the same minor_granularity, start_dates and end_dates it was created with.
+
+        inc = IncrementalCounts("hours", start_dates, end_dates, allowed_lateness = timedelta(minutes=30))
+        inc.append(ts_dict_of_new_events)
+        plot_event_frequency(inc, "days", "hours", start_dates, end_dates, save_instead_plot = True, fname = "dashboard")
+
+        Args:
+            minor_granularity (string): can be months, days, hours, minutes, seconds
+            start_dates (list of Datetime Objects): start of each window (inclusive)
+            end_dates (list of Datetime Objects):   end of each window (inclusive)
+            allowed_lateness (timedelta): optional. events may arrive out of order, but an event older than allowed_lateness before
+                                          the latest event of the previous appends is dropped (and counted in late_counts). None accepts every event
+            key_order (list): optional; keys to report (as "No data") before they have any events, fixes the order of the first keys
+
+        Cost: append is O(new events) (plus an amortized reallocation when a window's buckets outgrow their capacity). Reading the counts
+        (event_frequency_counts, so every plot_event_frequency refresh) is O(keys x windows): each window is returned as views of the kept
+        arrays, not copied, and drawing is then proportional to the buckets drawn. The views change with the next append; copy them to keep a snapshot.
+
+        Attributes:
+            outside_window_counts (dictionary): per key, the appended events that fell outside every window
+            late_counts (dictionary): per key, the events dropped for being later than allowed_lateness
+    """
+    def __init__(self, minor_granularity, start_dates, end_dates, allowed_lateness = None, key_order = None):
+        self.minor_granularity = minor_granularity
+        self._unit = aggregation._granularity_unit(minor_granularity)
+        self._windows = aggregation._windows_ns(start_dates, end_dates)
+        self._lateness_ns = None if allowed_lateness is None else int(numpy.timedelta64(allowed_lateness, 'ns').astype('int64'))
+        self._latest_ns = None
+        self._counts = OrderedDict()
+        self._events = {}
+        self.outside_window_counts = {}
+        self.late_counts = {}
+        for k in key_order or []:
+            self._add_key(k)
+
+    def _add_key(self, k):
+        self._counts[k] = [_WindowCounts() for w in self._windows]
+        self._events[k] = 0
+        self.outside_window_counts[k] = 0
+        self.late_counts[k] = 0
+
+    def keys(self):
+        return list(self._counts.keys())
+
+    def append(self, ts_dict):
+        """
+            adds new events, in the plot_event_frequency ts_dict format ({key : list of DateTimes}, or arrays of datetime64s / epoch ns).
+            returns the number of events accepted
+        """
+        accepted, latest = 0, self._latest_ns
+        for k, timestamps in ts_dict.items():
+            if k not in self._counts:
+                self._add_key(k)
+            if len(timestamps) == 0:
+                continue
+            ns = aggregation._to_epoch_ns(timestamps)
+            if self._lateness_ns is not None and self._latest_ns is not None:
+                late = ns < self._latest_ns - self._lateness_ns
+                self.late_counts[k] += int(late.sum())
+                ns = ns[~late]
+                if len(ns) == 0:
+                    continue
+            buckets = aggregation._floor_to_unit(ns, self._unit)
+            outside = numpy.ones(len(ns), dtype=bool)
+            for window, (s, e) in zip(self._counts[k], self._windows):
+                inside = (ns >= s) & (ns <= e)
+                if inside.any():
+                    window.add(buckets[inside])
+                    outside &= ~inside
+            self.outside_window_counts[k] += int(outside.sum())
+            self._events[k] += len(ns)
+            accepted += len(ns)
+            latest = int(ns.max()) if latest is None else max(latest, int(ns.max()))
+        self._latest_ns = latest #the lateness bound moves once per append, so the order of keys within an append does not matter
+        return accepted
+
+    #aggregation, called by plot_event_frequency through the aggregation module
+
+    def event_frequency_counts(self, minor_granularity, start_dates, end_dates):
+        """
+            same result as aggregation.event_frequency_counts on every event appended so far (minus the late ones), from the kept counts.
+            the arrays are views of the kept counts, valid until the next append
+        """
+        if minor_granularity != self.minor_granularity or aggregation._windows_ns(start_dates, end_dates) != self._windows:
+            raise Exception("These counts were kept for {0} buckets over other windows; plot with the minor_granularity, start_dates and end_dates they were created with".format(self.minor_granularity))
+        counts = OrderedDict()
+        for k, windows in self._counts.items():
+            counts[k] = [w.result(self._unit) for w in windows] if self._events[k] > 0 else None
+        return counts
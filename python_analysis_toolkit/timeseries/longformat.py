@@ -0,0 +1,189 @@
+import numpy
+from collections import OrderedDict
+
+from python_analysis_toolkit.timeseries import aggregation
+from python_analysis_toolkit.timeseries.containers import KeyedSeries
+
+"""
+Long format (one row per point: key, timestamp, value) input for plot_event_frequency and state_diagram.
+The table is sorted once by (key, time, value); every window is then filtered, bucketed and counted for all keys together
+with whole-array operations, so thousands of keys cost about as much as a handful.
+"""
+
+"""
+Internal Helper Functions
+"""
+
+def _has_column(table, name):
+    if hasattr(table, "columns"): #pandas DataFrame
+        return name in table.columns
+    if getattr(table, "dtype", None) is not None and table.dtype.names is not None: #numpy structured array
+        return name in table.dtype.names
+    return name in table #dictionary of arrays
+
+def _column(table, name):
+    if not _has_column(table, name):
+        raise Exception("No column {0} in the long format table".format(name))
+    column = table[name]
+    return numpy.asarray(column.values if hasattr(column, "values") else column)
+
+def _key_bounds(sorted_key_ids, n_keys):
+    """offsets of every key's rows in an array of key ids sorted ascending: key i is [bounds[i], bounds[i+1])"""
+    return numpy.searchsorted(sorted_key_ids, numpy.arange(n_keys + 1))
+
+
+class LongFormat(object):
+    """
+        Wraps a long format table so it can be passed to plot_event_frequency or state_diagram in place of ts_dict.
+
+        Args:
+            table: a pandas DataFrame, a numpy structured array, or a dictionary of equal length arrays, one row per point
+            key_column (string): the key of every row, e.g. a household id. default "key"
+            time_column (string): DateTimes, datetime64s, or epoch ns ints. default "timestamp"
+            value_column (string): the state values (floats) for state_diagram, or the labels of an annotation table.
+                                   default "value"; a table without that column is an event table (for plot_event_frequency)
+            key_order (list): optional; fixes the key order (and so the colors) and keeps only these keys. defaults to the sorted keys.
+                              keys without rows are reported as "No data"
+            events (LongFormat): optional; the annotations drawn as vertical bars by state_diagram (the "event_ts" of a ts_dict),
+                                 e.g. LongFormat(annotations, value_column="label")
+    """
+    def __init__(self, table, key_column = "key", time_column = "timestamp", value_column = "value", key_order = None, events = None):
+        keys = _column(table, key_column)
+        times = aggregation._to_epoch_ns(_column(table, time_column))
+        values = _column(table, value_column) if value_column is not None and _has_column(table, value_column) else None
+        if values is not None and values.dtype.kind in 'biu':
+            values = values.astype('float64')
+
+        unique_keys, key_ids = numpy.unique(keys, return_inverse=True)
+        key_ids = key_ids.ravel()
+        if key_order is not None:
+            position = dict((k, i) for i, k in enumerate(key_order))
+            remap = numpy.array([position.get(k, -1) for k in unique_keys.tolist()], dtype='int64')
+            key_ids = remap[key_ids]
+            keep = key_ids >= 0
+            key_ids, times = key_ids[keep], times[keep]
+            values = None if values is None else values[keep]
+            unique_keys = list(key_order)
+        else:
+            unique_keys = unique_keys.tolist()
+
+        if values is not None and values.dtype.kind in 'fUS':
+            order = numpy.lexsort((values, times, key_ids)) #ties in time are ordered by value, like sorted() on (DateTime, value) tuples
+        else:
+            order = numpy.lexsort((times, key_ids))
+        self._keys = unique_keys
+        self._index = dict((k, i) for i, k in enumerate(unique_keys))
+        self.key_ids = key_ids[order].astype('int64')
+        self.times = times[order]
+        self.values = None if values is None else values[order]
+        self.events = events
+
+    def keys(self):
+        return list(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def to_keyed_series(self):
+        """the same data as a containers.KeyedSeries (numeric values only; annotations are converted too)"""
+        if self.values is not None and self.values.dtype.kind not in 'f':
+            series = KeyedSeries.from_arrays(self._keys_of_rows(), self.times, labels = self.values, key_order = self._keys)
+        else:
+            series = KeyedSeries(self._keys, _key_bounds(self.key_ids, len(self._keys)), self.times, self.values)
+        if self.events is not None:
+            series.events = self.events.to_keyed_series()
+        return series
+
+    def _keys_of_rows(self):
+        keys = numpy.empty(len(self._keys), dtype=object)
+        keys[:] = self._keys
+        return keys[self.key_ids]
+
+    def _window(self, start_ns, end_ns):
+        """(key ids, times, values or None) of the rows within [start_ns, end_ns], still sorted by (key, time)"""
+        inside = (self.times >= start_ns) & (self.times <= end_ns)
+        return self.key_ids[inside], self.times[inside], None if self.values is None else self.values[inside]
+
+    def _window_counts(self, start_ns, end_ns, unit):
+        """per key (bucket_starts, counts) for one window: one bincount over every key's buckets laid end to end"""
+        n_keys = len(self._keys)
+        key_ids, times, values = self._window(start_ns, end_ns)
+        buckets = aggregation._floor_to_unit(times, unit)
+        bounds = _key_bounds(key_ids, n_keys)
+        present = bounds[1:] > bounds[:-1]
+        first = numpy.zeros(n_keys, dtype='int64')
+        last = numpy.zeros(n_keys, dtype='int64')
+        first[present] = buckets[bounds[:-1][present]]
+        last[present] = buckets[bounds[1:][present] - 1]
+        lengths = numpy.where(present, last - first + 1, 0) #from the bucket of the first event to the bucket of the last, like _bucket_counts
+        offsets = numpy.zeros(n_keys + 1, dtype='int64')
+        offsets[1:] = numpy.cumsum(lengths)
+        counts = numpy.bincount(offsets[key_ids] + buckets - first[key_ids], minlength=offsets[-1]).astype('int64')
+        bucket_starts = aggregation._unit_to_datetime64(numpy.arange(offsets[-1], dtype='int64') + numpy.repeat(first - offsets[:-1], lengths), unit)
+        return [(bucket_starts[offsets[i]:offsets[i+1]], counts[offsets[i]:offsets[i+1]]) for i in range(n_keys)]
+
+    def _window_steps(self, start_ns, end_ns, unit):
+        """per key (change_times, values) for one window: _state_steps, for every key at once"""
+        n_keys = len(self._keys)
+        key_ids, times, values = self._window(start_ns, end_ns)
+        if len(key_ids) == 0:
+            return [(numpy.zeros(0, dtype='datetime64[ns]'), numpy.zeros(0, dtype='float64')) for i in range(n_keys)]
+        buckets = aggregation._floor_to_unit(times, unit)
+        key_ends = numpy.append(key_ids[1:] != key_ids[:-1], True)
+        last_in_bucket = key_ends | numpy.append(buckets[1:] != buckets[:-1], True)
+        key_ids, buckets, values = key_ids[last_in_bucket], buckets[last_in_bucket], values[last_in_bucket].astype('float64')
+        key_starts = numpy.append(True, key_ids[1:] != key_ids[:-1])
+        key_ends = numpy.append(key_ids[1:] != key_ids[:-1], True)
+        keep = key_starts | numpy.append(True, values[1:] != values[:-1]) | key_ends #the final point of every key is kept
+        key_ids = key_ids[keep]
+        change_times = aggregation._unit_to_datetime64(buckets[keep], unit)
+        values = values[keep]
+        bounds = _key_bounds(key_ids, n_keys)
+        return [(change_times[bounds[i]:bounds[i+1]], values[bounds[i]:bounds[i+1]]) for i in range(n_keys)]
+
+    def _keys_with_rows(self):
+        return numpy.bincount(self.key_ids, minlength=len(self._keys)) > 0
+
+    #aggregation, called by plot_event_frequency and state_diagram through the aggregation module
+
+    def event_frequency_counts(self, minor_granularity, start_dates, end_dates):
+        """same result as aggregation.event_frequency_counts"""
+        unit = aggregation._granularity_unit(minor_granularity)
+        per_window = [self._window_counts(s, e, unit) for s, e in aggregation._windows_ns(start_dates, end_dates)]
+        has_data = self._keys_with_rows()
+        counts = OrderedDict()
+        for i, k in enumerate(self._keys):
+            counts[k] = [w[i] for w in per_window] if has_data[i] else None
+        return counts
+
+    def state_transitions(self, minor_granularity, start_dates, end_dates):
+        """same result as aggregation.state_transitions"""
+        if self.values is None or self.values.dtype.kind not in 'f':
+            raise Exception("The table has no numeric values, so there are no states to plot")
+        unit = aggregation._granularity_unit(minor_granularity)
+        per_window = [self._window_steps(s, e, unit) for s, e in aggregation._windows_ns(start_dates, end_dates)]
+        has_data = self._keys_with_rows()
+        transitions = OrderedDict()
+        for i, k in enumerate(self._keys):
+            transitions[k] = [w[i] for w in per_window] if has_data[i] else None
+        return transitions
+
+    def annotation_events(self, start_dates, end_dates):
+        """same result as aggregation.annotation_events, from the events table; keys that are not in it have None"""
+        events = OrderedDict((k, None) for k in self._keys)
+        if self.events is None:
+            return events
+        if self.events.values is None:
+            raise Exception("The events table has no label column")
+        n_keys = len(self.events._keys)
+        for s, e in aggregation._windows_ns(start_dates, end_dates):
+            key_ids, times, labels = self.events._window(s, e)
+            bounds = _key_bounds(key_ids, n_keys)
+            times = times.view('datetime64[ns]')
+            for i, k in enumerate(self.events._keys):
+                if k in events:
+                    events[k] = (events[k] or []) + [(times[bounds[i]:bounds[i+1]], labels[bounds[i]:bounds[i+1]])]
+        return events
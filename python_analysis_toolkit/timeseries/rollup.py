@@ -0,0 +1,279 @@
+import json
+import numpy
+from collections import OrderedDict
+
+from python_analysis_toolkit.timeseries import aggregation
+from python_analysis_toolkit.timeseries.containers import KeyedSeries
+
+"""
+Precomputed multi-resolution rollups (a pyramid of seconds, minutes, hours, days and months buckets) for the graphing functions.
+Once built, re-plotting at another minor_granularity or over other windows reads the rollup level of that granularity
+instead of re-bucketing the raw events; only the two partial buckets at the edges of each window are read from the seconds level.
+
+Resolution: a rollup is exact to the second. An event at 12:00:00.700 is in the 12:00:00 bucket, and it is inside a window
+when its second (12:00:00) is; for timestamps in whole seconds (the usual case) results are identical to the raw ts_dict.
+"""
+
+"""
+Internal Helper Functions
+"""
+
+_level_names = ["seconds", "minutes", "hours", "days", "months"]
+_nanosecond = 10**9
+
+
+class _Level(object):
+    """one granularity of a Rollup: per key, the sorted non empty bucket numbers with their count (and min, max, last value for states)"""
+    __slots__ = ("offsets", "buckets", "counts", "minimum", "maximum", "last")
+
+    def __init__(self, offsets, buckets, counts, minimum = None, maximum = None, last = None):
+        self.offsets = offsets
+        self.buckets = buckets
+        self.counts = counts
+        self.minimum = minimum
+        self.maximum = maximum
+        self.last = last
+
+    def segment(self, i):
+        return slice(self.offsets[i], self.offsets[i+1])
+
+def _group(key_ids, buckets, counts, minimum, maximum, last, n_keys):
+    """merges consecutive rows with the same (key, bucket) into one. rows must be sorted by key, then bucket"""
+    if len(key_ids) == 0:
+        empty = numpy.zeros(0, dtype='float64') if minimum is not None else None
+        return _Level(numpy.zeros(n_keys + 1, dtype='int64'), numpy.zeros(0, dtype='int64'), numpy.zeros(0, dtype='int64'), empty, empty, empty)
+    new = numpy.ones(len(key_ids), dtype=bool)
+    new[1:] = (key_ids[1:] != key_ids[:-1]) | (buckets[1:] != buckets[:-1])
+    starts = numpy.flatnonzero(new)
+    ends = numpy.append(starts[1:], len(key_ids))
+    offsets = numpy.searchsorted(key_ids[starts], numpy.arange(n_keys + 1)).astype('int64')
+    if minimum is None:
+        return _Level(offsets, buckets[starts], numpy.add.reduceat(counts, starts))
+    return _Level(offsets, buckets[starts], numpy.add.reduceat(counts, starts),
+                  numpy.minimum.reduceat(minimum, starts), numpy.maximum.reduceat(maximum, starts), last[ends - 1])
+
+def _key_ids(offsets):
+    return numpy.repeat(numpy.arange(len(offsets) - 1), numpy.diff(offsets))
+
+def _bucket_start_ns(bucket, unit):
+    return int(aggregation._unit_to_datetime64(numpy.array([bucket], dtype='int64'), unit).view('int64')[0])
+
+def _bucket_of_ns(ns, unit):
+    return int(aggregation._floor_to_unit(numpy.array([ns], dtype='int64'), unit)[0])
+
+
+class Rollup(object):
+    """
+        Counts (and, for state series, min / max / last value) of every key at every granularity of seconds, minutes, hours, days and months.
+        Pass it to plot_event_frequency or state_diagram in place of ts_dict; any minor_granularity in that list and any windows can be drawn.
+
+        Build one with from_event_dict / from_state_dict from the existing ts_dict formats, or from_keyed_series
+        (a containers.KeyedSeries, or longformat.LongFormat.to_keyed_series()). save / load persist it to a single .npz file.
+
+        Attributes:
+            has_states (bool): True if min / max / last are kept (built from state series)
+            events (containers.KeyedSeries or None): the raw event_ts annotations of a state ts_dict, drawn by state_diagram
+    """
+    def __init__(self, keys, levels, has_states, events = None):
+        """prefer the from_* constructors"""
+        self._keys = list(keys)
+        self._index = dict((k, i) for i, k in enumerate(self._keys))
+        self._levels = levels
+        self.has_states = has_states
+        self.events = events
+        seconds = levels["seconds"]
+        self._cumulative_seconds = numpy.append(0, numpy.cumsum(seconds.counts)) #events in seconds buckets [i, j) = cumulative[j] - cumulative[i]
+
+    #construction
+
+    @classmethod
+    def from_keyed_series(cls, series):
+        n_keys = len(series.keys())
+        key_ids = _key_ids(series.offsets)
+        buckets = aggregation._floor_to_unit(series.times, 's')
+        values = series.values
+        level = _group(key_ids, buckets, numpy.ones(len(buckets), dtype='int64'), values, values, values, n_keys)
+        levels = {"seconds" : level}
+        for finer, name in zip(_level_names[:-1], _level_names[1:]):
+            ns = aggregation._unit_to_datetime64(level.buckets, aggregation._numpy_units[finer]).view('int64')
+            level = _group(_key_ids(level.offsets), aggregation._floor_to_unit(ns, aggregation._numpy_units[name]),
+                           level.counts, level.minimum, level.maximum, level.last, n_keys)
+            levels[name] = level
+        return cls(series.keys(), levels, values is not None, series.events)
+
+    @classmethod
+    def from_event_dict(cls, ts_dict):
+        """builds the rollup of a plot_event_frequency ts_dict, {key : list of DateTimes}"""
+        return cls.from_keyed_series(KeyedSeries.from_event_dict(ts_dict))
+
+    @classmethod
+    def from_state_dict(cls, ts_dict):
+        """builds the rollup of a state_diagram ts_dict, {key : {"ts" : [(DateTime, float)], "event_ts" (optional) : [(DateTime, label)]}}"""
+        return cls.from_keyed_series(KeyedSeries.from_state_dict(ts_dict))
+
+    #persistence
+
+    def save(self, path):
+        """writes the rollup to one .npz file. keys (and non numeric event_ts labels, if any) must be JSON serializable"""
+        arrays = {"keys" : numpy.array(json.dumps(self._keys)), "has_states" : numpy.array(self.has_states)}
+        for name in _level_names:
+            level = self._levels[name]
+            for field in _Level.__slots__:
+                if getattr(level, field) is not None:
+                    arrays["{0}_{1}".format(name, field)] = getattr(level, field)
+        if self.events is not None:
+            arrays["events_keys"] = numpy.array(json.dumps(self.events.keys()))
+            arrays["events_offsets"], arrays["events_times"] = self.events.offsets, self.events.times
+            if self.events.codes is not None:
+                arrays["events_categories"] = numpy.array(json.dumps(self.events.categories))
+                arrays["events_codes"] = self.events.codes
+            if self.events.values is not None: #numeric labels
+                arrays["events_values"] = self.events.values
+        with open(path, "wb") as f:
+            numpy.savez(f, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with numpy.load(path) as npz:
+            levels = {}
+            for name in _level_names:
+                levels[name] = _Level(*[npz["{0}_{1}".format(name, field)] if "{0}_{1}".format(name, field) in npz.files else None
+                                        for field in _Level.__slots__])
+            events = None
+            if "events_keys" in npz.files:
+                codes, categories = None, None
+                if "events_codes" in npz.files:
+                    codes, categories = npz["events_codes"], json.loads(str(npz["events_categories"]))
+                events = KeyedSeries(json.loads(str(npz["events_keys"])), npz["events_offsets"], npz["events_times"],
+                                     npz["events_values"] if "events_values" in npz.files else None, codes, categories)
+            return cls(json.loads(str(npz["keys"])), levels, bool(npz["has_states"]), events)
+
+    #access
+
+    def keys(self):
+        return list(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def level(self, key, granularity):
+        """
+            the non empty buckets of key at granularity (seconds, minutes, hours, days or months), as a dictionary of arrays:
+            "bucket_starts" (datetime64[ns]), "counts", and for state rollups "min", "max" and "last" (the last value in each bucket)
+        """
+        level = self._levels[granularity]
+        seg = level.segment(self._index[key])
+        result = {"bucket_starts" : aggregation._unit_to_datetime64(level.buckets[seg], aggregation._granularity_unit(granularity)),
+                  "counts" : level.counts[seg]}
+        if self.has_states:
+            result.update({"min" : level.minimum[seg], "max" : level.maximum[seg], "last" : level.last[seg]})
+        return result
+
+    @property
+    def nbytes(self):
+        return sum(getattr(level, field).nbytes for level in self._levels.values() for field in _Level.__slots__ if getattr(level, field) is not None)
+
+    #windows
+
+    def _seconds_range(self, i, start_ns, end_ns):
+        """global index range [lo, hi) of key i's seconds buckets that start within [start_ns, end_ns]"""
+        seconds = self._levels["seconds"]
+        seg = seconds.segment(i)
+        buckets = seconds.buckets[seg]
+        lo = numpy.searchsorted(buckets, -(-start_ns // _nanosecond), side='left')
+        hi = numpy.searchsorted(buckets, end_ns // _nanosecond, side='right')
+        return seg.start + lo, seg.start + hi
+
+    def _window_buckets(self, i, granularity, start_ns, end_ns):
+        """
+            splits [start_ns, end_ns] at granularity into the buckets wholly inside it (a slice of key i's level) and the partial buckets
+            at either end. returns (level, whole buckets slice, left, right) where left and right are [] or [(partial bucket, seconds index range lo, hi)]
+        """
+        unit = aggregation._granularity_unit(granularity)
+        level = self._levels[granularity]
+        seg = level.segment(i)
+        first, last = _bucket_of_ns(start_ns, unit), _bucket_of_ns(end_ns, unit)
+        first_whole = first if _bucket_start_ns(first, unit) == start_ns else first + 1
+        last_whole = last if _bucket_start_ns(last + 1, unit) - 1 <= end_ns else last - 1
+        buckets = level.buckets[seg]
+        whole = slice(seg.start + numpy.searchsorted(buckets, first_whole, side='left'), seg.start + numpy.searchsorted(buckets, last_whole, side='right'))
+        if first_whole > last_whole:
+            whole = slice(seg.start, seg.start)
+        left, right = [], []
+        if first < first_whole:
+            left.append((first,) + self._seconds_range(i, start_ns, min(end_ns, _bucket_start_ns(first + 1, unit) - 1)))
+        if last > last_whole and not (last == first and left):
+            right.append((last,) + self._seconds_range(i, max(start_ns, _bucket_start_ns(last, unit)), end_ns))
+        return level, whole, left, right
+
+    def _key_counts(self, i, granularity, start_ns, end_ns):
+        level, whole, left, right = self._window_buckets(i, granularity, start_ns, end_ns)
+        edge_buckets = lambda partial: numpy.array([b for b, lo, hi in partial], dtype='int64')
+        edge_counts = lambda partial: numpy.array([self._cumulative_seconds[hi] - self._cumulative_seconds[lo] for b, lo, hi in partial], dtype='int64')
+        buckets = numpy.concatenate([edge_buckets(left), level.buckets[whole], edge_buckets(right)])
+        counts = numpy.concatenate([edge_counts(left), level.counts[whole], edge_counts(right)])
+        nonzero = counts > 0
+        buckets, counts = buckets[nonzero], counts[nonzero]
+        if len(buckets) == 0:
+            return numpy.zeros(0, dtype='datetime64[ns]'), numpy.zeros(0, dtype='int64')
+        first = buckets.min()
+        dense = numpy.zeros(buckets.max() - first + 1, dtype='int64') #empty buckets between the first and last event, like _bucket_counts
+        dense[buckets - first] = counts
+        return aggregation._unit_to_datetime64(numpy.arange(first, first + len(dense), dtype='int64'), aggregation._granularity_unit(granularity)), dense
+
+    def _key_steps(self, i, granularity, start_ns, end_ns):
+        level, whole, left, right = self._window_buckets(i, granularity, start_ns, end_ns)
+        last_seconds = self._levels["seconds"].last
+        #the last value of a partial bucket is the last value of its last seconds bucket inside the window
+        left = [(b, last_seconds[hi - 1]) for b, lo, hi in left if hi > lo]
+        right = [(b, last_seconds[hi - 1]) for b, lo, hi in right if hi > lo]
+        buckets = numpy.concatenate([numpy.array([b for b, v in left], dtype='int64'), level.buckets[whole], numpy.array([b for b, v in right], dtype='int64')])
+        values = numpy.concatenate([numpy.array([v for b, v in left], dtype='float64'), level.last[whole], numpy.array([v for b, v in right], dtype='float64')])
+        if len(buckets) == 0:
+            return numpy.zeros(0, dtype='datetime64[ns]'), numpy.zeros(0, dtype='float64')
+        keep = numpy.append(True, values[1:] != values[:-1])
+        keep[-1] = True
+        return aggregation._unit_to_datetime64(buckets[keep], aggregation._granularity_unit(granularity)), values[keep]
+
+    #aggregation, called by plot_event_frequency and state_diagram through the aggregation module
+
+    def _has_data(self, i):
+        seconds = self._levels["seconds"]
+        return seconds.offsets[i+1] > seconds.offsets[i]
+
+    def event_frequency_counts(self, minor_granularity, start_dates, end_dates):
+        """same result as aggregation.event_frequency_counts (see the module docstring on resolution)"""
+        aggregation._granularity_unit(minor_granularity)
+        windows = aggregation._windows_ns(start_dates, end_dates)
+        counts = OrderedDict()
+        for i, k in enumerate(self._keys):
+            counts[k] = [self._key_counts(i, minor_granularity, s, e) for s, e in windows] if self._has_data(i) else None
+        return counts
+
+    def state_transitions(self, minor_granularity, start_dates, end_dates):
+        """same result as aggregation.state_transitions (see the module docstring on resolution)"""
+        if not self.has_states:
+            raise Exception("The rollup was built from events, so there are no states to plot")
+        aggregation._granularity_unit(minor_granularity)
+        windows = aggregation._windows_ns(start_dates, end_dates)
+        transitions = OrderedDict()
+        for i, k in enumerate(self._keys):
+            transitions[k] = [self._key_steps(i, minor_granularity, s, e) for s, e in windows] if self._has_data(i) else None
+        return transitions
+
+    def annotation_events(self, start_dates, end_dates):
+        """same result as aggregation.annotation_events, from the raw event_ts annotations"""
+        events = OrderedDict((k, None) for k in self._keys)
+        if self.events is None:
+            return events
+        windows = aggregation._windows_ns(start_dates, end_dates)
+        categories = None if self.events.codes is None else self.events._category_array()
+        for k in self.events.keys():
+            if k in events:
+                windowed = [self.events.window(k, s, e) for s, e in windows]
+                #numeric labels are kept as values, like KeyedSeries._window_labels
+                events[k] = [(times.view('datetime64[ns]'), values if codes is None else categories[codes]) for times, values, codes in windowed]
+        return events
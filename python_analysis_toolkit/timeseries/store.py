@@ -0,0 +1,236 @@
+import os
+import json
+import numpy
+
+from python_analysis_toolkit.timeseries import aggregation
+from python_analysis_toolkit.timeseries.containers import KeyedSeries
+
+"""
+Binary, columnar on-disk store for multi-key event histories, read through numpy.memmap.
+
+A store is a directory holding:
+    times.<generation>.i8    int64 epoch ns, one sorted segment per key per write
+    values.<generation>.f8   float64 values, parallel to times (only for stores with values)
+    index.json               {"version" : 1, "generation" : int, "times_file" : name, "values_file" : name, "has_values" : bool,
+                              "keys" : [{"key" : key, "segments" : [[offset, length, min_ns, max_ns], ...]}, ...]}
+(stores written before generations existed have times.i8 / values.f8 and no generation fields; they are read the same way.)
+
+Appends add to the column files and then replace index.json, so a reader never sees a half written segment.
+write_store and compact_store write a new generation of column files next to the old ones and only then replace index.json,
+so until that os.replace the store on disk is the old one, whole; the old column files are removed after it.
+Keys must be JSON serializable (strings or ints).
+An EventStore can be passed to plot_event_frequency / state_diagram directly: only the pages that hold the plotted windows are read from disk.
+"""
+
+"""
+Internal Helper Functions
+"""
+
+_times_file = "times.i8"
+_values_file = "values.f8"
+_index_file = "index.json"
+_version = 1
+
+
+def _as_keyed_series(data):
+    """accepts a KeyedSeries, {key : list of DateTimes}, or {key : list of (DateTime, float) tuples}"""
+    if isinstance(data, KeyedSeries):
+        return data
+    first = next((v for v in data.values() if len(v) > 0), None)
+    if first is not None and isinstance(first[0], tuple):
+        return KeyedSeries.from_pairs_dict(data)
+    return KeyedSeries.from_event_dict(data)
+
+def _read_index(path):
+    with open(os.path.join(path, _index_file)) as f:
+        return json.load(f)
+
+def _write_index(path, index):
+    tmp = os.path.join(path, _index_file + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp, os.path.join(path, _index_file))
+
+def _column_files(index):
+    return index.get("times_file", _times_file), index.get("values_file", _values_file)
+
+def _new_index(path, has_values):
+    """an empty index whose column files are the next generation after the store at path (if any), so nothing in use is overwritten"""
+    generation = 1
+    if os.path.exists(os.path.join(path, _index_file)):
+        generation += _read_index(path).get("generation", 0)
+    return {"version" : _version, "generation" : generation, "times_file" : "times.{0}.i8".format(generation),
+            "values_file" : "values.{0}.f8".format(generation), "has_values" : has_values, "keys" : []}
+
+def _remove_unreferenced(path, index):
+    """deletes the column files of earlier generations (and of writes that failed before their index was written)"""
+    for name in set(os.listdir(path)) - set(_column_files(index)):
+        if (name.startswith("times.") and name.endswith(".i8")) or (name.startswith("values.") and name.endswith(".f8")):
+            try:
+                os.remove(os.path.join(path, name))
+            except OSError: #still mapped by a reader on Windows; the next write_store or compact_store tries again
+                pass
+
+def _append_columns(path, index, series):
+    """appends one segment per non-empty key of series to the column files and records them in index (in place)"""
+    if series.codes is not None:
+        raise Exception("Only numeric values can be stored; category labels are not supported")
+    if index["has_values"] != (series.values is not None):
+        raise Exception("The store {0} values".format("has" if index["has_values"] else "does not have"))
+    entries = dict((e["key"], e) for e in index["keys"])
+    stored = sum(seg[1] for e in index["keys"] for seg in e["segments"])
+    times_file, values_file = _column_files(index)
+    with open(os.path.join(path, times_file), "ab") as f:
+        f.truncate(stored*8) #drop anything a failed earlier write left past the indexed data
+        offset = stored
+        for k in series.keys():
+            if k not in entries: #empty keys are recorded too, so they are reported as "No data" like in a ts_dict
+                entries[k] = {"key" : k, "segments" : []}
+                index["keys"].append(entries[k])
+            times = series.times_for(k)
+            if len(times) == 0:
+                continue
+            times.tofile(f)
+            entries[k]["segments"].append([offset, len(times), int(times[0]), int(times[-1])])
+            offset += len(times)
+    if index["has_values"]:
+        with open(os.path.join(path, values_file), "ab") as f:
+            f.truncate(stored*8)
+            for k in series.keys():
+                series.values_for(k).tofile(f)
+
+
+"""
+Public Functions
+"""
+
+def write_store(path, data):
+    """
+        Creates (or overwrites) a store at path.
+
+        Args:
+            path (string): directory for the store, created if needed
+            data: a containers.KeyedSeries, a plot_event_frequency ts_dict ({key : list of DateTimes}),
+                  or {key : list of (DateTime, float) tuples} (e.g. {k : ts_dict[k]["ts"]} for a state_diagram ts_dict)
+    """
+    series = _as_keyed_series(data)
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    index = _new_index(path, series.values is not None)
+    _append_columns(path, index, series)
+    _write_index(path, index) #the new store replaces the old one here, in one os.replace
+    _remove_unreferenced(path, index)
+
+def append_to_store(path, data):
+    """
+        Appends new points (same formats as write_store) to an existing store. Each key gets one new sorted segment;
+        the new points do not have to come after the stored ones, but stores with many overlapping segments read slower, see compact_store.
+    """
+    index = _read_index(path)
+    _append_columns(path, index, _as_keyed_series(data))
+    _write_index(path, index)
+
+def compact_store(path):
+    """
+        rewrites a store so that every key is one contiguous sorted segment.
+        one key is read (and, if its segments overlap, sorted) at a time, so memory is bounded by the largest key, not by the store
+    """
+    store = EventStore(path)
+    index = _new_index(path, store.has_values)
+    lo, hi = numpy.iinfo('int64').min, numpy.iinfo('int64').max
+    for k in store.keys():
+        times, values = store._window_arrays(k, lo, hi)
+        _append_columns(path, index, KeyedSeries([k], [0, len(times)], times, values))
+    del store #drop the memmaps before the old files are removed
+    _write_index(path, index)
+    _remove_unreferenced(path, index)
+
+
+class EventStore(object):
+    """
+        Read-only view of a store. The column files are opened with numpy.memmap; a window of one key is found with a binary search
+        over that key's segments, so reading a window touches only the pages it covers.
+
+        Pass it to plot_event_frequency (or, for stores with values, state_diagram) in place of ts_dict.
+    """
+    def __init__(self, path):
+        self.path = path
+        index = _read_index(path)
+        if index["version"] != _version:
+            raise Exception("Unsupported store version {0}".format(index["version"]))
+        self.has_values = index["has_values"]
+        self._segments = dict((e["key"], e["segments"]) for e in index["keys"])
+        self._keys = [e["key"] for e in index["keys"]]
+        n = sum(seg[1] for e in index["keys"] for seg in e["segments"])
+        times_file, values_file = _column_files(index)
+        self._times = self._open(times_file, 'int64', n)
+        self._values = self._open(values_file, 'float64', n) if self.has_values else None
+
+    def __reduce__(self):
+        return (EventStore, (self.path,)) #pickle by path (e.g. to batch render workers) instead of copying the mapped columns
+
+    def _open(self, name, dtype, n):
+        if n == 0:
+            return numpy.zeros(0, dtype=dtype)
+        return numpy.memmap(os.path.join(self.path, name), dtype=dtype, mode='r', shape=(n,))
+
+    def keys(self):
+        return list(self._keys)
+
+    def __contains__(self, key):
+        return key in self._segments
+
+    def window(self, key, start, end):
+        """the points of key within [start, end] (both inclusive, DateTimes, datetime64s or epoch ns). returns (times, values or None)"""
+        return self._window_arrays(key, aggregation._date_to_ns(start), aggregation._date_to_ns(end))
+
+    def to_keyed_series(self, start, end, keys = None):
+        """loads [start, end] of the given keys (default all) into memory as a KeyedSeries"""
+        keys = self.keys() if keys is None else keys
+        windows = [self.window(k, start, end) for k in keys]
+        offsets = numpy.zeros(len(keys) + 1, dtype='int64')
+        offsets[1:] = numpy.cumsum([len(w[0]) for w in windows])
+        times = numpy.concatenate([numpy.asarray(w[0]) for w in windows]) if keys else numpy.zeros(0, dtype='int64')
+        values = numpy.concatenate([numpy.asarray(w[1]) for w in windows]) if keys and self.has_values else None
+        return KeyedSeries(keys, offsets, times, values)
+
+    #aggregation, called by plot_event_frequency and state_diagram through the aggregation module
+
+    def _has_data(self, key):
+        return len(self._segments.get(key, [])) > 0
+
+    def _window_arrays(self, key, start_ns, end_ns):
+        parts = []
+        for offset, length, min_ns, max_ns in self._segments.get(key, []):
+            if max_ns < start_ns or min_ns > end_ns:
+                continue
+            times = self._times[offset:offset + length]
+            w = aggregation._window_slice(times, start_ns, end_ns)
+            values = self._values[offset:offset + length][w] if self.has_values else None
+            parts.append((times[w], values, min_ns, max_ns))
+        if len(parts) == 1:
+            return parts[0][0], parts[0][1] #memmap views, nothing copied
+        if not parts:
+            return numpy.zeros(0, dtype='int64'), numpy.zeros(0, dtype='float64') if self.has_values else None
+        times = numpy.concatenate([p[0] for p in parts])
+        values = numpy.concatenate([p[1] for p in parts]) if self.has_values else None
+        if any(parts[i][2] < parts[i-1][3] for i in range(1, len(parts))): #appended segments overlap in time
+            order = numpy.lexsort((values, times)) if self.has_values else numpy.argsort(times, kind='mergesort')
+            times = times[order]
+            values = values[order] if self.has_values else None
+        return times, values
+
+    def _window_labels(self, key, start_ns, end_ns):
+        return None #stores hold no event_ts annotations
+
+    def event_frequency_counts(self, minor_granularity, start_dates, end_dates):
+        """same result as aggregation.event_frequency_counts"""
+        return aggregation._array_event_frequency_counts(self, minor_granularity, start_dates, end_dates)
+
+    def state_transitions(self, minor_granularity, start_dates, end_dates):
+        """same result as aggregation.state_transitions"""
+        return aggregation._array_state_transitions(self, minor_granularity, start_dates, end_dates)
+
+    def annotation_events(self, start_dates, end_dates):
+        """same result as aggregation.annotation_events"""
+        return aggregation._array_annotation_events(self, start_dates, end_dates)
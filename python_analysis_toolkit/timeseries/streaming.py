@@ -0,0 +1,259 @@
+import csv
+import numpy
+from collections import OrderedDict
+
+from python_analysis_toolkit.conversion import datetimes
+from python_analysis_toolkit.timeseries import aggregation
+
+"""
+Chunked, bounded memory input for plot_event_frequency and state_diagram.
+Instead of a ts_dict of lists, pass a ChunkedEvents / ChunkedStates that wraps one iterator per key;
+the events are folded into the requested minor_granularity buckets one chunk at a time, and the histories are never held in memory.
+"""
+
+"""
+Internal Helper Functions
+"""
+
+_compact_every = 64 #number of partial results to collect before merging them
+
+
+def _iter_chunks(source, chunk_size):
+    """
+        turns a source into an iterator of int64 epoch ns arrays. the source may yield chunks (numpy arrays or lists of timestamps)
+        or single timestamps, which are batched into chunks of chunk_size
+    """
+    pending = []
+    for item in source:
+        if isinstance(item, (numpy.ndarray, list)):
+            if len(item) > 0:
+                yield aggregation._to_epoch_ns(item)
+        else:
+            pending.append(item)
+            if len(pending) >= chunk_size:
+                yield aggregation._to_epoch_ns(pending)
+                pending = []
+    if pending:
+        yield aggregation._to_epoch_ns(pending)
+
+def _iter_pair_chunks(source, chunk_size):
+    """
+        same as _iter_chunks for (time, value) sources: the source may yield (times, values) tuples of arrays/lists
+        or single (time, value) tuples. yields (epoch ns int64 array, values array)
+    """
+    pending = []
+    for item in source:
+        if isinstance(item[0], (numpy.ndarray, list)):
+            if len(item[0]) > 0:
+                yield aggregation._to_epoch_ns(item[0]), numpy.asarray(item[1])
+        else:
+            pending.append(item)
+            if len(pending) >= chunk_size:
+                yield aggregation._to_epoch_ns([p[0] for p in pending]), numpy.asarray([p[1] for p in pending])
+                pending = []
+    if pending:
+        yield aggregation._to_epoch_ns([p[0] for p in pending]), numpy.asarray([p[1] for p in pending])
+
+def _merge_sparse_counts(parts):
+    """merges a list of (sorted unique bucket numbers, counts) into one"""
+    buckets = numpy.concatenate([p[0] for p in parts])
+    counts = numpy.concatenate([p[1] for p in parts])
+    merged, inverse = numpy.unique(buckets, return_inverse=True)
+    return merged, numpy.bincount(inverse, weights=counts, minlength=len(merged)).astype('int64')
+
+def _dense_counts(sparse, unit):
+    """sparse (bucket numbers, counts) to the (bucket_starts, counts) format of aggregation.event_frequency_counts, empty buckets included"""
+    buckets, counts = sparse
+    if len(buckets) == 0:
+        return numpy.zeros(0, dtype='datetime64[ns]'), numpy.zeros(0, dtype='int64')
+    dense = numpy.zeros(buckets[-1] - buckets[0] + 1, dtype='int64')
+    dense[buckets - buckets[0]] = counts
+    return aggregation._unit_to_datetime64(numpy.arange(buckets[0], buckets[-1] + 1, dtype='int64'), unit), dense
+
+
+class _ChunkedSource(object):
+    """shared bookkeeping: the wrapped iterators can only be read once"""
+    def __init__(self, sources, chunk_size):
+        self.sources = sources
+        self.chunk_size = chunk_size
+        self.outside_window_counts = OrderedDict()
+        self._consumed = False
+
+    def keys(self):
+        return self.sources.keys()
+
+    def _consume(self):
+        if self._consumed:
+            raise Exception("Chunked sources can only be aggregated once; wrap fresh iterators to plot again")
+        self._consumed = True
+
+
+"""
+Public Functions
+"""
+
+def read_csv_chunks(path, time_column = 0, value_column = None, chunk_size = 100000, delimiter = ',', skip_header = False):
+    """
+        Reads '%Y-%m-%d %H:%M:%S' timestamps from a CSV file chunk_size rows at a time, parsing each chunk with the vectorized parser.
+        Use it as a source for ChunkedEvents (value_column = None) or ChunkedStates (value_column given).
+
+        Args:
+            path (string): the CSV file
+            time_column (int): index of the timestamp column
+            value_column (int): index of the value column (parsed as float), or None for timestamps only
+            chunk_size (int): rows per chunk
+            delimiter (string): the CSV delimiter
+            skip_header (boolean): skip the first row
+
+        Yields:
+            int64 epoch ns arrays, or (int64 epoch ns array, float64 values array) tuples if value_column is given
+    """
+    def parse(rows):
+        ns = datetimes.ymdhms_array_to_epoch_ns([r[time_column] for r in rows])
+        return ns if value_column is None else (ns, numpy.array([float(r[value_column]) for r in rows]))
+
+    with open(path) as f:
+        reader = csv.reader(f, delimiter = delimiter)
+        if skip_header:
+            next(reader, None)
+        rows = []
+        for row in reader:
+            if not row:
+                continue
+            rows.append(row)
+            if len(rows) >= chunk_size:
+                yield parse(rows)
+                rows = []
+        if rows:
+            yield parse(rows)
+
+
+class ChunkedEvents(_ChunkedSource):
+    """
+        plot_event_frequency input that reads each key's events from an iterator instead of a list.
+
+        Args:
+            sources: dictionary where the keys are the keys to plot and the values are iterables (generators, read_csv_chunks(...), ...)
+                     yielding either single DateTimes/datetime64s or chunks of them (numpy arrays or lists). The events do not need to be sorted.
+            chunk_size (int): single timestamps are batched into chunks of this many before they are bucketed
+
+        After aggregation, outside_window_counts holds the number of events per key that fell outside every window.
+        The iterators are read once, so an instance can be plotted once.
+    """
+    def __init__(self, sources, chunk_size = 100000):
+        super(ChunkedEvents, self).__init__(sources, chunk_size)
+
+    def event_frequency_counts(self, minor_granularity, start_dates, end_dates):
+        """same result as aggregation.event_frequency_counts; memory is bounded by the number of non-empty buckets, not by the number of events"""
+        self._consume()
+        unit = aggregation._granularity_unit(minor_granularity)
+        windows = aggregation._windows_ns(start_dates, end_dates)
+        counts = OrderedDict()
+        for k in self.sources.keys():
+            parts = [[] for w in windows]
+            seen = 0
+            outside = 0
+            for ns in _iter_chunks(self.sources[k], self.chunk_size):
+                seen += len(ns)
+                in_any = numpy.zeros(len(ns), dtype=bool)
+                for windex, (s, e) in enumerate(windows):
+                    in_window = (ns >= s) & (ns <= e)
+                    in_any |= in_window
+                    if in_window.any():
+                        buckets, bucket_counts = numpy.unique(aggregation._floor_to_unit(ns[in_window], unit), return_counts=True)
+                        parts[windex].append((buckets, bucket_counts))
+                        if len(parts[windex]) >= _compact_every:
+                            parts[windex] = [_merge_sparse_counts(parts[windex])]
+                outside += len(ns) - int(in_any.sum())
+            self.outside_window_counts[k] = outside
+            if seen == 0:
+                counts[k] = None
+                continue
+            counts[k] = [_dense_counts(_merge_sparse_counts(p), unit) if p else aggregation._bucket_counts(numpy.zeros(0, dtype='int64'), unit) for p in parts]
+        return counts
+
+
+class ChunkedStates(_ChunkedSource):
+    """
+        state_diagram input that reads each key's state series (and optionally its annotation events) from iterators.
+
+        Args:
+            sources: dictionary where the keys are the keys to plot and the values are iterables yielding (DateTime, float) tuples
+                     or (times, values) chunks. Each source must be in time order, since only the change points are kept as it is read.
+            event_sources: optional dictionary of the same shape for the "event_ts" annotations, (DateTime, label) tuples or (times, labels) chunks.
+                           these are plotted one by one, so only the ones inside a window are kept.
+            chunk_size (int): single tuples are batched into chunks of this many
+
+        After aggregation, outside_window_counts holds the number of state points per key that fell outside every window.
+        The iterators are read once, so an instance can be plotted once.
+    """
+    def __init__(self, sources, event_sources = None, chunk_size = 100000):
+        super(ChunkedStates, self).__init__(sources, chunk_size)
+        self.event_sources = event_sources
+
+    def state_transitions(self, minor_granularity, start_dates, end_dates):
+        """same result as aggregation.state_transitions; memory is bounded by the number of state changes"""
+        self._consume()
+        unit = aggregation._granularity_unit(minor_granularity)
+        windows = aggregation._windows_ns(start_dates, end_dates)
+        transitions = OrderedDict()
+        for k in self.sources.keys():
+            parts = [[] for w in windows]
+            seen = 0
+            outside = 0
+            last = None
+            for ns, values in _iter_pair_chunks(self.sources[k], self.chunk_size):
+                if (last is not None and ns[0] < last) or (numpy.diff(ns) < 0).any():
+                    raise Exception("The state series for key {0} is not in time order".format(k))
+                last = ns[-1]
+                seen += len(ns)
+                in_any = numpy.zeros(len(ns), dtype=bool)
+                for windex, (s, e) in enumerate(windows):
+                    w = aggregation._window_slice(ns, s, e)
+                    in_any[w] = True
+                    if w.stop > w.start:
+                        #reducing each chunk on its own and then the reduced chunks together gives the same change points as reducing everything at once
+                        change_times, change_values = aggregation._state_steps(ns[w], values[w], unit)
+                        parts[windex].append((change_times.view('int64'), change_values))
+                        if len(parts[windex]) >= _compact_every:
+                            parts[windex] = [self._reduce(parts[windex], unit)]
+                outside += len(ns) - int(in_any.sum())
+            self.outside_window_counts[k] = outside
+            if seen == 0:
+                transitions[k] = None
+                continue
+            transitions[k] = []
+            for p in parts:
+                ns, values = self._reduce(p, unit) if p else (numpy.zeros(0, dtype='int64'), numpy.zeros(0, dtype='float64'))
+                transitions[k].append((ns.view('datetime64[ns]'), values))
+        return transitions
+
+    @staticmethod
+    def _reduce(parts, unit):
+        change_times, values = aggregation._state_steps(numpy.concatenate([p[0] for p in parts]), numpy.concatenate([p[1] for p in parts]), unit)
+        return change_times.view('int64'), values
+
+    def annotation_events(self, start_dates, end_dates):
+        """same result as aggregation.annotation_events, keeping only the events inside a window"""
+        windows = aggregation._windows_ns(start_dates, end_dates)
+        events = OrderedDict()
+        for k in self.sources.keys():
+            if self.event_sources is None or k not in self.event_sources:
+                events[k] = None
+                continue
+            parts = [[] for w in windows]
+            for ns, labels in _iter_pair_chunks(self.event_sources[k], self.chunk_size):
+                for windex, (s, e) in enumerate(windows):
+                    in_window = (ns >= s) & (ns <= e)
+                    if in_window.any():
+                        parts[windex].append((ns[in_window], labels[in_window]))
+            events[k] = []
+            for p in parts:
+                if not p:
+                    events[k].append((numpy.zeros(0, dtype='datetime64[ns]'), numpy.zeros(0, dtype=object)))
+                    continue
+                ns = numpy.concatenate([x[0] for x in p])
+                labels = numpy.concatenate([x[1] for x in p])
+                order = numpy.argsort(ns, kind='mergesort')
+                events[k].append((ns[order].view('datetime64[ns]'), labels[order]))
+        return events